@@ -0,0 +1,15 @@
+from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.models import User
+
+from zamreach.admin import SerializedAdminMixin
+
+
+class SerializedUserAdmin(SerializedAdminMixin, UserAdmin):
+    def user_change_password(self, request, *args, **kwargs):
+        return self._serialized(super().user_change_password, request, *args, **kwargs)
+
+
+# django.contrib.auth is installed before api, so its admin is already registered
+admin.site.unregister(User)
+admin.site.register(User, SerializedUserAdmin)
@@ -0,0 +1,150 @@
+"""
+Incrementally maintained dashboard counters.
+
+Model signals (see api.signals) adjust StatCounter rows inside the writing
+transaction, so dashboards read a handful of precomputed rows instead of
+running COUNT queries. rebuild() recomputes everything from the source tables
+and backs the reconcile_counters command.
+
+Counters bumped on every request (SHARDS) spread their writes over several
+rows, keyed '#0', '#1', ..., so concurrent writers rarely wait on the same
+row lock; snapshot() adds the shards back together.
+"""
+import random
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from zamreach.db import serialized_write
+
+from .models import Business, MapView, Promotion, StatCounter
+
+ALL_TIME = StatCounter.ALL_TIME
+
+# Counter names
+USERS = 'users'
+USERS_JOINED = 'users.joined'
+USERS_ACTIVE = 'users.active'
+BUSINESSES = 'businesses'
+BUSINESSES_CREATED = 'businesses.created'
+BUSINESSES_BY_CATEGORY = 'businesses.by_category'
+PROMOTIONS = 'promotions'
+PROMOTIONS_CREATED = 'promotions.created'
+MAP_VIEWS = 'map_views'
+# Markers for api.rollup: touched when a day's inputs change, or (FROM) the
+# inputs of that day and every later one
+ROLLUP_DIRTY = 'rollup.dirty'
+ROLLUP_DIRTY_FROM = 'rollup.dirty_from'
+
+# Distinct daily logins cannot be recomputed from last_login alone, and the
+# rollup markers are not derived from source rows, so rebuild() leaves these
+# untouched.
+NOT_REBUILDABLE = {USERS_ACTIVE, ROLLUP_DIRTY, ROLLUP_DIRTY_FROM}
+
+# Counter -> number of rows its unkeyed buckets are spread over
+SHARDS = {MAP_VIEWS: 8}
+SHARD_PREFIX = '#'
+
+
+def local_day(value):
+    """Bucket date for a datetime (or date) in the current time zone"""
+    if hasattr(value, 'tzinfo'):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    return value
+
+
+def increment(name, delta=1, day=None, key=''):
+    """Add delta to a counter bucket, creating the row on first use"""
+    if not delta:
+        return
+    day = ALL_TIME if day is None else day
+    if not key and name in SHARDS:
+        key = f'{SHARD_PREFIX}{random.randrange(SHARDS[name])}'
+    rows = StatCounter.objects.filter(name=name, day=day, key=key)
+    if rows.update(value=F('value') + delta, updated_at=timezone.now()):
+        return
+    try:
+        with transaction.atomic():
+            StatCounter.objects.create(name=name, day=day, key=key, value=delta)
+    except IntegrityError:
+        # Another writer created the row first
+        rows.update(value=F('value') + delta, updated_at=timezone.now())
+
+
+def snapshot(since):
+    """Read all totals and every per-day bucket from `since` in one query.
+
+    Returns {name: {'total': n, 'days': {date: n}, 'keys': {key: n}}}.
+    """
+    data = defaultdict(lambda: {'total': 0, 'days': defaultdict(int), 'keys': {}})
+    rows = StatCounter.objects.filter(Q(day=ALL_TIME) | Q(day__gte=since))
+    for name, day, key, value in rows.values_list('name', 'day', 'key', 'value'):
+        entry = data[name]
+        unkeyed = not key or key.startswith(SHARD_PREFIX)
+        if day == ALL_TIME:
+            if unkeyed:
+                entry['total'] += value
+            else:
+                entry['keys'][key] = value
+        elif unkeyed:
+            entry['days'][day] += value
+    return data
+
+
+def day_total(counters, name, start, end=None):
+    """Sum a snapshot's per-day buckets for start..end (inclusive)"""
+    days = counters[name]['days']
+    return sum(value for day, value in days.items() if day >= start and (end is None or day <= end))
+
+
+def _grouped_by_day(queryset, field):
+    return (
+        queryset.order_by()
+        .annotate(bucket=TruncDate(field))
+        .values('bucket')
+        .annotate(n=Count('id'))
+        .values_list('bucket', 'n')
+    )
+
+
+@serialized_write
+def rebuild():
+    """Recompute every rebuildable counter from the source tables"""
+    rows = []
+
+    def add(name, value, day=ALL_TIME, key=''):
+        if value:
+            rows.append(StatCounter(name=name, day=day, key=key, value=value))
+
+    add(USERS, User.objects.count())
+    for day, n in _grouped_by_day(User.objects.all(), 'date_joined'):
+        add(USERS_JOINED, n, day)
+
+    add(BUSINESSES, Business.objects.count())
+    for day, n in _grouped_by_day(Business.objects.all(), 'created_at'):
+        add(BUSINESSES_CREATED, n, day)
+    categories = Business.objects.order_by().values_list('category').annotate(n=Count('id'))
+    for category, n in categories:
+        add(BUSINESSES_BY_CATEGORY, n, key=category)
+
+    add(PROMOTIONS, Promotion.objects.count())
+    for day, n in _grouped_by_day(Promotion.objects.all(), 'created_at'):
+        add(PROMOTIONS_CREATED, n, day)
+
+    # Views moved to the archive still count
+    from . import retention
+
+    views = retention.archived_counts('mapviews')
+    for day, n in _grouped_by_day(MapView.objects.all(), 'viewed_at'):
+        views[day] = views.get(day, 0) + n
+    add(MAP_VIEWS, sum(views.values()))
+    for day, n in views.items():
+        add(MAP_VIEWS, n, day)
+
+    StatCounter.objects.exclude(name__in=NOT_REBUILDABLE).delete()
+    StatCounter.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
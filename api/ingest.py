@@ -0,0 +1,298 @@
+"""
+Buffered, batched ingestion for MapView events.
+
+Accepted events are appended to a per-worker spool file before the request
+returns, then written in one batch when the spool reaches MAPVIEW_FLUSH_SIZE
+events or its oldest event is MAPVIEW_FLUSH_INTERVAL seconds old. A timer
+thread enforces the interval even when no further events arrive. A spool is
+renamed before it is processed and deleted only after its rows commit, so a
+worker that dies mid-way leaves a file that recover() (run by the next flush,
+and by the flush_mapviews command) picks up again. Delivery is therefore
+at-least-once; duplicates are dropped on (user, business, viewed_at).
+
+Settings:
+    MAPVIEW_SPOOL_DIR       spool directory (default BASE_DIR/var/spool)
+    MAPVIEW_FLUSH_SIZE      events per batch (default 500)
+    MAPVIEW_FLUSH_INTERVAL  max seconds an event waits in the spool (default 5)
+    MAPVIEW_SPOOL_FSYNC     fsync every append, to survive host crashes (default False)
+"""
+import atexit
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections, router
+from django.utils.dateparse import parse_datetime
+
+from zamreach.db import run_serialized
+
+from . import counters
+from .models import Business, MapView
+
+logger = logging.getLogger(__name__)
+
+SPOOL_SUFFIX = '.jsonl'
+BATCH_SUFFIX = '.batch'
+CLAIMED_SUFFIX = '.claimed'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def store_events(events):
+    """Insert events not already stored; returns the number of new rows"""
+    unique = {}
+    for event in events:
+        viewed_at = parse_datetime(event['viewed_at'])
+        if viewed_at is None:
+            logger.warning('Dropping map view with bad timestamp: %r', event)
+            continue
+        key = (event['user_id'], event['business_id'], viewed_at)
+        unique.setdefault(key, event.get('duration', 0))
+    if not unique:
+        return 0
+
+    return run_serialized(_insert_new, unique)
+
+
+def _insert_new(unique):
+    user_ids = {key[0] for key in unique}
+    business_ids = {key[1] for key in unique}
+    times = [key[2] for key in unique]
+
+    existing = set(
+        MapView.objects.filter(
+            user_id__in=user_ids,
+            business_id__in=business_ids,
+            viewed_at__range=(min(times), max(times)),
+        ).values_list('user_id', 'business_id', 'viewed_at')
+    )
+    # Rows may have been deleted since the event was accepted
+    live_users = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+    live_businesses = set(Business.objects.filter(id__in=business_ids).values_list('id', flat=True))
+
+    rows = [
+        MapView(user_id=user_id, business_id=business_id, viewed_at=viewed_at, duration=duration)
+        for (user_id, business_id, viewed_at), duration in unique.items()
+        if (user_id, business_id, viewed_at) not in existing
+        and user_id in live_users and business_id in live_businesses
+    ]
+    inserted = _insert_ignoring_conflicts(rows)
+
+    # Bulk inserts skip post_save, so keep the dashboard counters here, for
+    # the rows actually written
+    counters.increment(counters.MAP_VIEWS, len(inserted))
+    per_day = Counter(counters.local_day(viewed_at) for viewed_at in inserted)
+    for day, n in per_day.items():
+        counters.increment(counters.MAP_VIEWS, n, day=day)
+    return len(inserted)
+
+
+def _insert_ignoring_conflicts(rows, batch_size=500):
+    """Insert rows, skipping ones that hit the unique key; returns the viewed_at of each row written.
+
+    A concurrent flush of the same events can commit between the existing
+    check and the insert, so conflicts are skipped in the database and the
+    rows really written are read back with RETURNING.
+    """
+    if not rows:
+        return []
+    connection = connections[router.db_for_write(MapView)]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        # No RETURNING with ON CONFLICT here; the existing check must do
+        MapView.objects.bulk_create(rows, batch_size=batch_size, ignore_conflicts=True)
+        return [row.viewed_at for row in rows]
+
+    table = MapView._meta.db_table
+    inserted_ids = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            values = ', '.join(['(%s, %s, %s, %s)'] * len(batch))
+            params = []
+            for row in batch:
+                params += [row.user_id, row.business_id,
+                           connection.ops.adapt_datetimefield_value(row.viewed_at), row.duration]
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, business_id, viewed_at, duration) VALUES {values} '
+                f'ON CONFLICT DO NOTHING RETURNING id',
+                params,
+            )
+            inserted_ids += [pk for (pk,) in cursor.fetchall()]
+    return list(MapView.objects.filter(pk__in=inserted_ids).values_list('viewed_at', flat=True))
+
+
+def process_file(path):
+    """Claim a spool or batch file, store its events and delete it.
+
+    Returns the number of new rows, or None if another process claimed it.
+    """
+    path = Path(path)
+    claimed = path.with_name(f'{path.name}.{os.getpid()}{CLAIMED_SUFFIX}')
+    if not path.name.endswith(CLAIMED_SUFFIX):
+        try:
+            os.replace(path, claimed)
+        except FileNotFoundError:
+            return None
+    else:
+        claimed = path
+
+    events = []
+    with open(claimed, encoding='utf-8') as spool:
+        for line in spool:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                # A torn final line from a killed worker
+                logger.warning('Skipping malformed map view line in %s', claimed.name)
+
+    stored = store_events(events)
+    claimed.unlink()
+    return stored
+
+
+class MapViewBuffer:
+    """Per-process spool of map view events, flushed in batches"""
+
+    def __init__(self, spool_dir=None, flush_size=None, flush_interval=None):
+        self.spool_dir = Path(spool_dir or _setting('MAPVIEW_SPOOL_DIR', Path(settings.BASE_DIR) / 'var' / 'spool'))
+        self.flush_size = flush_size or _setting('MAPVIEW_FLUSH_SIZE', 500)
+        self.flush_interval = flush_interval or _setting('MAPVIEW_FLUSH_INTERVAL', 5)
+        self.host = socket.gethostname()
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.pending = 0
+        self.oldest = None
+        self.recovered = False
+        # Timer threads do not survive a fork
+        self.timer = None
+
+    @property
+    def spool_path(self):
+        return self.spool_dir / f'mapviews.{self.host}.{self.pid}{SPOOL_SUFFIX}'
+
+    def add(self, events):
+        """Durably append events; flushes the spool when a threshold is hit"""
+        lines = ''.join(json.dumps(event, separators=(',', ':')) + '\n' for event in events)
+        with self.lock:
+            if self.pid != os.getpid():
+                # Forked worker: start a spool of our own
+                self._reset()
+            self.spool_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.spool_path, 'a', encoding='utf-8') as spool:
+                spool.write(lines)
+                spool.flush()
+                if _setting('MAPVIEW_SPOOL_FSYNC', False):
+                    os.fsync(spool.fileno())
+            self.pending += len(events)
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            due = (
+                self.pending >= self.flush_size
+                or time.monotonic() - self.oldest >= self.flush_interval
+            )
+            batch = self._rotate() if due else None
+            if not due and self.timer is None:
+                wait = self.flush_interval - (time.monotonic() - self.oldest)
+                self.timer = threading.Timer(max(wait, 0), self._timed_flush)
+                self.timer.daemon = True
+                self.timer.start()
+            recover = not self.recovered
+            self.recovered = True
+
+        if recover:
+            self.recover()
+        if batch:
+            self._process(batch)
+
+    def _rotate(self):
+        """Move the live spool aside as a batch file (lock held)"""
+        self.pending = 0
+        self.oldest = None
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.spool_path.exists():
+            return None
+        batch = self.spool_path.with_name(f'{self.spool_path.name}.{time.time_ns()}{BATCH_SUFFIX}')
+        os.replace(self.spool_path, batch)
+        return batch
+
+    def _process(self, path):
+        try:
+            return process_file(path) or 0
+        except Exception:
+            # The claimed file stays on disk and is retried by recover()
+            logger.exception('Map view flush failed for %s', path.name)
+            return 0
+
+    def _timed_flush(self):
+        try:
+            self.flush()
+        finally:
+            # This thread's own database connection
+            connections.close_all()
+
+    def flush(self):
+        """Write everything buffered by this process now"""
+        with self.lock:
+            batch = self._rotate() if self.pid == os.getpid() else None
+        return self._process(batch) if batch else 0
+
+    def recover(self, stale_after=None):
+        """Process files left behind by dead or stalled workers"""
+        if stale_after is None:
+            stale_after = max(self.flush_interval * 10, 60)
+        if not self.spool_dir.exists():
+            return 0
+        stored = 0
+        now = time.time()
+        own = self.spool_path.name
+        for path in sorted(self.spool_dir.glob('mapviews.*')):
+            name = path.name
+            try:
+                age = now - path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if name.endswith(BATCH_SUFFIX):
+                take = True
+            elif name.endswith(CLAIMED_SUFFIX):
+                take = age >= stale_after
+            elif name.endswith(SPOOL_SUFFIX) and name != own:
+                prefix, pid = path.stem.rsplit('.', 1)
+                host = prefix[len('mapviews.'):]
+                dead = host == self.host and pid.isdigit() and not _pid_alive(int(pid))
+                take = dead or age >= stale_after
+            else:
+                take = False
+            if take:
+                stored += self._process(path)
+        return stored
+
+
+buffer = MapViewBuffer()
+atexit.register(buffer.flush)
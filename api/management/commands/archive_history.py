@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from api import retention
+
+
+class Command(BaseCommand):
+    help = 'Move old MapView and Activity rows from the hot tables into compressed daily archives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--policy', action='append', choices=list(retention.POLICIES),
+                            help='Archive only this history (repeatable; default: all)')
+        parser.add_argument('--before', help='Archive rows before this day (YYYY-MM-DD) instead of the policy cutoff')
+        parser.add_argument('--batch-size', type=int, default=retention.BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would be archived')
+
+    def handle(self, *args, **options):
+        before = None
+        if options['before']:
+            day = parse_date(options['before'])
+            if day is None:
+                raise CommandError(f'Invalid date: {options["before"]}')
+            before = retention.day_start(day)
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        archived = retention.archive_all(
+            options['policy'],
+            before=before,
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        for name, count in archived.items():
+            self.stdout.write(self.style.SUCCESS(f'{verb} {count} {name} row(s)'))
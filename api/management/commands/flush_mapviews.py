@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api import ingest
+
+
+class Command(BaseCommand):
+    help = 'Store map view events left in spool files by stopped or stalled workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stale-after', type=int, default=None,
+            help='Seconds before another worker\'s live spool is considered abandoned',
+        )
+
+    def handle(self, *args, **options):
+        stored = ingest.buffer.flush()
+        stored += ingest.buffer.recover(stale_after=options['stale_after'])
+        self.stdout.write(self.style.SUCCESS(f'Stored {stored} map views'))
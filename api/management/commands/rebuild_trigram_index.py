@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api import trigram
+
+
+class Command(BaseCommand):
+    help = 'Refill the trigram side table used for business and promotion search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', action='append', choices=list(trigram.DOCUMENTS),
+                            help='Only this document kind (repeatable)')
+
+    def handle(self, *args, **options):
+        if trigram.uses_pg_trgm():
+            self.stdout.write('Postgres searches the pg_trgm indexes directly; nothing to rebuild')
+            return
+        for kind, count in trigram.rebuild(options['kind']).items():
+            self.stdout.write(self.style.SUCCESS(f'Indexed {count} {kind} documents'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api import counters
+
+
+class Command(BaseCommand):
+    help = 'Rebuild dashboard counters from the source tables (daily active users are kept as-is)'
+
+    def handle(self, *args, **options):
+        rows = counters.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} counter rows'))
@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from api import rollup
+
+
+class Command(BaseCommand):
+    help = 'Compute daily Analytics rollups (by default only for days whose inputs changed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Roll up a single day (YYYY-MM-DD)')
+        parser.add_argument('--start', help='First day of the range (default: yesterday)')
+        parser.add_argument('--end', help='Last day of the range (default: today)')
+        parser.add_argument('--workers', type=int, default=1, help='Parallel workers for backfills')
+        parser.add_argument('--chunk-days', type=int, default=31, help='Days per unit of work')
+        parser.add_argument('--force', action='store_true', help='Recompute every day, not just dirty ones')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options['date']:
+            start = end = self._date(options['date'])
+        else:
+            start = self._date(options['start']) if options['start'] else today - timedelta(days=1)
+            end = self._date(options['end']) if options['end'] else today
+        if end < start:
+            raise CommandError('--end must not be before --start')
+
+        written = rollup.backfill(
+            start, end,
+            workers=options['workers'],
+            chunk_days=options['chunk_days'],
+            only_dirty=not options['force'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {written} day(s) between {start} and {end}'))
+
+    def _date(self, value):
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid date: {value}')
+        return day
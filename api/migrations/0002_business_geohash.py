@@ -0,0 +1,66 @@
+# Generated by Django 6.0 on 2026-10-18 10:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode(lat, lng, precision=12):
+    """Geohash of a coordinate; a frozen copy of api.utils.geo.encode"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def fill_geohash(apps, schema_editor):
+    Business = apps.get_model('api', 'Business')
+    batch = []
+    for business in Business.objects.only('id', 'latitude', 'longitude').iterator(chunk_size=2000):
+        business.geohash = encode(business.latitude, business.longitude)
+        batch.append(business)
+        if len(batch) >= 2000:
+            Business.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    if batch:
+        Business.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='business',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.AddIndex(
+            model_name='business',
+            index=models.Index(fields=['latitude', 'longitude'], name='business_latlng_idx'),
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+    ]
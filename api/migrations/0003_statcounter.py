@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-18 10:42
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_business_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('day', models.DateField(default=datetime.date(1, 1, 1))),
+                ('key', models.CharField(blank=True, default='', max_length=100)),
+                ('value', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'name'], name='statcounter_day_idx')],
+                'unique_together': {('name', 'day', 'key')},
+            },
+        ),
+    ]
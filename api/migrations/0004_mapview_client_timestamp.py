@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-18 10:43
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_statcounter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mapview',
+            name='viewed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 10:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_mapview_client_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analytics',
+            name='computed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
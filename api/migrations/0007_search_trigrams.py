@@ -0,0 +1,80 @@
+# Generated by Django 6.0 on 2026-10-18 11:33
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+# (table, column) searched by api.trigram
+TRIGRAM_COLUMNS = [
+    ('api_business', 'name'),
+    ('api_business', 'category'),
+    ('api_business', 'address'),
+    ('api_promotion', 'title'),
+    ('api_promotion', 'description'),
+]
+DOCUMENTS = {
+    'business': ('Business', ['name', 'category', 'address']),
+    'promotion': ('Promotion', ['title', 'description', 'business__name', 'business__category']),
+}
+
+
+def trigrams(text):
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+    grams = set()
+    for word in re.findall(r'[^\W_]+', text):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def create_trigram_index(apps, schema_editor):
+    """pg_trgm GIN indexes on Postgres, the side table filled elsewhere"""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table, column in TRIGRAM_COLUMNS:
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm ON {table} USING GIN ({column} gin_trgm_ops)'
+            )
+        return
+    SearchTrigram = apps.get_model('api', 'SearchTrigram')
+    for kind, (model_name, fields) in DOCUMENTS.items():
+        rows = apps.get_model('api', model_name).objects.values_list('pk', *fields)
+        SearchTrigram.objects.bulk_create([
+            SearchTrigram(kind=kind, object_id=row[0], trigram=gram)
+            for row in rows
+            for gram in trigrams(' '.join(value or '' for value in row[1:]))
+        ], batch_size=5000)
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('ANALYZE api_searchtrigram')
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for table, column in TRIGRAM_COLUMNS:
+            schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('trigram', models.CharField(max_length=3)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'trigram', 'object_id'], name='searchtrigram_lookup_idx')],
+                'unique_together': {('kind', 'object_id', 'trigram')},
+            },
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
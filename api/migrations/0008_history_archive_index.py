@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-18 11:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_search_trigrams'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mapview',
+            index=models.Index(fields=['viewed_at'], name='mapview_viewed_idx'),
+        ),
+    ]
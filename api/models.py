@@ -1,17 +1,36 @@
-﻿from django.db import models
+﻿from datetime import date
+
+from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+from .utils import geo
 
 class Business(models.Model):
     name = models.CharField(max_length=200)
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
     latitude = models.FloatField()
     longitude = models.FloatField()
+    geohash = models.CharField(max_length=12, blank=True, editable=False, db_index=True)
     address = models.TextField()
     category = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='business_latlng_idx'),
+            # Keyset pagination (see api.pagination)
+            models.Index(fields=['created_at', 'id'], name='business_created_idx'),
+        ]
+    
     def __str__(self):
         return self.name
+    
+    def save(self, *args, **kwargs):
+        self.geohash = geo.encode(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
 
 class Customer(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -39,25 +58,85 @@ class Promotion(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Keyset pagination (see api.pagination)
+            models.Index(fields=['created_at', 'id'], name='promotion_created_idx'),
+            models.Index(fields=['end_date', 'id'], name='promotion_end_idx'),
+        ]
+    
     def __str__(self):
         return self.title
 
 class MapView(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     business = models.ForeignKey(Business, on_delete=models.CASCADE)
-    viewed_at = models.DateTimeField(auto_now_add=True)
+    # Set by the client when events are batched (see api.ingest), so a retried
+    # event carries the same timestamp and is dropped as a duplicate
+    viewed_at = models.DateTimeField(default=timezone.now)
     duration = models.IntegerField(help_text='View duration in seconds')
     
     class Meta:
         unique_together = ['user', 'business', 'viewed_at']
+        indexes = [
+            # Date windows for rollups and archival (see api.retention)
+            models.Index(fields=['viewed_at'], name='mapview_viewed_idx'),
+        ]
 
 class Analytics(models.Model):
+    ROLLUP_FIELDS = ['total_users', 'active_users', 'map_views', 'promotion_views', 'revenue']
+    
     date = models.DateField(unique=True)
     total_users = models.IntegerField()
     active_users = models.IntegerField()
     map_views = models.IntegerField()
     promotion_views = models.IntegerField()
     revenue = models.DecimalField(max_digits=12, decimal_places=2)
+    computed_at = models.DateTimeField(null=True, blank=True)  # Set by api.rollup
     
     def __str__(self):
         return f'Analytics for {self.date}'
+
+class StatCounter(models.Model):
+    """Precomputed dashboard counter, maintained by api.signals.
+    
+    Totals live in the ALL_TIME bucket; per-day buckets use the local date.
+    key holds the category for breakdowns (blank otherwise).
+    """
+    ALL_TIME = date.min
+    
+    name = models.CharField(max_length=100)
+    day = models.DateField(default=ALL_TIME)
+    key = models.CharField(max_length=100, blank=True, default='')
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['name', 'day', 'key']
+        indexes = [
+            models.Index(fields=['day', 'name'], name='statcounter_day_idx'),
+        ]
+    
+    def __str__(self):
+        bucket = 'all time' if self.day == self.ALL_TIME else self.day
+        return f'{self.name}[{self.key}] {bucket}: {self.value}'
+
+class SearchTrigram(models.Model):
+    """One trigram of a searchable document, maintained by api.trigram.
+
+    Only used where pg_trgm is not available; kind names the indexed model
+    ('business' or 'promotion').
+    """
+    kind = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    trigram = models.CharField(max_length=3)
+    
+    class Meta:
+        unique_together = ['kind', 'object_id', 'trigram']
+        indexes = [
+            # Matching looks trigrams up; ranking and reindexing go by object
+            models.Index(fields=['kind', 'trigram', 'object_id'], name='searchtrigram_lookup_idx'),
+        ]
+    
+    def __str__(self):
+        return f'{self.kind}:{self.object_id} {self.trigram!r}'
@@ -0,0 +1,259 @@
+"""
+Keyset (cursor) pagination for list endpoints.
+
+Pages are selected with a WHERE clause on the ordering columns, e.g.
+(created_at, id) < (last created_at, last id), instead of OFFSET, so the
+thousandth page costs the same index range scan as the first. The ordering
+must end in a unique column (id) so every row has exactly one position.
+
+Cursors are opaque url-safe tokens holding the boundary row's key values
+and the direction. Totals are opt-in (?count=1) and estimated: the planner's
+row estimate on Postgres, a capped COUNT elsewhere.
+
+paginate() works on any queryset; KeysetPagination plugs it into DRF views
+(set pagination_class, as GET api/businesses/ and api/promotions/ do, or
+call paginate_queryset from an action), and paginate_sequence() does the
+same for already sorted in-memory results such as distance-ordered geo
+hits. business_ads pages its promotion lists and activity feed with
+paginate(). Ordering columns may be annotations, such as the search_rank
+added by api.trigram, as well as model fields.
+"""
+import base64
+import bisect
+import json
+from dataclasses import dataclass, field
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+COUNT_CAP = 10000
+
+CREATED = ('-created_at', '-id')
+ENDING = ('end_date', 'id')
+RELEVANCE = ('-search_rank', '-id')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values, reverse=False):
+    payload = json.dumps({'k': values, 'r': int(reverse)}, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return (values, reverse) from a cursor token"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return list(data['k']), bool(data.get('r'))
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def _parse_ordering(ordering):
+    return [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+
+def _to_python(queryset, name, value):
+    try:
+        field = queryset.model._meta.get_field(name)
+    except FieldDoesNotExist:
+        # An annotation, such as a search rank
+        field = queryset.query.annotations[name].output_field
+    return field.to_python(value)
+
+
+def _boundary(queryset, keys, values, after):
+    """Q selecting rows strictly after (or before) the boundary values"""
+    if len(values) != len(keys):
+        raise InvalidCursor('Invalid cursor')
+    try:
+        values = [_to_python(queryset, name, value) for (name, _), value in zip(keys, values)]
+    except Exception:
+        raise InvalidCursor('Invalid cursor')
+
+    condition = Q()
+    for i in range(len(keys) - 1, -1, -1):
+        name, descending = keys[i]
+        lookup = 'lt' if descending == after else 'gt'
+        step = Q(**{f'{name}__{lookup}': values[i]})
+        condition = step if i == len(keys) - 1 else step | (Q(**{name: values[i]}) & condition)
+    return condition
+
+
+@dataclass
+class KeysetPage:
+    results: list
+    next_cursor: str = None
+    previous_cursor: str = None
+    count: dict = field(default=None)
+
+
+def _key_values(obj, keys):
+    if isinstance(obj, dict):
+        return [obj[name] for name, _ in keys]
+    return [getattr(obj, name) for name, _ in keys]
+
+
+def _serialise(values):
+    return [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+
+
+def cursor_after(row, ordering=CREATED):
+    """Cursor for the page following row, for pages served from elsewhere (e.g. a cache)"""
+    return encode_cursor(_serialise(_key_values(row, _parse_ordering(ordering))))
+
+
+def estimated_count(queryset):
+    """{'count': n, 'exact': bool}, without counting the whole table"""
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return {'count': int(plan[0]['Plan']['Plan Rows']), 'exact': False}
+    count = queryset.order_by().values('pk')[:COUNT_CAP + 1].count()
+    return {'count': min(count, COUNT_CAP), 'exact': count <= COUNT_CAP}
+
+
+def paginate(queryset, ordering=CREATED, cursor=None, page_size=DEFAULT_PAGE_SIZE, with_count=False):
+    """Return a KeysetPage of queryset ordered by ordering.
+
+    Raises InvalidCursor for malformed or mismatched cursors.
+    """
+    keys = _parse_ordering(ordering)
+    reverse = False
+    base = queryset
+    if cursor:
+        values, reverse = decode_cursor(cursor)
+        queryset = queryset.filter(_boundary(queryset, keys, values, after=not reverse))
+
+    if reverse:
+        flipped = [name if descending else f'-{name}' for name, descending in keys]
+        rows = list(queryset.order_by(*flipped)[:page_size + 1])
+        more = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+    else:
+        rows = list(queryset.order_by(*ordering)[:page_size + 1])
+        more = len(rows) > page_size
+        rows = rows[:page_size]
+
+    page = KeysetPage(results=rows)
+    if rows:
+        first, last = _serialise(_key_values(rows[0], keys)), _serialise(_key_values(rows[-1], keys))
+        if more or reverse:
+            page.next_cursor = encode_cursor(last)
+        if cursor and (more or not reverse):
+            page.previous_cursor = encode_cursor(first, reverse=True)
+    if with_count:
+        page.count = estimated_count(base)
+    return page
+
+
+def paginate_sequence(items, key, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """Keyset-paginate a list already sorted ascending by key(item)"""
+    keys = [key(item) for item in items]
+    start, end = 0, len(items)
+    reverse = False
+    if cursor:
+        values, reverse = decode_cursor(cursor)
+        boundary = tuple(values)
+        try:
+            if reverse:
+                end = bisect.bisect_left(keys, boundary)
+                start = max(end - page_size, 0)
+            else:
+                start = bisect.bisect_right(keys, boundary)
+        except TypeError:
+            raise InvalidCursor('Invalid cursor')
+    if not reverse:
+        end = min(start + page_size, len(items))
+
+    page = KeysetPage(results=items[start:end], count={'count': len(items), 'exact': True})
+    if end > start:
+        if end < len(items):
+            page.next_cursor = encode_cursor(list(keys[end - 1]))
+        if start > 0:
+            page.previous_cursor = encode_cursor(list(keys[start]), reverse=True)
+    return page
+
+
+class KeysetPagination(BasePagination):
+    """DRF pagination class backed by paginate()
+
+    Query params: ?cursor=, ?page_size= (up to max_page_size) and ?count=1.
+    Views may offer several orders as keyset_orderings = {name: ordering},
+    chosen with ?ordering=<name>; the first entry is the default. Querysets
+    ranked by a search (a search_rank annotation) default to relevance order.
+    """
+    ordering = CREATED
+    page_size = DEFAULT_PAGE_SIZE
+    max_page_size = MAX_PAGE_SIZE
+    cursor_query_param = 'cursor'
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get('page_size', self.page_size))
+        except ValueError:
+            size = self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_ordering(self, request, view, queryset=None):
+        orderings = dict(getattr(view, 'keyset_orderings', None) or {})
+        name = request.query_params.get('ordering')
+        if queryset is not None and 'search_rank' in queryset.query.annotations:
+            orderings = {'relevance': RELEVANCE, **orderings}
+        elif not orderings:
+            return self.ordering
+        if name is None:
+            return next(iter(orderings.values()))
+        if name not in orderings:
+            raise ValidationError({'ordering': f'Choose one of: {", ".join(orderings)}'})
+        return orderings[name]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            self.page = paginate(
+                queryset,
+                ordering=self.get_ordering(request, view, queryset),
+                cursor=request.query_params.get(self.cursor_query_param),
+                page_size=self.get_page_size(request),
+                with_count=request.query_params.get('count') in ('1', 'true'),
+            )
+        except InvalidCursor as e:
+            raise ValidationError({'cursor': str(e)})
+        return self.page.results
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(remove_query_param(url, 'count'), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        body = {
+            'results': data,
+            'next': self._link(self.page.next_cursor),
+            'previous': self._link(self.page.previous_cursor),
+        }
+        if self.page.count is not None:
+            body['count'] = self.page.count['count']
+            body['count_exact'] = self.page.count['exact']
+        return Response(body)
@@ -0,0 +1,299 @@
+"""
+Tiered retention for history tables that only grow.
+
+Each Policy names a model, the timestamp column that ages its rows and how
+many days they stay in the hot table (settings.RETENTION_DAYS). archive()
+moves older rows out in batches, oldest first: a batch is read in
+(timestamp, id) order on the timestamp index, appended to gzip JSONL files
+partitioned by day, flushed to disk, and only then deleted from the table.
+
+Archives live under settings.RETENTION_ARCHIVE_DIR:
+
+    <dir>/<policy>/<YYYY>/<MM>/<YYYY-MM-DD>.jsonl.gz
+    <dir>/<policy>/manifest.json     {"days": {"YYYY-MM-DD": rows archived},
+                                      "pending": {"YYYY-MM-DD": [ids]}}
+
+Each batch appends one gzip member, which gzip readers read back as one
+stream. A crash between writing a batch and deleting it leaves those rows
+in both places; the rerun archives them again, and readers drop the repeats
+by id. Days are local dates, as in api.counters and api.rollup.
+
+The manifest's counts and the delete can't share a transaction, so each
+batch is recorded as pending before its delete and moved into the counts
+after it. reconcile() settles a batch left pending by a crash: ids no
+longer in the table were deleted and count as archived, the rest are
+archived again by the rerun. archive() and archived_counts() reconcile
+first, so the counts never miss or repeat a row.
+
+rows() reads a policy's history across both tiers for reports, merged in
+timestamp order. Archived map views keep counting towards the dashboard
+counters: deletes skip the per-row signals, and counters.rebuild() adds
+archived_counts(). Rollups read only the hot table, so a forced
+rollup of an archived day undercounts it; roll days up before they age out.
+"""
+import gzip
+import heapq
+import json
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from zamreach.db import run_serialized
+
+BATCH_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class Policy:
+    name: str
+    # 'app_label.Model', resolved on use so importing this module loads no models
+    label: str
+    field: str
+    default_days: int
+    # Called with the archived rows once they are deleted
+    after_delete: Callable = None
+
+    @property
+    def model(self):
+        return apps.get_model(self.label)
+
+    @property
+    def days(self):
+        return getattr(settings, 'RETENTION_DAYS', {}).get(self.name, self.default_days)
+
+    @property
+    def columns(self):
+        return [f.attname for f in self.model._meta.concrete_fields]
+
+    def to_python(self, row):
+        fields = {f.attname: f for f in self.model._meta.concrete_fields}
+        return {name: fields[name].to_python(value) if name in fields else value for name, value in row.items()}
+
+
+def _activities_deleted(rows):
+    from business_ads import feed
+
+    # Activities that were still in a user's feed buffer
+    feed.invalidate(*{row['user_id'] for row in rows})
+
+
+POLICIES = {
+    'mapviews': Policy('mapviews', 'api.MapView', 'viewed_at', default_days=180),
+    'activities': Policy('activities', 'business_ads.Activity', 'created_at', default_days=90, after_delete=_activities_deleted),
+}
+
+
+def get_policy(name):
+    try:
+        return POLICIES[name]
+    except KeyError:
+        raise ValueError(f'Unknown retention policy: {name}; choose from {", ".join(POLICIES)}')
+
+
+# Archive files
+
+def archive_root(policy):
+    return Path(settings.RETENTION_ARCHIVE_DIR) / policy.name
+
+
+def partition_path(policy, day):
+    return archive_root(policy) / f'{day:%Y}' / f'{day:%m}' / f'{day.isoformat()}.jsonl.gz'
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _append(path, rows):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = ''.join(json.dumps({k: _plain(v) for k, v in row.items()}) + '\n' for row in rows)
+    with open(path, 'ab') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as compressed:
+            compressed.write(data.encode())
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def _read_partition(policy, path):
+    """Rows of one day file, without repeats, in (timestamp, id) order"""
+    rows = {}
+    with gzip.open(path, 'rt') as lines:
+        for line in lines:
+            row = policy.to_python(json.loads(line))
+            rows[row['id']] = row
+    return sorted(rows.values(), key=lambda row: (row[policy.field], row['id']))
+
+
+def _read_manifest(policy):
+    """({date: rows archived}, {date: [ids of the batch being deleted]})"""
+    path = archive_root(policy) / 'manifest.json'
+    if not path.exists():
+        return {}, {}
+    data = json.loads(path.read_text())
+    days = {date.fromisoformat(day): n for day, n in data['days'].items()}
+    pending = {date.fromisoformat(day): ids for day, ids in data.get('pending', {}).items()}
+    return days, pending
+
+
+def _write_manifest(policy, days, pending=None):
+    path = archive_root(policy) / 'manifest.json'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {'days': {day.isoformat(): n for day, n in sorted(days.items())}}
+    if pending:
+        data['pending'] = {day.isoformat(): ids for day, ids in sorted(pending.items())}
+    temporary = path.with_suffix('.tmp')
+    with open(temporary, 'w') as out:
+        json.dump(data, out)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(temporary, path)
+
+
+def manifest(policy):
+    """{date: rows archived} for a policy, as last recorded"""
+    return _read_manifest(policy)[0]
+
+
+def reconcile(policy):
+    """Settle a batch an interrupted archive() left pending; returns the rows counted"""
+    days, pending = _read_manifest(policy)
+    if not pending:
+        return 0
+    ids = [pk for day_ids in pending.values() for pk in day_ids]
+    remaining = set(policy.model._default_manager.filter(pk__in=ids).values_list('pk', flat=True))
+    settled = 0
+    for day, day_ids in pending.items():
+        gone = sum(1 for pk in day_ids if pk not in remaining)
+        if gone:
+            days[day] = days.get(day, 0) + gone
+            settled += gone
+    _write_manifest(policy, days)
+    return settled
+
+
+def archived_counts(policy):
+    """{date: rows archived} for a policy, after settling any pending batch"""
+    if isinstance(policy, str):
+        policy = get_policy(policy)
+    reconcile(policy)
+    return manifest(policy)
+
+
+def archived_days(policy, start=None, end=None):
+    """Dates with an archive file, oldest first, optionally within start..end"""
+    root = archive_root(policy)
+    days = sorted(date.fromisoformat(path.name[:-len('.jsonl.gz')]) for path in root.glob('*/*/*.jsonl.gz'))
+    return [day for day in days if (start is None or day >= start) and (end is None or day <= end)]
+
+
+# Archiving
+
+def cutoff(policy, now=None):
+    return (now or timezone.now()) - timedelta(days=policy.days)
+
+
+def _delete(policy, ids, using):
+    # A plain DELETE: the per-row delete signals would treat archived rows
+    # as gone (map view counters) and cost a query each. Nothing references
+    # these tables, so there are no cascades to miss.
+    connection = connections[using]
+    meta = policy.model._meta
+    table = connection.ops.quote_name(meta.db_table)
+    column = connection.ops.quote_name(meta.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({", ".join(["%s"] * len(ids))})', ids)
+
+
+def archive(policy, before=None, batch_size=BATCH_SIZE, dry_run=False):
+    """Move rows older than before (default: the policy's cutoff) to the archive.
+
+    Returns the number of rows archived (or, with dry_run, that would be).
+    """
+    before = before or cutoff(policy)
+    stale = policy.model._default_manager.filter(**{f'{policy.field}__lt': before})
+    if dry_run:
+        return stale.count()
+
+    reconcile(policy)
+    counts = manifest(policy)
+    archived = 0
+    while True:
+        rows = list(stale.order_by(policy.field, 'pk').values(*policy.columns)[:batch_size])
+        if not rows:
+            return archived
+        by_day = {}
+        for row in rows:
+            by_day.setdefault(timezone.localdate(row[policy.field]), []).append(row)
+        for day, day_rows in by_day.items():
+            _append(partition_path(policy, day), day_rows)
+
+        # Recorded before the delete, counted after it; reconcile() settles
+        # a batch whose delete may or may not have committed
+        _write_manifest(policy, counts, {day: [row['id'] for row in day_rows] for day, day_rows in by_day.items()})
+        run_serialized(lambda: _delete(policy, [row['id'] for row in rows], stale.db))
+        for day, day_rows in by_day.items():
+            counts[day] = counts.get(day, 0) + len(day_rows)
+        _write_manifest(policy, counts)
+        if policy.after_delete:
+            policy.after_delete(rows)
+        archived += len(rows)
+
+
+def archive_all(names=None, **options):
+    """{policy name: rows archived} for the named policies (default: all)"""
+    return {name: archive(get_policy(name), **options) for name in names or POLICIES}
+
+
+# Reading across tiers
+
+def day_start(day):
+    """Aware datetime at the start of a local day"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _matches(row, filters):
+    return all(row[name] == value for name, value in filters.items())
+
+
+def rows(policy, start=None, end=None, **filters):
+    """Yield a policy's rows as dicts, archived and hot, in timestamp order.
+
+    start and end are dates (inclusive, local days). filters are equality
+    tests on model attnames, e.g. user_id=3, applied to both tiers.
+    """
+    if isinstance(policy, str):
+        policy = get_policy(policy)
+    hot = policy.model._default_manager.filter(**filters)
+    if start is not None:
+        hot = hot.filter(**{f'{policy.field}__gte': day_start(start)})
+    if end is not None:
+        hot = hot.filter(**{f'{policy.field}__lt': day_start(end + timedelta(days=1))})
+    hot = hot.order_by(policy.field, 'pk').values(*policy.columns).iterator(chunk_size=BATCH_SIZE)
+
+    def archived():
+        for day in archived_days(policy, start, end):
+            for row in _read_partition(policy, partition_path(policy, day)):
+                if _matches(row, filters):
+                    yield row
+
+    def key(row):
+        return row[policy.field], row['id']
+
+    previous = None
+    for row in heapq.merge(archived(), hot, key=key):
+        # A row archived just before a crash can still be in the table
+        if row['id'] != previous:
+            yield row
+        previous = row['id']
@@ -0,0 +1,208 @@
+"""
+Daily rollups into api.models.Analytics.
+
+Each metric for a whole date range comes from one grouped aggregate (by day),
+streamed with iterator(), so a backfill of a year costs a handful of queries
+rather than one per day. Writing a day replaces its row, so reruns are
+idempotent; dirty_days() limits a rerun to days whose inputs changed.
+
+Inputs are tracked through StatCounter buckets: the counters in
+INPUT_COUNTERS, plus markers set by the api signals through mark_dirty():
+booking edits and deletes mark the day the booking was made (revenue), a
+deleted user marks their join day onwards (total_users), and promotion
+writes mark from the promotion's start onwards (promotion_views). Anything
+else, such as rows changed with queryset.update(), needs a forced re-roll
+(rollup_analytics --force). promotion_views counts promotions by their
+current is_active flag; the flag has no history.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db.models import Count, Exists, Max, OuterRef, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from bookings.models import Booking
+from zamreach.db import serialized_write
+
+from . import counters
+from .models import Analytics, MapView, Promotion, StatCounter
+
+CHUNK_SIZE = 1000
+
+# Counters whose per-day buckets feed a rollup; a bucket updated after the
+# rollup was computed marks that day dirty
+INPUT_COUNTERS = [counters.USERS_JOINED, counters.USERS_ACTIVE, counters.MAP_VIEWS, counters.ROLLUP_DIRTY]
+
+
+def date_range(start, end):
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def _per_day(queryset, field, **aggregates):
+    """Stream {day: {name: value}} for grouped aggregates"""
+    rows = (
+        queryset.order_by()
+        .annotate(day=TruncDate(field))
+        .values('day')
+        .annotate(**aggregates)
+        .values('day', *aggregates)
+    )
+    return {row.pop('day'): row for row in rows.iterator(chunk_size=CHUNK_SIZE)}
+
+
+def compute_range(start, end):
+    """Compute Analytics field values for every day from start to end"""
+    tz = timezone.get_current_timezone()
+    lower = timezone.make_aware(datetime.combine(start, time.min), tz)
+    upper = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz)
+    in_range = {'__gte': lower, '__lt': upper}
+
+    def window(field):
+        return {f'{field}{lookup}': value for lookup, value in in_range.items()}
+
+    joined_before = User.objects.filter(date_joined__lt=lower).count()
+    joined = _per_day(User.objects.filter(**window('date_joined')), 'date_joined', n=Count('id'))
+
+    views = MapView.objects.filter(**window('viewed_at'))
+    view_stats = _per_day(views, 'viewed_at', n=Count('id'), viewers=Count('user', distinct=True))
+    running = Promotion.objects.filter(
+        business=OuterRef('business'),
+        is_active=True,
+        start_date__lte=OuterRef('viewed_at'),
+        end_date__gte=OuterRef('viewed_at'),
+    )
+    promotion_views = _per_day(views.filter(Exists(running)), 'viewed_at', n=Count('id'))
+
+    # Revenue is the value of bookings made that day that still stand
+    revenue = _per_day(
+        Booking.objects.filter(**window('created_at')).exclude(status='cancelled'),
+        'created_at',
+        total=Sum('total_price'),
+    )
+
+    # Logins are only known through the daily active counter
+    logins = dict(
+        StatCounter.objects.filter(name=counters.USERS_ACTIVE, key='', day__range=(start, end))
+        .values_list('day', 'value')
+    )
+
+    results = {}
+    total_users = joined_before
+    empty = {}
+    for day in date_range(start, end):
+        total_users += joined.get(day, empty).get('n', 0)
+        views_on_day = view_stats.get(day, empty)
+        results[day] = {
+            'total_users': total_users,
+            'active_users': max(views_on_day.get('viewers', 0), logins.get(day, 0)),
+            'map_views': views_on_day.get('n', 0),
+            'promotion_views': promotion_views.get(day, empty).get('n', 0),
+            'revenue': revenue.get(day, empty).get('total') or Decimal('0'),
+        }
+    return results
+
+
+@serialized_write
+def store_rollups(values):
+    """Write computed {day: fields} rows, replacing existing ones"""
+    now = timezone.now()
+    existing = Analytics.objects.in_bulk(list(values), field_name='date')
+    updated, created = [], []
+    for day, fields in values.items():
+        row = existing.get(day) or Analytics(date=day)
+        for name, value in fields.items():
+            setattr(row, name, value)
+        row.computed_at = now
+        (updated if row.pk else created).append(row)
+    Analytics.objects.bulk_update(updated, ['computed_at', *Analytics.ROLLUP_FIELDS], batch_size=500)
+    Analytics.objects.bulk_create(created, batch_size=500)
+    return len(values)
+
+
+def rollup_range(start, end):
+    """Compute and store rollups for start..end; returns the number of days written"""
+    return store_rollups(compute_range(start, end))
+
+
+def rollup_day(day):
+    return rollup_range(day, day)
+
+
+def mark_dirty(value, onward=False):
+    """Have the next rollup recompute the day of value (and, with onward, every later day)"""
+    day = counters.local_day(value)
+    if day < timezone.localdate():
+        counters.increment(counters.ROLLUP_DIRTY_FROM if onward else counters.ROLLUP_DIRTY, day=day)
+
+
+def dirty_days(start, end):
+    """Days in start..end that have no rollup or whose inputs changed since"""
+    computed = dict(
+        Analytics.objects.filter(date__range=(start, end)).values_list('date', 'computed_at')
+    )
+    touched = dict(
+        StatCounter.objects.filter(day__range=(start, end), name__in=INPUT_COUNTERS)
+        .order_by().values('day').annotate(last=Max('updated_at')).values_list('day', 'last')
+    )
+    onward = list(
+        StatCounter.objects.filter(name=counters.ROLLUP_DIRTY_FROM, day__lte=end)
+        .exclude(day=counters.ALL_TIME).order_by('day').values_list('day', 'updated_at')
+    )
+    dirty = []
+    latest_onward, i = None, 0
+    for day in date_range(start, end):
+        while i < len(onward) and onward[i][0] <= day:
+            latest_onward = max(latest_onward or onward[i][1], onward[i][1])
+            i += 1
+        computed_at = computed.get(day)
+        if (
+            computed_at is None
+            # Computed before the day was over
+            or timezone.localdate(computed_at) <= day
+            or (day in touched and touched[day] > computed_at)
+            or (latest_onward is not None and latest_onward > computed_at)
+        ):
+            dirty.append(day)
+    return dirty
+
+
+def _runs(days, max_length):
+    """Group sorted days into contiguous runs of at most max_length days"""
+    runs = []
+    for day in days:
+        if runs and day - runs[-1][1] == timedelta(days=1) and (day - runs[-1][0]).days < max_length:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(run) for run in runs]
+
+
+def _compute_in_thread(run):
+    try:
+        return compute_range(*run)
+    finally:
+        connections.close_all()
+
+
+def backfill(start, end, workers=1, chunk_days=31, only_dirty=True):
+    """Roll up a date range; returns the number of days written.
+
+    With several workers the aggregate queries for each chunk run in parallel
+    threads, while the writes stay in the calling thread so SQLite never sees
+    competing writers.
+    """
+    days = dirty_days(start, end) if only_dirty else list(date_range(start, end))
+    runs = _runs(days, chunk_days)
+    if not runs:
+        return 0
+    if workers <= 1 or len(runs) == 1:
+        return sum(rollup_range(*run) for run in runs)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(store_rollups(values) for values in pool.map(_compute_in_thread, runs))
@@ -0,0 +1,141 @@
+"""
+Which promotions are running now, ending soon or starting soon, without
+filtering the promotions table on every read.
+
+The schedule holds every promotion flagged is_active that has not ended yet:
+its id, business and start/end as epoch seconds, sorted once by start and
+once by end. One query builds it; it is shared through the cache under the
+'promotions' version, which the Promotion signals bump, so it is rebuilt
+only when a promotion changes. Time passing does not make it stale, since
+each question is a bisect over the sorted columns at the moment asked. The
+set running now is also kept per process until the next start or end
+boundary passes, so most reads of it are a tuple lookup. The per-process
+state is replaced with a single assignment, never updated in place, so
+threads reading it concurrently see the old value or the new one.
+
+A promotion runs from start_date to end_date inclusive.
+"""
+import bisect
+import math
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from bookings import caching
+
+from .models import Promotion
+
+SCOPE = 'promotions'
+CACHE_PREFIX = 'promotions:schedule'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+DAY = timedelta(days=1).total_seconds()
+
+
+def _seconds(moment):
+    if moment is None:
+        return time.time()
+    return moment.timestamp()
+
+
+class Schedule:
+    """Promotions that have not ended, sorted by start and by end"""
+
+    def __init__(self, entries):
+        # (start, end, id, business_id), sorted by start
+        self.entries = entries
+        self.starts = [entry[0] for entry in entries]
+        # (end, index into entries), sorted by end
+        self.by_end = sorted((entry[1], i) for i, entry in enumerate(entries))
+        self.ends = [end for end, _ in self.by_end]
+
+    def running(self, now):
+        """(ids of promotions running at now, the time that set next changes)"""
+        started = bisect.bisect_right(self.starts, now)
+        ids, until = [], self.starts[started] if started < len(self.starts) else float('inf')
+        for start, end, pk, business_id in self.entries[:started]:
+            if end >= now:
+                ids.append((pk, business_id))
+                # Still running at end itself
+                until = min(until, math.nextafter(end, math.inf))
+        return ids, until
+
+    def ending(self, now, within):
+        """Entries running at now that end by now + within"""
+        low = bisect.bisect_left(self.ends, now)
+        high = bisect.bisect_right(self.ends, now + within)
+        return [self.entries[i] for _, i in self.by_end[low:high] if self.entries[i][0] <= now]
+
+    def starting(self, now, within):
+        """Entries starting after now and by now + within"""
+        low = bisect.bisect_right(self.starts, now)
+        high = bisect.bisect_right(self.starts, now + within)
+        return self.entries[low:high]
+
+
+def build():
+    now = timezone.now()
+    rows = (
+        Promotion.objects.filter(is_active=True, end_date__gte=now)
+        .values_list('start_date', 'end_date', 'id', 'business_id')
+    )
+    return Schedule(sorted((start.timestamp(), end.timestamp(), pk, business_id)
+                           for start, end, pk, business_id in rows))
+
+
+# Per-process copy of the shared schedule: (version, schedule)
+_local = None
+# The set running now: (schedule, since, until, ids)
+_memo = None
+
+
+def get_schedule():
+    global _local
+    (version,) = caching.get_versions(SCOPE)
+    local = _local
+    if local is not None and local[0] == version:
+        return local[1]
+    key = f'{CACHE_PREFIX}:{version}'
+    schedule = cache.get(key)
+    if schedule is None:
+        schedule = build()
+        cache.set(key, schedule, CACHE_TIMEOUT)
+    _local = (version, schedule)
+    return schedule
+
+
+def _running(now):
+    global _memo
+    schedule = get_schedule()
+    memo = _memo
+    if memo is None or memo[0] is not schedule or not memo[1] <= now < memo[2]:
+        ids, until = schedule.running(now)
+        memo = _memo = (schedule, now, until, ids)
+    return memo[3]
+
+
+def active_ids(business_id=None, now=None):
+    """Ids of promotions running now, optionally for one business"""
+    return [pk for pk, business in _running(_seconds(now)) if business_id is None or business == business_id]
+
+
+def active_count(now=None):
+    return len(_running(_seconds(now)))
+
+
+def ending_within(days, now=None):
+    """Ids of running promotions that end within days"""
+    return [entry[2] for entry in get_schedule().ending(_seconds(now), days * DAY)]
+
+
+def starting_within(days, now=None):
+    """Ids of promotions that start within days"""
+    return [entry[2] for entry in get_schedule().starting(_seconds(now), days * DAY)]
+
+
+def changed():
+    """Rebuild the schedule on next read, once the current transaction commits"""
+    transaction.on_commit(lambda: caching.bump(SCOPE))
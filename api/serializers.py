@@ -33,6 +33,12 @@ class BusinessSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['owner']
 
+class BusinessListingSerializer(serializers.ModelSerializer):
+    """Public fields only, for unauthenticated listings"""
+    class Meta:
+        model = Business
+        fields = ('id', 'name', 'category', 'address', 'latitude', 'longitude', 'created_at')
+
 class CustomerSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     class Meta:
@@ -0,0 +1,169 @@
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from bookings.models import Booking
+
+from . import counters, rollup, schedule, trigram
+from .models import Business, MapView, Promotion
+
+# Promotion columns behind its search document (the business's name and
+# category are reindexed from the business)
+PROMOTION_DOCUMENT = ['title', 'description', 'business_id']
+
+
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    """Remember the stored last_login, which auth's update_last_login
+    overwrites on the instance when the user logs in"""
+    # Through __dict__, so a deferred last_login is not fetched
+    instance._stored_last_login = instance.__dict__.get('last_login')
+
+
+@receiver(user_logged_in)
+def user_logging_in(sender, request, user, **kwargs):
+    """Count a user as active the first time they log in on a given day"""
+    today = timezone.localdate()
+    previous = getattr(user, '_stored_last_login', None)
+    if previous is None or counters.local_day(previous) != today:
+        counters.increment(counters.USERS_ACTIVE, day=today)
+    user._stored_last_login = timezone.now()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.increment(counters.USERS)
+        counters.increment(counters.USERS_JOINED, day=counters.local_day(instance.date_joined))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    counters.increment(counters.USERS, -1)
+    counters.increment(counters.USERS_JOINED, -1, day=counters.local_day(instance.date_joined))
+    # Every later day's total_users shifts
+    rollup.mark_dirty(instance.date_joined, onward=True)
+
+
+@receiver(pre_save, sender=Business)
+def business_saving(sender, instance, **kwargs):
+    """Remember the stored searchable fields: the category count and the
+    search index only change when they do"""
+    if instance.pk is not None:
+        stored = Business.objects.filter(pk=instance.pk).values_list(*trigram.BUSINESS_FIELDS).first()
+        if stored is not None:
+            instance._stored_document = dict(zip(trigram.BUSINESS_FIELDS, stored))
+
+
+@receiver(post_save, sender=Business)
+def business_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.increment(counters.BUSINESSES)
+        counters.increment(counters.BUSINESSES_CREATED, day=counters.local_day(instance.created_at))
+        counters.increment(counters.BUSINESSES_BY_CATEGORY, key=instance.category)
+        return
+    previous = getattr(instance, '_stored_document', {}).get('category')
+    if previous is not None and previous != instance.category:
+        counters.increment(counters.BUSINESSES_BY_CATEGORY, -1, key=previous)
+        counters.increment(counters.BUSINESSES_BY_CATEGORY, key=instance.category)
+
+
+@receiver(post_delete, sender=Business)
+def business_deleted(sender, instance, **kwargs):
+    counters.increment(counters.BUSINESSES, -1)
+    counters.increment(counters.BUSINESSES_CREATED, -1, day=counters.local_day(instance.created_at))
+    counters.increment(counters.BUSINESSES_BY_CATEGORY, -1, key=instance.category)
+
+
+@receiver(pre_save, sender=Promotion)
+def promotion_saving(sender, instance, **kwargs):
+    """Remember the stored start, so a moved promotion re-rolls its old days,
+    and the searched fields, so an unchanged document is not reindexed"""
+    if instance.pk is not None:
+        stored = (
+            Promotion.objects.filter(pk=instance.pk)
+            .values_list('start_date', *PROMOTION_DOCUMENT).first()
+        )
+        if stored is not None:
+            instance._stored_start = stored[0]
+            instance._stored_document = dict(zip(PROMOTION_DOCUMENT, stored[1:]))
+
+
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+def promotion_rolled_up(sender, instance, **kwargs):
+    """Promotion views from the (earlier) start onwards need recomputing"""
+    starts = [instance.start_date, getattr(instance, '_stored_start', None)]
+    rollup.mark_dirty(min(start for start in starts if start is not None), onward=True)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def booking_rolled_up(sender, instance, created=False, **kwargs):
+    """Edited or deleted bookings change the revenue of the day they were made"""
+    if not created:
+        rollup.mark_dirty(instance.created_at)
+
+
+@receiver(post_save, sender=Promotion)
+def promotion_saved(sender, instance, created, **kwargs):
+    schedule.changed()
+    if created:
+        counters.increment(counters.PROMOTIONS)
+        counters.increment(counters.PROMOTIONS_CREATED, day=counters.local_day(instance.created_at))
+
+
+@receiver(post_delete, sender=Promotion)
+def promotion_deleted(sender, instance, **kwargs):
+    schedule.changed()
+    counters.increment(counters.PROMOTIONS, -1)
+    counters.increment(counters.PROMOTIONS_CREATED, -1, day=counters.local_day(instance.created_at))
+
+
+@receiver(post_save, sender=MapView)
+def map_view_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.increment(counters.MAP_VIEWS)
+        counters.increment(counters.MAP_VIEWS, day=counters.local_day(instance.viewed_at))
+
+
+@receiver(post_delete, sender=MapView)
+def map_view_deleted(sender, instance, **kwargs):
+    counters.increment(counters.MAP_VIEWS, -1)
+    counters.increment(counters.MAP_VIEWS, -1, day=counters.local_day(instance.viewed_at))
+
+
+def _changed(instance, fields):
+    """Fields whose saved value differs from the one read in pre_save (all, for new rows)"""
+    stored = getattr(instance, '_stored_document', None)
+    if stored is None:
+        return set(fields)
+    return {name for name in fields if getattr(instance, name) != stored[name]}
+
+
+@receiver(post_save, sender=Business)
+def business_reindex(sender, instance, **kwargs):
+    changed = _changed(instance, trigram.BUSINESS_FIELDS)
+    if changed:
+        trigram.reindex('business', [instance.pk])
+    # Promotion documents carry the business name and category
+    if changed & {'name', 'category'} and hasattr(instance, '_stored_document'):
+        trigram.reindex('promotion', Promotion.objects.filter(business=instance).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Promotion)
+def promotion_reindex(sender, instance, **kwargs):
+    if _changed(instance, PROMOTION_DOCUMENT):
+        trigram.reindex('promotion', [instance.pk])
+
+
+@receiver(post_delete, sender=Business)
+def business_unindex(sender, instance, **kwargs):
+    trigram.remove('business', [instance.pk])
+
+
+@receiver(post_delete, sender=Promotion)
+def promotion_unindex(sender, instance, **kwargs):
+    trigram.remove('promotion', [instance.pk])
@@ -0,0 +1,598 @@
+import io
+import json
+import random
+import threading
+import tempfile
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from business_ads import feed
+from business_ads.models import Activity
+
+from . import counters, ingest, pagination, retention, rollup, schedule, trigram
+from .models import Analytics, Business, MapView, Promotion, SearchTrigram, StatCounter
+from .utils import geo
+
+
+class GeohashTests(TestCase):
+    def test_encode_known_value(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+
+    def test_covering_cells_contain_circle_edges(self):
+        lat, lng, radius = -15.4167, 28.2833, 25
+        cells = geo.covering_cells(lat, lng, radius)
+        min_lat, max_lat, min_lng, max_lng = geo.bounding_box(lat, lng, radius)
+        for y, x in [(min_lat, min_lng), (max_lat, max_lng), (min_lat, max_lng), (max_lat, min_lng)]:
+            self.assertTrue(any(geo.encode(y, x).startswith(cell) for cell in cells))
+
+
+class NearbyBusinessTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('merchant', password='pass12345')
+        rng = random.Random(7)
+        # Scatter businesses around Lusaka
+        for i in range(200):
+            Business.objects.create(
+                name=f'Shop {i}', owner=owner, address='Lusaka', category='retail',
+                latitude=-15.4167 + rng.uniform(-1, 1), longitude=28.2833 + rng.uniform(-1, 1),
+            )
+        self.lat, self.lng = -15.4167, 28.2833
+
+    def brute_force(self, radius):
+        hits = []
+        for b in Business.objects.all():
+            d = geo.haversine_km(self.lat, self.lng, b.latitude, b.longitude)
+            if d <= radius:
+                hits.append((d, b.id))
+        return sorted(hits)
+
+    def test_within_radius_matches_brute_force(self):
+        for radius in (5, 30, 80):
+            self.assertEqual(geo.within_radius(Business.objects.all(), self.lat, self.lng, radius),
+                             self.brute_force(radius))
+
+    def test_limit_is_applied_in_sql(self):
+        for radius, limit in ((30, 5), (80, 20), (500, 1)):
+            self.assertEqual(geo.within_radius(Business.objects.all(), self.lat, self.lng, radius, limit=limit),
+                             self.brute_force(radius)[:limit])
+        # Ordering across the antimeridian
+        owner = User.objects.get(username='merchant')
+        east = Business.objects.create(name='East', owner=owner, address='Fiji', category='retail',
+                                       latitude=-17.0, longitude=179.9)
+        for i in range(geo.CANDIDATE_FACTOR + 1):
+            Business.objects.create(name=f'West {i}', owner=owner, address='Fiji', category='retail',
+                                    latitude=-17.0, longitude=-179.5)
+        hits = geo.within_radius(Business.objects.all(), -17.0, -179.9, 100, limit=1)
+        self.assertEqual([pk for _, pk in hits], [east.id])
+
+    def test_nearest(self):
+        expected = self.brute_force(1000)[:5]
+        self.assertEqual(geo.nearest(Business.objects.all(), self.lat, self.lng, 5), expected)
+
+    def test_endpoint(self):
+        response = self.client.get('/api/businesses/nearby/', {'lat': self.lat, 'lng': self.lng, 'k': 3})
+        self.assertEqual(response.status_code, 200)
+        distances = [row['distance_km'] for row in response.json()['results']]
+        self.assertEqual(len(distances), 3)
+        self.assertEqual(distances, sorted(distances))
+        response = self.client.get('/api/businesses/nearby/', {'lat': 'north'})
+        self.assertEqual(response.status_code, 400)
+        for bad in ({'k': 0}, {'k': -2}, {'limit': -1}, {'radius': 'nan'}, {'radius': 'inf'}, {'radius': -5}):
+            response = self.client.get('/api/businesses/nearby/', {'lat': self.lat, 'lng': self.lng, **bad})
+            self.assertEqual(response.status_code, 400, bad)
+
+
+class CounterTests(TestCase):
+    def test_signals_track_totals_days_and_categories(self):
+        owner = User.objects.create_user('counted', password='pass12345')
+        shop = Business.objects.create(name='Shop', owner=owner, address='Ndola', category='retail',
+                                       latitude=-12.96, longitude=28.63)
+        Business.objects.create(name='Cafe', owner=owner, address='Ndola', category='food',
+                                latitude=-12.96, longitude=28.63)
+        shop.category = 'food'
+        shop.save()
+
+        today = timezone.localdate()
+        snap = counters.snapshot(since=today)
+        self.assertEqual(snap[counters.USERS]['total'], 1)
+        self.assertEqual(counters.day_total(snap, counters.USERS_JOINED, today), 1)
+        self.assertEqual(snap[counters.BUSINESSES]['total'], 2)
+        self.assertEqual(snap[counters.BUSINESSES_BY_CATEGORY]['keys'], {'retail': 0, 'food': 2})
+
+        shop.delete()
+        snap = counters.snapshot(since=today)
+        self.assertEqual(snap[counters.BUSINESSES]['total'], 1)
+        self.assertEqual(counters.day_total(snap, counters.BUSINESSES_CREATED, today), 1)
+
+    def test_daily_active_counts_first_login_only(self):
+        User.objects.create_user('active', password='pass12345')
+        self.client.login(username='active', password='pass12345')
+        self.client.logout()
+        self.client.login(username='active', password='pass12345')
+        snap = counters.snapshot(since=timezone.localdate())
+        self.assertEqual(counters.day_total(snap, counters.USERS_ACTIVE, timezone.localdate()), 1)
+
+    def test_dashboards_read_counters(self):
+        admin = User.objects.create_superuser('boss', password='pass12345')
+        owner = User.objects.create_user('owner', password='pass12345')
+        for category in ('retail', 'food', 'food'):
+            Business.objects.create(name='Shop', owner=owner, address='Ndola', category=category,
+                                    latitude=-12.96, longitude=28.63)
+        self.assertEqual(self.client.get('/api/dashboard/stats/').status_code, 403)
+        self.client.force_login(owner)
+        self.assertEqual(self.client.get('/api/dashboard/overview/').status_code, 403)
+
+        self.client.force_login(admin)
+        cache.clear()
+        with self.assertNumQueries(9):
+            stats = self.client.get('/api/dashboard/stats/').json()
+        self.assertEqual(stats['users']['total'], 2)
+        self.assertEqual(stats['users']['new_today'], 2)
+        self.assertEqual(stats['businesses']['total'], 3)
+        self.assertEqual(stats['businesses']['by_category'][0], {'category': 'food', 'count': 2})
+        overview = self.client.get('/api/dashboard/overview/').json()
+        self.assertEqual(overview['summary']['total_businesses'], 3)
+        self.assertEqual(overview['today']['new_businesses'], 3)
+
+    def test_saving_a_user_does_not_read_last_login(self):
+        user = User.objects.create_user('saver', password='pass12345')
+        user.last_login = timezone.now()
+        with CaptureQueriesContext(connection) as queries:
+            user.save(update_fields=['last_login'])
+        self.assertFalse([q['sql'] for q in queries if q['sql'].startswith('SELECT')])
+
+    def test_sharded_counter_sums_its_rows(self):
+        for _ in range(20):
+            counters.increment(counters.MAP_VIEWS, day=date(2026, 10, 1))
+            counters.increment(counters.MAP_VIEWS)
+        self.assertGreater(StatCounter.objects.filter(name=counters.MAP_VIEWS, day=counters.ALL_TIME).count(), 1)
+        snap = counters.snapshot(since=date(2026, 10, 1))
+        self.assertEqual(snap[counters.MAP_VIEWS]['total'], 20)
+        self.assertEqual(counters.day_total(snap, counters.MAP_VIEWS, date(2026, 10, 1)), 20)
+        self.assertEqual(snap[counters.MAP_VIEWS]['keys'], {})
+
+    def test_rebuild_matches_incremental(self):
+        owner = User.objects.create_user('rebuilt', password='pass12345')
+        Business.objects.create(name='Shop', owner=owner, address='Kitwe', category='retail',
+                                latitude=-12.8, longitude=28.2)
+        before = sorted(StatCounter.objects.exclude(value=0).values_list('name', 'day', 'key', 'value'))
+        StatCounter.objects.all().update(value=999)
+        counters.rebuild()
+        after = sorted(StatCounter.objects.exclude(name=counters.USERS_ACTIVE).values_list('name', 'day', 'key', 'value'))
+        self.assertEqual(before, after)
+
+
+class MapViewIngestTests(TestCase):
+    def setUp(self):
+        self.spool = tempfile.TemporaryDirectory()
+        self.addCleanup(self.spool.cleanup)
+        self.buffer = ingest.MapViewBuffer(spool_dir=self.spool.name, flush_size=3, flush_interval=3600)
+        self.user = User.objects.create_user('viewer', password='pass12345')
+        self.business = Business.objects.create(name='Shop', owner=self.user, address='Lusaka',
+                                                category='retail', latitude=-15.4, longitude=28.3)
+
+    def event(self, second):
+        return {
+            'user_id': self.user.id,
+            'business_id': self.business.id,
+            'viewed_at': f'2026-10-01T10:00:{second:02d}+00:00',
+            'duration': 5,
+        }
+
+    def test_flushes_on_size_and_drops_duplicates(self):
+        self.buffer.add([self.event(1), self.event(2)])
+        self.assertEqual(MapView.objects.count(), 0)
+        # A retried event arrives with the batch that crosses the threshold
+        self.buffer.add([self.event(2), self.event(3)])
+        self.assertEqual(MapView.objects.count(), 3)
+        self.buffer.add([self.event(3)])
+        self.buffer.flush()
+        self.assertEqual(MapView.objects.count(), 3)
+        self.assertEqual(list(Path(self.spool.name).iterdir()), [])
+
+    def test_timer_flushes_a_quiet_spool(self):
+        buffer = ingest.MapViewBuffer(spool_dir=self.spool.name, flush_size=100, flush_interval=0.05)
+        flushed = threading.Event()
+        with mock.patch.object(buffer, 'flush', side_effect=flushed.set):
+            buffer.add([self.event(1)])
+            self.assertTrue(flushed.wait(5))
+
+    def test_conflicting_rows_are_not_counted(self):
+        first = parse_datetime(self.event(1)['viewed_at'])
+        MapView.objects.create(user=self.user, business=self.business, viewed_at=first, duration=5)
+        # As if a concurrent flush stored event 1 after the existing check ran
+        rows = [MapView(user=self.user, business=self.business, viewed_at=first + timedelta(seconds=s), duration=5)
+                for s in (0, 1)]
+        self.assertEqual(ingest._insert_ignoring_conflicts(rows), [first + timedelta(seconds=1)])
+        self.assertEqual(MapView.objects.count(), 2)
+
+    def test_recovers_spool_of_dead_worker(self):
+        orphan = Path(self.spool.name) / f'mapviews.{self.buffer.host}.99999999.jsonl'
+        orphan.write_text(json.dumps(self.event(9)) + '\n{"torn')
+        self.assertEqual(self.buffer.recover(), 1)
+        self.assertFalse(orphan.exists())
+        snap = counters.snapshot(since=date(2026, 10, 1))
+        self.assertEqual(counters.day_total(snap, counters.MAP_VIEWS, date(2026, 10, 1)), 1)
+
+    def test_endpoint_requires_login_and_validates(self):
+        url = '/api/mapviews/'
+        payload = {'events': [{'business': self.business.id, 'viewed_at': '2026-10-01T10:00:00Z'}]}
+        response = self.client.post(url, payload, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.login(username='viewer', password='pass12345')
+        with mock.patch.object(ingest, 'buffer', self.buffer):
+            payload['events'].append({'business': 424242})
+            response = self.client.post(url, payload, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['accepted'], 1)
+        self.buffer.flush()
+        self.assertEqual(MapView.objects.count(), 1)
+
+
+class RollupTests(TestCase):
+    def test_backfill_is_idempotent_and_incremental(self):
+        user = User.objects.create_user('roller', password='pass12345')
+        shop = Business.objects.create(name='Shop', owner=user, address='Lusaka', category='retail',
+                                       latitude=-15.4, longitude=28.3)
+        day1, day2 = date(2026, 9, 1), date(2026, 9, 2)
+        at = lambda day, hour: timezone.make_aware(datetime.combine(day, time(hour)))
+        Promotion.objects.create(business=shop, title='Sale', description='', discount_type='fixed',
+                                 discount_value=5, start_date=at(day2, 0), end_date=at(day2, 12))
+        User.objects.filter(pk=user.pk).update(date_joined=at(day1, 8))
+        for day, hour in [(day1, 9), (day1, 10), (day2, 9), (day2, 15)]:
+            MapView.objects.create(user=user, business=shop, duration=3, viewed_at=at(day, hour))
+
+        self.assertEqual(rollup.backfill(day1, day2, workers=1, chunk_days=1), 2)
+        first = Analytics.objects.get(date=day1)
+        second = Analytics.objects.get(date=day2)
+        self.assertEqual((first.map_views, first.promotion_views, first.active_users), (2, 0, 1))
+        self.assertEqual((second.map_views, second.promotion_views), (2, 1))
+        self.assertEqual(second.total_users, 1)
+
+        # Nothing changed, so nothing is recomputed
+        self.assertEqual(rollup.dirty_days(day1, day2), [])
+        self.assertEqual(rollup.backfill(day1, day2), 0)
+
+        MapView.objects.create(user=user, business=shop, duration=3, viewed_at=at(day2, 18))
+        self.assertEqual(rollup.dirty_days(day1, day2), [day2])
+        rollup.backfill(day1, day2)
+        self.assertEqual(Analytics.objects.get(date=day2).map_views, 3)
+        self.assertEqual(Analytics.objects.count(), 2)
+
+        # Edits to a promotion re-roll its days; a deleted user shifts every later total
+        promotion = Promotion.objects.get()
+        promotion.end_date = at(day2, 18)
+        promotion.save()
+        self.assertEqual(rollup.dirty_days(day1, day2), [day2])
+        rollup.backfill(day1, day2)
+        leaver = User.objects.create_user('leaver', password='pass12345')
+        User.objects.filter(pk=leaver.pk).update(date_joined=at(day1, 12))
+        User.objects.get(pk=leaver.pk).delete()
+        self.assertEqual(rollup.dirty_days(day1, day2), [day1, day2])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('pager', password='pass12345')
+        shop = Business.objects.create(name='Shop', owner=owner, address='Lusaka', category='retail',
+                                       latitude=-15.4, longitude=28.3)
+        start = timezone.now()
+        for i in range(23):
+            Promotion.objects.create(business=shop, title=f'Deal {i}', description='', discount_type='fixed',
+                                     discount_value=1, start_date=start,
+                                     end_date=start + timedelta(days=i % 4))
+        # Ties on created_at must still page deterministically
+        Promotion.objects.filter(id__lte=Promotion.objects.order_by('id')[10].id).update(created_at=start)
+
+    def walk(self, ordering):
+        seen, cursor = [], None
+        while True:
+            page = pagination.paginate(Promotion.objects.all(), ordering, cursor, page_size=5)
+            seen.append([p.id for p in page.results])
+            if not page.next_cursor:
+                return seen, page
+            cursor = page.next_cursor
+
+    def test_pages_cover_ordering_exactly_once_both_ways(self):
+        for ordering in (pagination.CREATED, pagination.ENDING):
+            expected = list(Promotion.objects.order_by(*ordering).values_list('id', flat=True))
+            pages, last = self.walk(ordering)
+            self.assertEqual(sum(pages, []), expected)
+
+            backwards, cursor = [], last.previous_cursor
+            while cursor:
+                page = pagination.paginate(Promotion.objects.all(), ordering, cursor, page_size=5)
+                backwards.insert(0, [p.id for p in page.results])
+                cursor = page.previous_cursor
+            self.assertEqual(backwards, pages[:-1])
+
+    def test_routed_lists_page_by_cursor(self):
+        def walk(url, **params):
+            ids, response = [], self.client.get(url, {'page_size': 5, 'count': 1, **params}).json()
+            self.assertIn('count', response)
+            while True:
+                ids += [row['id'] for row in response['results']]
+                if not response['next']:
+                    return ids
+                self.assertNotIn('count=', response['next'])
+                response = self.client.get(response['next']).json()
+
+        running = Promotion.objects.filter(pk__in=schedule.active_ids())
+        self.assertEqual(walk('/api/promotions/', ordering='end_date'),
+                         list(running.order_by(*pagination.ENDING).values_list('id', flat=True)))
+        self.assertEqual(walk('/api/promotions/'),
+                         list(running.order_by(*pagination.CREATED).values_list('id', flat=True)))
+        owner = User.objects.get(username='pager')
+        for i in range(7):
+            Business.objects.create(name=f'Shop {i}', owner=owner, address='Lusaka', category='retail',
+                                    latitude=-15.4, longitude=28.3)
+        self.assertEqual(walk('/api/businesses/'),
+                         list(Business.objects.order_by(*pagination.CREATED).values_list('id', flat=True)))
+
+    def test_drf_pagination_and_bad_cursors(self):
+        request = Request(APIRequestFactory().get('/promotions/', {'page_size': 10, 'count': 1}))
+        paginator = pagination.KeysetPagination(ordering=pagination.ENDING)
+        rows = paginator.paginate_queryset(Promotion.objects.all(), request)
+        body = paginator.get_paginated_response([row.id for row in rows]).data
+        self.assertEqual(len(body['results']), 10)
+        self.assertEqual((body['count'], body['count_exact']), (23, True))
+        self.assertIn('cursor=', body['next'])
+        self.assertNotIn('count=', body['next'])
+
+        with self.assertRaises(pagination.InvalidCursor):
+            pagination.paginate(Promotion.objects.all(), pagination.CREATED, 'not-a-cursor')
+        with self.assertRaises(pagination.InvalidCursor):
+            pagination.paginate(Promotion.objects.all(), pagination.CREATED, pagination.encode_cursor([1]))
+
+    def test_sequence_pagination(self):
+        hits = [(0.5, 3), (0.5, 7), (1.25, 1), (2.0, 9), (3.5, 2)]
+        page = pagination.paginate_sequence(hits, key=tuple, page_size=2)
+        page = pagination.paginate_sequence(hits, key=tuple, cursor=page.next_cursor, page_size=2)
+        self.assertEqual(page.results, [(1.25, 1), (2.0, 9)])
+        back = pagination.paginate_sequence(hits, key=tuple, cursor=page.previous_cursor, page_size=2)
+        self.assertEqual(back.results, hits[:2])
+
+
+class TrigramSearchTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('finder', password='pass12345')
+        self.safari = Business.objects.create(name='Safari Lodge Supplies', owner=owner, address='Cairo Road, Lusaka',
+                                              category='outdoor', latitude=-15.4, longitude=28.3)
+        self.kitchen = Business.objects.create(name="Mama's Kitchen", owner=owner, address='Kabulonga, Lusaka',
+                                               category='restaurant', latitude=-15.4, longitude=28.3)
+        start = timezone.now()
+        self.deal = Promotion.objects.create(business=self.kitchen, title='Half price nshima', description='Lunch only',
+                                             discount_type='percentage', discount_value=50, start_date=start,
+                                             end_date=start + timedelta(days=3))
+
+    def names(self, text, model=Business):
+        rows = trigram.search(model.objects.all(), text).order_by('-search_rank', '-id')
+        return [str(row) for row in rows]
+
+    def test_typos_still_match_and_rank(self):
+        self.assertEqual(self.names('safri lodg'), ['Safari Lodge Supplies'])
+        self.assertEqual(self.names('KITCHN'), ["Mama's Kitchen"])
+        self.assertEqual(self.names('lusaka')[0:2], ["Mama's Kitchen", 'Safari Lodge Supplies'])
+        self.assertEqual(self.names('xylophone'), [])
+        rank = trigram.search(Business.objects.all(), 'safari lodge supplies').get().search_rank
+        self.assertEqual(rank, 1.0)
+
+    def test_promotions_follow_business_changes(self):
+        self.assertEqual(self.names('mamas kitchen', Promotion), ['Half price nshima'])
+        self.kitchen.name = 'Chez Mutinta'
+        self.kitchen.save()
+        self.assertEqual(self.names('mamas kitchen', Promotion), [])
+        self.assertEqual(self.names('mutinta', Promotion), ['Half price nshima'])
+
+        self.kitchen.delete()
+        self.assertFalse(SearchTrigram.objects.exclude(object_id=self.safari.id, kind='business').exists())
+        SearchTrigram.objects.all().delete()
+        self.assertEqual(trigram.rebuild(), {'business': 1, 'promotion': 0})
+        self.assertEqual(self.names('supplies'), ['Safari Lodge Supplies'])
+
+    def test_filter_pages_by_relevance(self):
+        for i in range(6):
+            Business.objects.create(name=f'Lusaka Lodge {i}', owner=self.safari.owner, address='Lusaka',
+                                    category='lodging', latitude=-15.4, longitude=28.3)
+        paginator = pagination.KeysetPagination()
+        seen, cursor = [], None
+        while True:
+            params = {'search': 'lodge', 'page_size': 3, **({'cursor': cursor} if cursor else {})}
+            request = Request(APIRequestFactory().get('/businesses/', params))
+            queryset = trigram.TrigramSearchFilter().filter_queryset(request, Business.objects.all(), None)
+            seen += [(row.search_rank, row.id) for row in paginator.paginate_queryset(queryset, request)]
+            cursor = paginator.page.next_cursor
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_list_endpoints_search(self):
+        response = self.client.get('/api/businesses/', {'search': 'safri lodg'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['name'] for row in response.json()['results']], ['Safari Lodge Supplies'])
+        self.assertNotIn('owner', response.json()['results'][0])
+        response = self.client.get('/api/promotions/', {'search': 'mamas kitchen'})
+        self.assertEqual([row['title'] for row in response.json()['results']], ['Half price nshima'])
+        self.assertEqual(len(self.client.get('/api/businesses/').json()['results']), 2)
+        self.assertEqual(self.client.get('/api/businesses/', {'ordering': 'name'}).status_code, 400)
+
+    def test_unchanged_saves_skip_reindexing(self):
+        with mock.patch.object(trigram, 'reindex') as reindex:
+            self.kitchen.latitude = -15.5
+            self.kitchen.save()
+            self.deal.discount_value = 40
+            self.deal.save()
+            self.assertFalse(reindex.called)
+            self.kitchen.address = 'Woodlands, Lusaka'
+            self.kitchen.save()
+            self.assertEqual([call.args[0] for call in reindex.call_args_list], ['business'])
+
+
+class PromotionScheduleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user('scheduler')
+        self.shop = Business.objects.create(name='Shop', owner=owner, address='Lusaka', category='retail',
+                                            latitude=-15.4, longitude=28.3)
+        self.other = Business.objects.create(name='Other', owner=owner, address='Ndola', category='retail',
+                                             latitude=-13.0, longitude=28.6)
+        self.now = timezone.now()
+        self.running = self.promote('Running', -24, 24)
+        self.closing = self.promote('Closing', -48, 2, business=self.other)
+        self.upcoming = self.promote('Upcoming', 24, 120)
+        self.promote('Over', -48, -1)
+        self.promote('Paused', -1, 24, is_active=False)
+
+    def promote(self, title, start_hours, end_hours, business=None, **extra):
+        return Promotion.objects.create(
+            business=business or self.shop, title=title, description='', discount_type='fixed',
+            discount_value=1, start_date=self.now + timedelta(hours=start_hours),
+            end_date=self.now + timedelta(hours=end_hours), **extra,
+        )
+
+    def test_list_endpoint_answers_windows(self):
+        def titles(**params):
+            response = self.client.get('/api/promotions/', params)
+            self.assertEqual(response.status_code, 200)
+            return sorted(row['title'] for row in response.json()['results'])
+
+        self.assertEqual(titles(), ['Closing', 'Running'])
+        self.assertEqual(titles(ending_within=0.5), ['Closing'])
+        self.assertEqual(titles(starting_within=2), ['Upcoming'])
+        self.assertEqual(titles(starting_within=0.5), [])
+        for bad in ('soon', '-1', 'nan'):
+            self.assertEqual(self.client.get('/api/promotions/', {'ending_within': bad}).status_code, 400)
+
+    def test_answers_move_with_time(self):
+        self.assertEqual(sorted(schedule.active_ids(now=self.now)), [self.running.id, self.closing.id])
+        self.assertEqual(schedule.active_ids(business_id=self.other.id, now=self.now), [self.closing.id])
+        self.assertEqual(schedule.ending_within(days=0.5, now=self.now), [self.closing.id])
+        self.assertEqual(schedule.starting_within(days=2, now=self.now), [self.upcoming.id])
+
+        later = self.now + timedelta(hours=30)
+        self.assertEqual(schedule.active_ids(now=later), [self.upcoming.id])
+        self.assertEqual(schedule.active_count(now=later + timedelta(days=10)), 0)
+
+    def test_reads_skip_the_database_until_a_promotion_changes(self):
+        schedule.active_ids(now=self.now)
+        with self.assertNumQueries(0):
+            self.assertEqual(schedule.active_count(now=self.now), 2)
+            schedule.active_count(now=self.now + timedelta(hours=3))
+            schedule.ending_within(days=3, now=self.now)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.closing.is_active = False
+            self.closing.save()
+        self.assertEqual(schedule.active_ids(now=self.now), [self.running.id])
+
+    def test_promotion_list_shows_running_promotions(self):
+        response = self.client.get('/api/promotions/', {'ordering': 'end_date'})
+        self.assertEqual([row['title'] for row in response.json()['results']], ['Closing', 'Running'])
+        # A rebuilt schedule replaces the per-process copy rather than editing it
+        held = schedule._local
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upcoming.start_date = self.now - timedelta(hours=1)
+            self.upcoming.save()
+        response = self.client.get('/api/promotions/')
+        self.assertEqual(len(response.json()['results']), 3)
+        self.assertIsNot(schedule._local, held)
+        self.assertEqual(len(held[1].running(self.now.timestamp())[0]), 2)
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        settings = override_settings(RETENTION_ARCHIVE_DIR=archive_dir.name,
+                                     RETENTION_DAYS={'mapviews': 30, 'activities': 30})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user('historian', password='pass12345')
+        self.business = Business.objects.create(name='Shop', owner=self.user, address='Lusaka',
+                                                category='retail', latitude=-15.4, longitude=28.3)
+        self.now = timezone.now()
+        self.views = [
+            MapView.objects.create(user=self.user, business=self.business,
+                                   viewed_at=self.now - timedelta(days=days, minutes=i), duration=i)
+            for i, days in enumerate([60, 60, 45, 31, 10, 0])
+        ]
+
+    def policy(self, name='mapviews'):
+        return retention.get_policy(name)
+
+    def test_archives_old_rows_in_daily_partitions(self):
+        total = counters.snapshot(since=self.now.date())[counters.MAP_VIEWS]['total']
+        self.assertEqual(retention.archive(self.policy(), batch_size=2), 4)
+        self.assertEqual(sorted(MapView.objects.values_list('duration', flat=True)), [4, 5])
+        days = retention.archived_days(self.policy())
+        self.assertEqual(days, sorted({timezone.localdate(v.viewed_at) for v in self.views[:4]}))
+        self.assertEqual(sum(retention.manifest(self.policy()).values()), 4)
+        # Archived views still count, before and after a rebuild
+        self.assertEqual(counters.snapshot(since=self.now.date())[counters.MAP_VIEWS]['total'], total)
+        counters.rebuild()
+        self.assertEqual(counters.snapshot(since=self.now.date())[counters.MAP_VIEWS]['total'], total)
+        self.assertEqual(retention.archive(self.policy()), 0)
+
+    def test_rows_reads_across_tiers(self):
+        retention.archive(self.policy())
+        rows = list(retention.rows('mapviews', business_id=self.business.id))
+        self.assertEqual([row['duration'] for row in rows], [1, 0, 2, 3, 4, 5])
+        self.assertEqual(rows[0]['viewed_at'], self.views[1].viewed_at)
+        self.assertEqual(rows[0]['user_id'], self.user.id)
+
+        start = timezone.localdate(self.views[2].viewed_at)
+        end = timezone.localdate(self.views[4].viewed_at)
+        self.assertEqual([row['duration'] for row in retention.rows('mapviews', start, end)], [2, 3, 4])
+        self.assertEqual(list(retention.rows('mapviews', user_id=self.user.id + 1)), [])
+
+    def test_repeats_after_an_interrupted_batch_are_dropped(self):
+        stale = list(MapView.objects.filter(duration__lt=2).order_by('viewed_at', 'id').values(*self.policy().columns))
+        # Written to the archive, but the process died before the delete
+        retention._append(retention.partition_path(self.policy(), timezone.localdate(stale[0]['viewed_at'])), stale)
+        retention.archive(self.policy())
+        self.assertEqual([row['duration'] for row in retention.rows('mapviews')], [1, 0, 2, 3, 4, 5])
+
+    def test_counts_survive_a_crash_around_the_delete(self):
+        policy = self.policy()
+        stale = list(MapView.objects.filter(duration__lt=2).values(*policy.columns))
+        day = timezone.localdate(stale[0]['viewed_at'])
+        retention._append(retention.partition_path(policy, day), stale)
+        pending = {day: [row['id'] for row in stale]}
+        # Died after the delete, before the counts were written
+        retention._write_manifest(policy, {}, pending)
+        MapView.objects.filter(duration=0).delete()
+        self.assertEqual(retention.archived_counts('mapviews'), {day: 1})
+        # Died before the delete: the rerun archives the rest, counted once
+        retention._write_manifest(policy, {day: 1}, {day: [row['id'] for row in stale if row['duration']]})
+        self.assertEqual(retention.archive(policy), 3)
+        self.assertEqual(sum(retention.manifest(policy).values()), 4)
+        self.assertEqual(retention.manifest(policy)[day], 2)
+
+    def test_activities_leave_the_feed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            old = Activity.objects.create(user=self.user, activity_type='login', description='Old')
+            Activity.objects.create(user=self.user, activity_type='login', description='New')
+        Activity.objects.filter(pk=old.pk).update(created_at=self.now - timedelta(days=40))
+        feed.invalidate(self.user.id)
+        self.assertEqual(len(feed.recent(self.user.id)), 2)
+
+        call_command('archive_history', policy=['activities'], stdout=io.StringIO())
+        self.assertEqual([e['description'] for e in feed.recent(self.user.id)], ['New'])
+        self.assertEqual([row['description'] for row in retention.rows('activities')], ['Old', 'New'])
+        self.assertEqual(MapView.objects.count(), len(self.views))
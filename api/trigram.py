@@ -0,0 +1,170 @@
+"""
+Typo-tolerant trigram search for businesses and promotions.
+
+Text is split into words and each word, padded the way pg_trgm pads it
+("  word "), into three-character trigrams. A document matches when at least
+THRESHOLD of the query's trigrams occur in it, so "safri lodg" still finds
+"Safari Lodge". Matches are ranked by that share, which is pg_trgm's word
+similarity in all but edge cases.
+
+On Postgres this is pg_trgm itself: GIN gin_trgm_ops indexes on the searched
+columns, the %> operator to filter and word_similarity() to rank. Elsewhere
+the trigrams live in the SearchTrigram side table, so a search is one index
+range per query trigram and a grouped count, not a LIKE scan of every row
+(and, for promotions, of the business join). The signals keep the side
+table in step; the rebuild_trigram_index command refills it.
+
+TrigramSearchFilter plugs this into DRF views in place of SearchFilter. It
+annotates search_rank, which KeysetPagination orders by unless another
+ordering is asked for.
+"""
+import math
+import re
+import unicodedata
+from functools import reduce
+from operator import or_
+
+from django.db import connections, router, transaction
+from django.db.models import Count, FloatField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Cast, Greatest
+from rest_framework import filters
+
+from .models import Business, Promotion, SearchTrigram
+
+BUSINESS_FIELDS = ['name', 'category', 'address']
+PROMOTION_FIELDS = ['title', 'description', 'business__name', 'business__category']
+
+# kind stored in SearchTrigram -> (model, document fields)
+DOCUMENTS = {
+    'business': (Business, BUSINESS_FIELDS),
+    'promotion': (Promotion, PROMOTION_FIELDS),
+}
+KINDS = {model: kind for kind, (model, _) in DOCUMENTS.items()}
+
+# pg_trgm's default pg_trgm.word_similarity_threshold
+THRESHOLD = 0.6
+BATCH_SIZE = 500
+MAX_QUERY_LENGTH = 100
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+def normalize(text):
+    """Case-fold and strip accents"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+def trigrams(text):
+    """The set of pg_trgm style trigrams in text"""
+    grams = set()
+    for word in _WORD.findall(normalize(text)):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def uses_pg_trgm(connection=None):
+    connection = connection or connections[router.db_for_read(SearchTrigram)]
+    return connection.vendor == 'postgresql'
+
+
+# Side table maintenance
+
+def reindex(kind, object_ids):
+    """Rewrite the side table rows for the given objects; missing ones are dropped"""
+    if uses_pg_trgm():
+        return
+    model, fields = DOCUMENTS[kind]
+    object_ids = list(object_ids)
+    for start in range(0, len(object_ids), BATCH_SIZE):
+        batch = object_ids[start:start + BATCH_SIZE]
+        SearchTrigram.objects.filter(kind=kind, object_id__in=batch).delete()
+        rows = model.objects.filter(pk__in=batch).values_list('pk', *fields)
+        SearchTrigram.objects.bulk_create([
+            SearchTrigram(kind=kind, object_id=row[0], trigram=gram)
+            for row in rows
+            for gram in trigrams(' '.join(value or '' for value in row[1:]))
+        ], batch_size=BATCH_SIZE * 10)
+
+
+def remove(kind, object_ids):
+    if not uses_pg_trgm():
+        SearchTrigram.objects.filter(kind=kind, object_id__in=list(object_ids)).delete()
+
+
+def rebuild(kinds=None):
+    """Refill the side table; returns {kind: documents indexed}"""
+    indexed = {}
+    for kind in kinds or DOCUMENTS:
+        model, _ = DOCUMENTS[kind]
+        if uses_pg_trgm():
+            indexed[kind] = 0
+            continue
+        with transaction.atomic():
+            SearchTrigram.objects.filter(kind=kind).delete()
+            ids = list(model.objects.order_by('pk').values_list('pk', flat=True))
+            reindex(kind, ids)
+        indexed[kind] = len(ids)
+    connection = connections[router.db_for_write(SearchTrigram)]
+    if connection.vendor == 'sqlite':
+        # Without statistics SQLite walks the whole kind in object order to
+        # group, instead of looking the query's trigrams up
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {SearchTrigram._meta.db_table}')
+    return indexed
+
+
+# Queries
+
+def _pg_search(queryset, text, fields, name):
+    from django.contrib.postgres.search import TrigramWordSimilarity
+
+    condition = reduce(or_, (Q(**{f'{field}__trigram_word_similar': text}) for field in fields))
+    scores = [TrigramWordSimilarity(text, field) for field in fields]
+    rank = Greatest(*scores) if len(scores) > 1 else scores[0]
+    return queryset.filter(condition).annotate(**{name: rank})
+
+
+def _side_table_search(queryset, text, kind, name):
+    grams = trigrams(text)
+    if not grams:
+        return queryset.none()
+    needed = math.ceil(THRESHOLD * len(grams))
+    hits = SearchTrigram.objects.filter(kind=kind, trigram__in=grams)
+    matching = (
+        hits.order_by().values('object_id')
+        .annotate(hits=Count('id')).filter(hits__gte=needed)
+        .values('object_id')
+    )
+    share = Subquery(
+        hits.filter(object_id=OuterRef('pk')).order_by()
+        .values('object_id').annotate(hits=Count('id')).values('hits')
+    )
+    return queryset.filter(pk__in=matching).annotate(
+        **{name: Cast(share, FloatField()) / Value(float(len(grams)))}
+    )
+
+
+def search(queryset, text, name='search_rank'):
+    """queryset narrowed to rows similar to text, with their similarity as name"""
+    text = (text or '').strip()[:MAX_QUERY_LENGTH]
+    kind = KINDS[queryset.model]
+    if uses_pg_trgm(connections[queryset.db]):
+        return _pg_search(queryset, text, DOCUMENTS[kind][1], name)
+    return _side_table_search(queryset, text, kind, name)
+
+
+class TrigramSearchFilter(filters.SearchFilter):
+    """SearchFilter replacement backed by the trigram index
+
+    ?search=<text> keeps rows similar to the text and annotates search_rank.
+    Searches the DOCUMENTS fields of the queryset's model.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').strip()
+        if not text:
+            return queryset
+        return search(queryset, text)
+
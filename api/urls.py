@@ -1,4 +1,4 @@
-# api/urls.py
+﻿# api/urls.py
 from django.urls import path
 from . import views
 
@@ -9,4 +9,18 @@ urlpatterns = [
     # Your item endpoints
     path('items/', views.ItemListView.as_view(), name='item-list'),
     path('items/<int:pk>/', views.ItemDetailView.as_view(), name='item-detail'),
+    
+    # Listings, searchable with ?search=
+    path('businesses/', views.BusinessListView.as_view(), name='business-list'),
+    path('promotions/', views.PromotionListView.as_view(), name='promotion-list'),
+    
+    # Geospatial
+    path('businesses/nearby/', views.nearby_businesses, name='nearby-businesses'),
+    
+    # Dashboards
+    path('dashboard/stats/', views.DashboardStatsView.as_view(), name='dashboard-stats'),
+    path('dashboard/overview/', views.DashboardOverviewView.as_view(), name='dashboard-overview'),
+    
+    # Map view ingestion
+    path('mapviews/', views.MapViewIngestView.as_view(), name='mapview-ingest'),
 ]
\ No newline at end of file
@@ -0,0 +1,206 @@
+"""
+Geohash indexing and radius / nearest-neighbour lookups for Business.
+
+Works on any database backend: candidates are narrowed in SQL by geohash
+cell ranges and a latitude/longitude bounding box, then refined with the
+exact haversine distance in Python. A limited lookup also orders the
+candidates in SQL by an approximate (equirectangular) distance and fetches
+only CANDIDATE_FACTOR times the limit, so a wide search over dense data
+never loads the whole box.
+"""
+import math
+
+from django.db.models import Case, ExpressionWrapper, F, FloatField, Q, When
+
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_PRECISION = 12
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Sorts after every geohash character; used as an exclusive prefix upper bound
+PREFIX_END = '{'
+
+MAX_RADIUS_KM = 500
+KNN_START_RADIUS_KM = 2
+# Candidates fetched per result wanted when a limit is pushed into SQL; the
+# margin covers rows the approximate ordering puts slightly too far out
+CANDIDATE_FACTOR = 4
+
+
+def encode(lat, lng, precision=GEOHASH_PRECISION):
+    """Encode a coordinate as a geohash string"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(lat_degrees, lng_degrees) spanned by one geohash cell"""
+    lat_bits = (5 * precision) // 2
+    lng_bits = 5 * precision - lat_bits
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat, lng, radius_km):
+    """Return (min_lat, max_lat, min_lng, max_lng) enclosing the radius.
+
+    Longitudes may fall outside [-180, 180] near the antimeridian; callers
+    split the range with longitude_ranges().
+    """
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = lat - dlat, lat + dlat
+    if min_lat <= -90 or max_lat >= 90:
+        # The circle covers a pole, so every longitude is in range
+        return max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0
+    dlng = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(lat))))
+    if dlng >= 180:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, lng - dlng, lng + dlng
+
+
+def longitude_ranges(min_lng, max_lng):
+    """Split a longitude span that crosses the antimeridian"""
+    if min_lng < -180:
+        return [(min_lng + 360, 180.0), (-180.0, max_lng)]
+    if max_lng > 180:
+        return [(min_lng, 180.0), (-180.0, max_lng - 360)]
+    return [(min_lng, max_lng)]
+
+
+def covering_cells(lat, lng, radius_km):
+    """Geohash prefixes whose cells together cover the search circle.
+
+    Picks the finest precision whose cell is at least as large as the bounding
+    box half-widths, so the 3x3 block of cells around the centre covers it.
+    Returns None when the circle is too large for a prefix filter to help.
+    """
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+    half_lat = (max_lat - min_lat) / 2
+    half_lng = (max_lng - min_lng) / 2
+    precision = 0
+    for p in range(GEOHASH_PRECISION, 0, -1):
+        cell_lat, cell_lng = cell_size(p)
+        if cell_lat >= half_lat and cell_lng >= half_lng:
+            precision = p
+            break
+    if precision < 2:
+        return None
+
+    cell_lat, cell_lng = cell_size(precision)
+    cells = set()
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            y = min(max(lat + dy * cell_lat, -90.0), 90.0)
+            x = (lng + dx * cell_lng + 180.0) % 360.0 - 180.0
+            cells.add(encode(y, x, precision))
+    return sorted(cells)
+
+
+def candidates(queryset, lat, lng, radius_km):
+    """Narrow a Business queryset to rows inside the cell block and bounding box"""
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+    queryset = queryset.filter(latitude__range=(min_lat, max_lat))
+
+    lng_filter = Q()
+    for low, high in longitude_ranges(min_lng, max_lng):
+        lng_filter |= Q(longitude__range=(low, high))
+    queryset = queryset.filter(lng_filter)
+
+    cells = covering_cells(lat, lng, radius_km)
+    if cells:
+        cell_filter = Q()
+        for cell in cells:
+            # Range form of startswith so the b-tree index is used on every backend
+            cell_filter |= Q(geohash__gte=cell, geohash__lt=cell + PREFIX_END)
+        queryset = queryset.filter(cell_filter)
+    return queryset
+
+
+def approximate_distance(lat, lng, radius_km):
+    """SQL expression ordering rows like their distance from (lat, lng).
+
+    Squared equirectangular distance in degrees, with longitudes across the
+    antimeridian from the bounding box shifted next to the centre. Only
+    arithmetic, so it runs natively on every backend.
+    """
+    _, _, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+    dlng = F('longitude') - lng
+    if min_lng < -180:
+        dlng = Case(When(longitude__gte=min_lng + 360, then=F('longitude') - 360 - lng),
+                    default=dlng, output_field=FloatField())
+    elif max_lng > 180:
+        dlng = Case(When(longitude__lte=max_lng - 360, then=F('longitude') + 360 - lng),
+                    default=dlng, output_field=FloatField())
+    dlat = F('latitude') - lat
+    scale = math.cos(math.radians(lat)) ** 2
+    return ExpressionWrapper(dlat * dlat + dlng * dlng * scale, output_field=FloatField())
+
+
+def within_radius(queryset, lat, lng, radius_km, limit=None):
+    """Return [(distance_km, id)] for rows within radius_km, nearest first.
+
+    With a limit, at most limit hits, from the CANDIDATE_FACTOR * limit
+    candidates nearest by approximate_distance().
+    """
+    rows = candidates(queryset, lat, lng, radius_km)
+    if limit is not None:
+        rows = rows.annotate(approximate=approximate_distance(lat, lng, radius_km))
+        rows = rows.order_by('approximate', 'id')[:limit * CANDIDATE_FACTOR]
+    rows = rows.values_list('id', 'latitude', 'longitude')
+    hits = []
+    for pk, row_lat, row_lng in rows.iterator():
+        distance = haversine_km(lat, lng, row_lat, row_lng)
+        if distance <= radius_km:
+            hits.append((distance, pk))
+    hits.sort()
+    return hits if limit is None else hits[:limit]
+
+
+def nearest(queryset, lat, lng, k, max_radius_km=MAX_RADIUS_KM):
+    """Return the k nearest [(distance_km, id)] within max_radius_km.
+
+    Searches a growing radius; once k rows lie inside the current radius they
+    are the true k nearest, because every row within it has been examined.
+    """
+    radius = min(KNN_START_RADIUS_KM, max_radius_km)
+    while True:
+        hits = within_radius(queryset, lat, lng, radius, limit=k)
+        if len(hits) >= k or radius >= max_radius_km:
+            return hits
+        radius = min(radius * 4, max_radius_km)
+
+
+def validate_coordinates(lat, lng):
+    if not -90 <= lat <= 90 or not -180 <= lng <= 180:
+        raise ValueError('Coordinates out of range')
+
+
+def resolve(queryset, hits):
+    """Fetch the rows for [(distance_km, id)] hits, keeping their order"""
+    objects = queryset.in_bulk([pk for _, pk in hits])
+    return [(distance, objects[pk]) for distance, pk in hits if pk in objects]
@@ -1,6 +1,19 @@
-﻿from django.http import JsonResponse
+﻿import math
+
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from . import dashboard, ingest, schedule
+from .models import Business, Promotion
+from .pagination import CREATED, ENDING, KeysetPagination
+from .serializers import BusinessListingSerializer, PromotionSerializer
+from .trigram import BUSINESS_FIELDS, PROMOTION_FIELDS, TrigramSearchFilter
+from .utils import geo
 
 # Add a test endpoint
 def test_api(request):
@@ -15,4 +28,166 @@ class ItemDetailView(APIView):
     def get(self, request, pk):
         return Response({"item": {"id": pk}})
 
+# Geospatial lookup
+def nearby_businesses(request):
+    """Businesses near ?lat=&lng=, nearest first
+
+    ?radius=<km> (default 10) returns the ?limit nearest in the circle;
+    ?k=<n> returns the n nearest instead, optionally capped by ?radius.
+    """
+    try:
+        lat = float(request.GET['lat'])
+        lng = float(request.GET['lng'])
+        k = int(request.GET['k']) if request.GET.get('k') else None
+        if k is not None and k < 1:
+            raise ValueError('k must be positive')
+        # k-nearest searches as far as needed unless a radius is given
+        default_radius = geo.MAX_RADIUS_KM if k else 10
+        radius = float(request.GET.get('radius', default_radius))
+        if not math.isfinite(radius) or radius <= 0:
+            raise ValueError('radius must be a positive number')
+        radius = min(radius, geo.MAX_RADIUS_KM)
+        limit = int(request.GET.get('limit', 50))
+        if limit < 1:
+            raise ValueError('limit must be positive')
+        limit = min(limit, 200)
+        geo.validate_coordinates(lat, lng)
+    except (KeyError, ValueError) as e:
+        return JsonResponse({'error': 'Invalid coordinates', 'details': str(e)}, status=400)
+
+    businesses = Business.objects.all()
+    if k:
+        hits = geo.nearest(businesses, lat, lng, min(k, 200), max_radius_km=radius)
+    else:
+        hits = geo.within_radius(businesses, lat, lng, radius, limit=limit)
+
+    results = [
+        {
+            'id': business.id,
+            'name': business.name,
+            'category': business.category,
+            'address': business.address,
+            'latitude': business.latitude,
+            'longitude': business.longitude,
+            'distance_km': round(distance, 3),
+        }
+        for distance, business in geo.resolve(businesses, hits[:limit])
+    ]
+    return JsonResponse({'results': results, 'count': len(results)})
+
+# Listings with typo-tolerant ?search=
+class BusinessListView(generics.ListAPIView):
+    """Businesses, newest first or ranked by ?search=; cursor paginated"""
+    queryset = Business.objects.all()
+    serializer_class = BusinessListingSerializer
+    filter_backends = [TrigramSearchFilter]
+    search_fields = BUSINESS_FIELDS
+    pagination_class = KeysetPagination
+    keyset_orderings = {'-created_at': CREATED, 'created_at': ('created_at', 'id')}
+
+class PromotionListView(generics.ListAPIView):
+    """Running promotions, newest first, ending soonest or ranked by ?search=
+
+    ?ending_within=<days> keeps those that end within that many days, and
+    ?starting_within=<days> lists the promotions starting within them instead.
+    """
+    serializer_class = PromotionSerializer
+    filter_backends = [TrigramSearchFilter]
+    search_fields = PROMOTION_FIELDS
+    pagination_class = KeysetPagination
+    keyset_orderings = {'-created_at': CREATED, 'end_date': ENDING}
+    windows = {'ending_within': schedule.ending_within, 'starting_within': schedule.starting_within}
+
+    def get_queryset(self):
+        ids = None
+        for param, resolve in self.windows.items():
+            value = self.request.query_params.get(param)
+            if not value:
+                continue
+            try:
+                days = float(value)
+                if not math.isfinite(days) or days < 0:
+                    raise ValueError
+            except ValueError:
+                raise ValidationError({param: 'Expected a number of days'})
+            window = set(resolve(days))
+            ids = window if ids is None else ids & window
+        if ids is None:
+            ids = schedule.active_ids()
+        return Promotion.objects.filter(pk__in=ids).select_related('business')
+
+# Dashboards, built from the precomputed counters
+class DashboardStatsView(APIView):
+    """Analytics dashboard statistics, cached for 5 minutes"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        stats = cache.get('dashboard_stats')
+        if stats is None:
+            stats = dashboard.stats()
+            cache.set('dashboard_stats', stats, 300)
+        return Response(stats)
+
+class DashboardOverviewView(APIView):
+    """Admin dashboard overview, cached for 1 minute"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        cache_key = f'admin_dashboard_{timezone.localdate()}'
+        overview = cache.get(cache_key)
+        if overview is None:
+            overview = dashboard.overview()
+            cache.set(cache_key, overview, 60)
+        return Response(overview)
+
+# Map view ingestion
+class MapViewIngestView(APIView):
+    """Accept a batch of map view events for buffered insertion
+
+    Body: {"events": [{"business": 1, "viewed_at": "<ISO 8601>", "duration": 12}, ...]}
+    Clients should send viewed_at so a retried batch is recognised as a duplicate.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    max_events = 500
+
+    def post(self, request):
+        events = request.data.get('events') if isinstance(request.data, dict) else request.data
+        if not isinstance(events, list) or not events:
+            return Response({'error': 'Expected a non-empty list of events'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(events) > self.max_events:
+            return Response({'error': f'At most {self.max_events} events per request'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        accepted = []
+        errors = []
+        for index, event in enumerate(events):
+            try:
+                business_id = int(event['business'])
+                duration = int(event.get('duration', 0))
+                viewed_at = event.get('viewed_at')
+                viewed_at = parse_datetime(viewed_at) if viewed_at else timezone.now()
+                if viewed_at is None or duration < 0:
+                    raise ValueError('invalid viewed_at or duration')
+                if timezone.is_naive(viewed_at):
+                    viewed_at = timezone.make_aware(viewed_at)
+            except (KeyError, TypeError, ValueError) as e:
+                errors.append({'index': index, 'error': str(e)})
+                continue
+            accepted.append({
+                'user_id': request.user.id,
+                'business_id': business_id,
+                'viewed_at': viewed_at.isoformat(),
+                'duration': duration,
+            })
+
+        known = set(Business.objects.filter(
+            id__in={event['business_id'] for event in accepted}
+        ).values_list('id', flat=True))
+        for event in accepted:
+            if event['business_id'] not in known:
+                errors.append({'business': event['business_id'], 'error': 'unknown business'})
+        accepted = [event for event in accepted if event['business_id'] in known]
 
+        if accepted:
+            ingest.buffer.add(accepted)
+        return Response({'accepted': len(accepted), 'errors': errors}, status=status.HTTP_202_ACCEPTED)
@@ -1,4 +1,6 @@
-﻿from rest_framework import viewsets, permissions, status, filters
+﻿# Not routed: api/urls.py serves api.views. Kept for reference; the
+# querysets below filter on an is_public field the models do not have.
+from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -8,11 +10,14 @@ from django.contrib.auth import login, logout
 from django.db.models import Count, Sum, Q, Avg
 from django.utils import timezone
 from datetime import timedelta, datetime
-from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404
 from django.db import transaction
 from django.core.cache import cache
 from .models import Business, Customer, Promotion, MapView, Analytics
+from .utils import geo
+from .pagination import CREATED, ENDING, KeysetPagination, paginate_sequence
+from . import dashboard, schedule
+from .trigram import BUSINESS_FIELDS, PROMOTION_FIELDS, TrigramSearchFilter
 from .serializers import (
     UserSerializer, RegisterSerializer, LoginSerializer,
     BusinessSerializer, CustomerSerializer, PromotionSerializer,
@@ -163,10 +168,12 @@ class UserAPI(viewsets.GenericViewSet):
 class BusinessViewSet(viewsets.ModelViewSet):
     serializer_class = BusinessSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['name', 'category', 'address', 'description']
-    ordering_fields = ['created_at', 'name', 'rating']
-    ordering = ['-created_at']
+    # Typo-tolerant, index-backed ?search=, ranked by similarity
+    filter_backends = [TrigramSearchFilter]
+    search_fields = BUSINESS_FIELDS
+    # Ordering is part of the cursor, so only keyset orders are offered
+    pagination_class = KeysetPagination
+    keyset_orderings = {'-created_at': CREATED, 'created_at': ('created_at', 'id')}
     
     def get_queryset(self):
         """Return businesses based on user permissions"""
@@ -185,48 +192,60 @@ class BusinessViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'], url_path='nearby')
     def nearby_businesses(self, request):
-        """Get businesses near coordinates (simplified)"""
+        """Get businesses near coordinates, nearest first
+        
+        ?radius=<km> pages through everything inside the circle (?cursor= from 'next');
+        ?k=<n> returns the n nearest businesses instead, optionally capped by ?radius.
+        """
         try:
-            lat = float(request.query_params.get('lat', 0))
-            lng = float(request.query_params.get('lng', 0))
-            radius = float(request.query_params.get('radius', 10))  # Default 10km
-            
-            # Simple filtering (in production use GeoDjango)
-            businesses = Business.objects.all()
-            
-            # Add pagination
-            page = request.query_params.get('page', 1)
-            page_size = request.query_params.get('page_size', 20)
-            
-            paginator = Paginator(businesses, page_size)
-            page_obj = paginator.get_page(page)
-            
-            serializer = self.get_serializer(page_obj, many=True)
-            
-            return Response({
-                'results': serializer.data,
-                'count': paginator.count,
-                'next': page_obj.next_page_number() if page_obj.has_next() else None,
-                'previous': page_obj.previous_page_number() if page_obj.has_previous() else None,
-                'current_page': page_obj.number,
-                'total_pages': paginator.num_pages
-            })
-            
-        except ValueError as e:
+            lat = float(request.query_params['lat'])
+            lng = float(request.query_params['lng'])
+            k = request.query_params.get('k')
+            k = int(k) if k else None
+            default_radius = geo.MAX_RADIUS_KM if k else 10  # Default 10km
+            radius = min(float(request.query_params.get('radius', default_radius)), geo.MAX_RADIUS_KM)
+            geo.validate_coordinates(lat, lng)
+        except (KeyError, ValueError) as e:
             return Response({
                 'error': 'Invalid coordinates',
                 'details': str(e)
             }, status=status.HTTP_400_BAD_REQUEST)
+        
+        businesses = Business.objects.select_related('owner')
+        
+        if k:
+            hits = geo.nearest(businesses, lat, lng, min(k, 100), max_radius_km=radius)
+            page_hits = hits
+            pagination = {'count': len(hits)}
+        else:
+            hits = geo.within_radius(businesses, lat, lng, radius)
+            try:
+                page_size = min(max(int(request.query_params.get('page_size', 20)), 1), 100)
+                # Hits are sorted by (distance, id), which doubles as the cursor key
+                page = paginate_sequence(hits, key=tuple, cursor=request.query_params.get('cursor'),
+                                         page_size=page_size)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            page_hits = page.results
+            pagination = {
+                'count': len(hits),
+                'next': page.next_cursor,
+                'previous': page.previous_cursor,
+            }
+        
+        results = []
+        for distance, business in geo.resolve(businesses, page_hits):
+            data = self.get_serializer(business).data
+            data['distance_km'] = round(distance, 3)
+            results.append(data)
+        
+        return Response({'results': results, **pagination})
     
     @action(detail=True, methods=['get'], url_path='promotions')
     def business_promotions(self, request, pk=None):
         """Get all promotions for a specific business"""
         business = self.get_object()
-        promotions = Promotion.objects.filter(
-            business=business,
-            is_active=True,
-            end_date__gte=timezone.now()
-        )
+        promotions = Promotion.objects.filter(pk__in=schedule.active_ids(business_id=business.pk))
         
         serializer = PromotionSerializer(promotions, many=True)
         return Response(serializer.data)
@@ -235,17 +254,18 @@ class BusinessViewSet(viewsets.ModelViewSet):
 class PromotionViewSet(viewsets.ModelViewSet):
     serializer_class = PromotionSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['title', 'description', 'business__name', 'business__category']
-    ordering_fields = ['created_at', 'start_date', 'end_date', 'discount_value']
-    ordering = ['-created_at']
+    filter_backends = [TrigramSearchFilter]
+    search_fields = PROMOTION_FIELDS
+    pagination_class = KeysetPagination
+    keyset_orderings = {'-created_at': CREATED, 'end_date': ENDING}
     
     def get_queryset(self):
         """Return promotions based on visibility"""
-        queryset = Promotion.objects.filter(
-            is_active=True,
-            end_date__gte=timezone.now()
-        ).select_related('business', 'business__owner')
+        queryset = Promotion.objects.select_related('business', 'business__owner')
+        # Listings show running promotions; owners still open and edit the
+        # rest through the detail routes
+        if self.action in ('list', 'active_promotions'):
+            queryset = queryset.filter(pk__in=schedule.active_ids())
         
         # Filter by business owner for non-staff users
         if not self.request.user.is_staff:
@@ -268,7 +288,10 @@ class PromotionViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'], url_path='active')
     def active_promotions(self, request):
-        """Get all active promotions with pagination"""
+        """Get all active promotions, newest first or ?ordering=end_date
+
+        Cursor paginated: follow 'next'; ?count=1 adds an estimated total.
+        """
         promotions = self.get_queryset()
         
         # Apply additional filters
@@ -276,24 +299,11 @@ class PromotionViewSet(viewsets.ModelViewSet):
         if category:
             promotions = promotions.filter(business__category=category)
         
-        # Pagination
-        page = request.query_params.get('page', 1)
-        page_size = request.query_params.get('page_size', 20)
-        
-        paginator = Paginator(promotions, page_size)
-        page_obj = paginator.get_page(page)
-        
-        serializer = self.get_serializer(page_obj, many=True)
-        
-        return Response({
-            'results': serializer.data,
-            'count': paginator.count,
-            'total_pages': paginator.num_pages,
-            'current_page': page_obj.number
-        })
+        page = self.paginate_queryset(promotions)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
     
-    @action(detail=True, methods=['post'], url_path='redeem')
-    @permission_classes([permissions.IsAuthenticated])
+    @action(detail=True, methods=['post'], url_path='redeem', permission_classes=[permissions.IsAuthenticated])
     def redeem_promotion(self, request, pk=None):
         """Redeem a promotion (simplified)"""
         promotion = self.get_object()
@@ -342,77 +352,7 @@ class AnalyticsViewSet(viewsets.ReadOnlyModelViewSet):
         if cached_data:
             return Response(cached_data)
         
-        today = timezone.now().date()
-        week_ago = today - timedelta(days=7)
-        month_ago = today - timedelta(days=30)
-        
-        # Calculate statistics
-        stats = {
-            'users': {
-                'total': User.objects.count(),
-                'active_today': User.objects.filter(last_login__date=today).count(),
-                'active_this_week': User.objects.filter(last_login__gte=week_ago).count(),
-                'new_today': User.objects.filter(date_joined__date=today).count(),
-                'new_this_week': User.objects.filter(date_joined__gte=week_ago).count(),
-            },
-            'businesses': {
-                'total': Business.objects.count(),
-                'active_today': Business.objects.filter(
-                    updated_at__date=today
-                ).count(),
-                'new_this_week': Business.objects.filter(
-                    created_at__gte=week_ago
-                ).count(),
-                'by_category': Business.objects.values('category').annotate(
-                    count=Count('id')
-                ).order_by('-count')[:10],
-            },
-            'promotions': {
-                'total_active': Promotion.objects.filter(
-                    is_active=True,
-                    end_date__gte=timezone.now()
-                ).count(),
-                'ending_soon': Promotion.objects.filter(
-                    is_active=True,
-                    end_date__range=[today, today + timedelta(days=3)]
-                ).count(),
-                'new_this_week': Promotion.objects.filter(
-                    created_at__gte=week_ago
-                ).count(),
-            },
-            'revenue': {
-                'today': Analytics.objects.filter(date=today).aggregate(
-                    total=Sum('revenue')
-                )['total'] or 0,
-                'this_week': Analytics.objects.filter(
-                    date__gte=week_ago
-                ).aggregate(total=Sum('revenue'))['total'] or 0,
-                'this_month': Analytics.objects.filter(
-                    date__gte=month_ago
-                ).aggregate(total=Sum('revenue'))['total'] or 0,
-                'average_daily': Analytics.objects.filter(
-                    date__gte=month_ago
-                ).aggregate(avg=Avg('revenue'))['avg'] or 0,
-            },
-            'engagement': {
-                'map_views_today': MapView.objects.filter(
-                    viewed_at__date=today
-                ).count(),
-                'map_views_this_week': MapView.objects.filter(
-                    viewed_at__gte=week_ago
-                ).count(),
-                'promotion_views_today': 0,  # Add your model for this
-                'promotion_redemptions_today': 0,  # Add your model for this
-            },
-            'timestamps': {
-                'generated_at': timezone.now().isoformat(),
-                'date_range': {
-                    'today': today.isoformat(),
-                    'week_ago': week_ago.isoformat(),
-                    'month_ago': month_ago.isoformat()
-                }
-            }
-        }
+        stats = dashboard.stats()
         
         # Cache for 5 minutes
         cache.set(cache_key, stats, 300)
@@ -506,34 +446,7 @@ class AdminDashboardViewSet(viewsets.ViewSet):
         if cached_data:
             return Response(cached_data)
         
-        today = timezone.now().date()
-        
-        overview = {
-            'summary': {
-                'total_customers': User.objects.count(),
-                'total_businesses': Business.objects.count(),
-                'active_promotions': Promotion.objects.filter(
-                    is_active=True,
-                    end_date__gte=timezone.now()
-                ).count(),
-                'monthly_revenue': Analytics.objects.filter(
-                    date__month=today.month,
-                    date__year=today.year
-                ).aggregate(total=Sum('revenue'))['total'] or 0,
-            },
-            'today': {
-                'new_users': User.objects.filter(date_joined__date=today).count(),
-                'new_businesses': Business.objects.filter(created_at__date=today).count(),
-                'map_views': MapView.objects.filter(viewed_at__date=today).count(),
-                'promotions_created': Promotion.objects.filter(created_at__date=today).count(),
-            },
-            'system': {
-                'active_sessions': 0,  # Would need session tracking
-                'api_requests_today': 0,  # Would need request logging
-                'uptime': '99.9%',  # Mock data
-                'last_backup': (today - timedelta(days=1)).isoformat(),
-            }
-        }
+        overview = dashboard.overview()
         
         # Cache for 1 minute
         cache.set(cache_key, overview, 60)
@@ -0,0 +1,221 @@
+"""
+Availability index for property bookings.
+
+Each property's non-cancelled bookings are collapsed into a sorted list of
+disjoint occupied ranges and cached, so "is property X free from A to B" is a
+bisect over that list instead of a scan of the bookings table. The same
+index backs the compact month calendars (calendar_bitmap / calendar_runs).
+"""
+import base64
+import bisect
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Booking, Property
+
+CACHE_PREFIX = 'availability:property'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+# Bookings in these states do not hold the dates
+RELEASED_STATUSES = ('cancelled',)
+
+
+def occupying_bookings():
+    """Bookings that block their dates (everything except cancelled)"""
+    return Booking.objects.exclude(status__in=RELEASED_STATUSES)
+
+
+def validate_range(check_in, check_out):
+    """Raise ValueError unless check_out is after check_in"""
+    if check_in is None or check_out is None:
+        raise ValueError('check_in and check_out are required')
+    if check_out <= check_in:
+        raise ValueError('check_out must be after check_in')
+
+
+def validate_stay(check_in, check_out):
+    """validate_range() for stays, which also cannot start in the past.
+
+    The indexes only hold bookings that have not checked out by today, so
+    they cannot answer for earlier dates.
+    """
+    validate_range(check_in, check_out)
+    if check_in < timezone.localdate():
+        raise ValueError('check_in cannot be in the past')
+
+
+class OccupancyIndex:
+    """Sorted, merged [start, end) occupied ranges for one property.
+
+    Dates are stored as ordinals so the index pickles small and compares fast.
+    A booking's check_out day is free for the next check_in.
+    """
+
+    def __init__(self, ranges=()):
+        self.starts = []
+        self.ends = []
+        for start, end in sorted(ranges):
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    @classmethod
+    def from_dates(cls, rows):
+        """Build from (check_in, check_out) date pairs"""
+        return cls((a.toordinal(), b.toordinal()) for a, b in rows if b > a)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def is_free(self, check_in, check_out):
+        start, end = check_in.toordinal(), check_out.toordinal()
+        i = bisect.bisect_right(self.starts, start)
+        # The run starting at or before check_in must end by check_in
+        if i and self.ends[i - 1] > start:
+            return False
+        # The next run must start at or after check_out
+        if i < len(self.starts) and self.starts[i] < end:
+            return False
+        return True
+
+    def occupied(self, check_in, check_out):
+        """Yield (start, end) ordinal runs overlapping [check_in, check_out)"""
+        start, end = check_in.toordinal(), check_out.toordinal()
+        i = max(bisect.bisect_right(self.starts, start) - 1, 0)
+        while i < len(self.starts) and self.starts[i] < end:
+            if self.ends[i] > start:
+                yield self.starts[i], self.ends[i]
+            i += 1
+
+    def __getstate__(self):
+        return (self.starts, self.ends)
+
+    def __setstate__(self, state):
+        self.starts, self.ends = state
+
+
+def _cache_key(property_id):
+    return f'{CACHE_PREFIX}:{property_id}'
+
+
+def _load_indexes(property_ids):
+    """Build indexes for the given properties with a single query"""
+    ranges = {property_id: [] for property_id in property_ids}
+    rows = occupying_bookings().filter(
+        property_id__in=property_ids,
+        check_out__gt=timezone.localdate(),
+    ).values_list('property_id', 'check_in', 'check_out')
+    for property_id, check_in, check_out in rows:
+        ranges[property_id].append((check_in, check_out))
+    return {
+        property_id: OccupancyIndex.from_dates(pairs)
+        for property_id, pairs in ranges.items()
+    }
+
+
+def occupancy_indexes(property_ids):
+    """Return {property_id: OccupancyIndex}, building cache misses in one query"""
+    property_ids = list(dict.fromkeys(property_ids))
+    keys = {_cache_key(property_id): property_id for property_id in property_ids}
+    cached = cache.get_many(keys)
+    indexes = {keys[key]: index for key, index in cached.items()}
+
+    missing = [property_id for property_id in property_ids if property_id not in indexes]
+    if missing:
+        built = _load_indexes(missing)
+        cache.set_many(
+            {_cache_key(property_id): index for property_id, index in built.items()},
+            CACHE_TIMEOUT,
+        )
+        indexes.update(built)
+    return indexes
+
+
+def occupancy_index(property_id):
+    return occupancy_indexes([property_id])[property_id]
+
+
+def invalidate(property_id):
+    """Drop the cached index once the surrounding transaction commits"""
+    transaction.on_commit(lambda: cache.delete(_cache_key(property_id)))
+
+
+def is_available(property_id, check_in, check_out):
+    """Is the property free for every night from check_in to check_out?"""
+    validate_stay(check_in, check_out)
+    return occupancy_index(property_id).is_free(check_in, check_out)
+
+
+def filter_available(property_ids, check_in, check_out):
+    """Return the active properties among property_ids free for the whole stay, in order"""
+    validate_stay(check_in, check_out)
+    active = set(
+        Property.objects.filter(pk__in=property_ids, is_active=True).values_list('pk', flat=True)
+    )
+    property_ids = [property_id for property_id in property_ids if property_id in active]
+    indexes = occupancy_indexes(property_ids)
+    return [
+        property_id for property_id in property_ids
+        if indexes[property_id].is_free(check_in, check_out)
+    ]
+
+
+def available_properties(check_in, check_out, queryset=None):
+    """Queryset of properties with no occupying booking overlapping the stay.
+
+    Runs as one anti-join; the overlap test uses the booking date index.
+    """
+    validate_stay(check_in, check_out)
+    if queryset is None:
+        queryset = Property.objects.filter(is_active=True)
+    blocked = occupying_bookings().filter(
+        check_in__lt=check_out,
+        check_out__gt=check_in,
+    ).values('property_id')
+    return queryset.exclude(id__in=blocked)
+
+
+def unavailable_runs(property_id, start, days):
+    """(first, last) day offsets from start, end exclusive, that cannot be booked.
+
+    Days before today are unavailable; the rest come from the cached index.
+    """
+    end = start + timedelta(days=days)
+    origin = start.toordinal()
+    runs = []
+    past = min(max((timezone.localdate() - start).days, 0), days)
+    if past:
+        runs.append((0, past))
+    for run_start, run_end in occupancy_index(property_id).occupied(start, end):
+        first, last = max(run_start - origin, 0), min(run_end - origin, days)
+        if runs and first <= runs[-1][1]:
+            runs[-1] = (runs[-1][0], max(runs[-1][1], last))
+        else:
+            runs.append((first, last))
+    return runs
+
+
+def calendar_bitmap(runs, days):
+    """Base64 bitmap, one bit per day (1 = unavailable), most significant bit first"""
+    bits = bytearray((days + 7) // 8)
+    for first, last in runs:
+        for day in range(first, last):
+            bits[day >> 3] |= 0x80 >> (day & 7)
+    return base64.b64encode(bytes(bits)).decode('ascii')
+
+
+def calendar_runs(runs, days):
+    """Alternating run lengths, starting with available days (possibly 0)"""
+    lengths = []
+    position = 0
+    for first, last in runs:
+        lengths.extend([first - position, last - first])
+        position = last
+    if position < days:
+        lengths.append(days - position)
+    return lengths
@@ -0,0 +1,368 @@
+"""
+Streaming bulk import and export of Property listings, and streaming export
+of Booking rows, as CSV or JSONL.
+
+Export walks the queryset with iterator(chunk_size=...) and yields one
+encoded line at a time, so a StreamingHttpResponse or a file write never
+holds more than a chunk of rows.
+
+Import reads rows lazily, validates each one with Model.clean_fields() and
+writes in batches: one query finds which ids already exist, then one
+bulk_update and one bulk_create per batch, each batch in its own transaction.
+Rows with an id update that listing (it must belong to the importing owner
+unless the import is unrestricted); rows without one create a listing. Bad
+rows are reported by line number and skipped. In CSV, amenities is a JSON
+list, e.g. ["wifi", "pool"].
+
+Booking exports join the property and customer columns in the same query and
+run in id order, so an interrupted export resumes with after=<last id seen>.
+"""
+import csv
+import json
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db.models import F
+from django.utils import timezone
+
+from zamreach.db import run_serialized
+
+from . import caching, fulltext
+from .models import Booking, Property
+
+FORMATS = ('csv', 'jsonl')
+CHUNK_SIZE = 2000
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+FIELDS = [
+    'id', 'name', 'property_type', 'location', 'city', 'country',
+    'price_per_night', 'max_guests', 'bedrooms', 'bathrooms', 'amenities',
+    'description', 'is_active', 'is_verified',
+]
+INTEGER_FIELDS = {'max_guests', 'bedrooms', 'bathrooms'}
+BOOLEAN_FIELDS = {'is_active', 'is_verified'}
+
+# Exported booking column -> lookup, joined in the export query
+BOOKING_COLUMNS = {
+    'id': 'id',
+    'created_at': 'created_at',
+    'status': 'status',
+    'check_in': 'check_in',
+    'check_out': 'check_out',
+    'guests': 'guests',
+    'total_price': 'total_price',
+    'payment_status': 'payment_status',
+    'payment_method': 'payment_method',
+    'transaction_id': 'transaction_id',
+    'property_id': 'property_id',
+    'property_name': 'property__name',
+    'property_city': 'property__city',
+    'customer_id': 'customer_id',
+    'customer_username': 'customer__username',
+    'customer_email': 'customer__email',
+}
+BOOKING_STATUSES = [value for value, _ in Booking.STATUS_CHOICES]
+
+
+def format_for(name, default='csv'):
+    """Guess the format from a file name or an explicit value"""
+    name = (name or '').lower()
+    if name in FORMATS:
+        return name
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+# Export
+
+class _Echo:
+    """File-like object that hands back what csv.writer writes"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, with_owner=False):
+    """Yield listing dicts in id order, a chunk of rows at a time"""
+    columns = FIELDS + (['owner__username'] if with_owner else [])
+    for row in queryset.order_by('id').values(*columns).iterator(chunk_size=CHUNK_SIZE):
+        if with_owner:
+            row['owner'] = row.pop('owner__username')
+        yield row
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _csv_lines(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([_plain(row[name]) for name in header])
+
+
+def _jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps({name: _plain(value) for name, value in row.items()}) + '\n'
+
+
+def _with_json_amenities(rows):
+    for row in rows:
+        row['amenities'] = json.dumps(row['amenities'] or [])
+        yield row
+
+
+def stream_csv(queryset, with_owner=False):
+    header = FIELDS + (['owner'] if with_owner else [])
+    return _csv_lines(header, _with_json_amenities(export_rows(queryset, with_owner)))
+
+
+def stream_jsonl(queryset, with_owner=False):
+    return _jsonl_lines(export_rows(queryset, with_owner))
+
+
+def stream(queryset, fmt, with_owner=False):
+    if fmt not in FORMATS:
+        raise ValueError(f'format must be one of: {", ".join(FORMATS)}')
+    return (stream_csv if fmt == 'csv' else stream_jsonl)(queryset, with_owner)
+
+
+def filter_bookings(bookings, start=None, end=None, statuses=None, after=None):
+    """Narrow a Booking queryset for export.
+
+    start/end bound check_in to [start, end), statuses is a list of
+    Booking statuses and after resumes past that booking id.
+    """
+    if start and end and end <= start:
+        raise ValueError('end must be after start')
+    unknown = sorted(set(statuses or ()) - set(BOOKING_STATUSES))
+    if unknown:
+        raise ValueError(f'Unknown status: {", ".join(unknown)}')
+    if start:
+        bookings = bookings.filter(check_in__gte=start)
+    if end:
+        bookings = bookings.filter(check_in__lt=end)
+    if statuses:
+        bookings = bookings.filter(status__in=statuses)
+    if after is not None:
+        bookings = bookings.filter(id__gt=after)
+    return bookings
+
+
+def booking_rows(bookings):
+    """Yield booking dicts in id order, a chunk of rows at a time"""
+    fields = [name for name, lookup in BOOKING_COLUMNS.items() if name == lookup]
+    joined = {name: F(lookup) for name, lookup in BOOKING_COLUMNS.items() if name != lookup}
+    return bookings.order_by('id').values(*fields, **joined).iterator(chunk_size=CHUNK_SIZE)
+
+
+def stream_bookings(bookings, fmt):
+    if fmt not in FORMATS:
+        raise ValueError(f'format must be one of: {", ".join(FORMATS)}')
+    if fmt == 'csv':
+        return _csv_lines(list(BOOKING_COLUMNS), booking_rows(bookings))
+    return _jsonl_lines(booking_rows(bookings))
+
+
+# Import
+
+@dataclass
+class ImportReport:
+    created: int = 0
+    updated: int = 0
+    failed: int = 0
+    errors: list = field(default_factory=list)
+    dry_run: bool = False
+
+    def error(self, line, messages):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': messages})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+            'dry_run': self.dry_run,
+        }
+
+
+def read_rows(lines, fmt):
+    """Yield (line number, row dict) from an iterable of text lines"""
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                row = e
+            yield number, row
+    else:
+        raise ValueError(f'format must be one of: {", ".join(FORMATS)}')
+
+
+def _convert(row):
+    """Coerce a raw row into field values, raising ValidationError"""
+    if not isinstance(row, dict):
+        raise ValidationError({'row': ['Expected an object']})
+    values, errors = {}, {}
+    for name in FIELDS + ['owner']:
+        if name not in row or row[name] is None or row[name] == '':
+            continue
+        raw = row[name]
+        try:
+            if name == 'id' or name in INTEGER_FIELDS:
+                values[name] = int(raw)
+            elif name in BOOLEAN_FIELDS:
+                values[name] = raw if isinstance(raw, bool) else str(raw).strip().lower() in ('1', 'true', 'yes')
+            elif name == 'amenities':
+                amenities = json.loads(raw) if isinstance(raw, str) else raw
+                if not isinstance(amenities, list) or not all(isinstance(a, str) for a in amenities):
+                    raise ValueError('Expected a list of strings')
+                values[name] = amenities
+            else:
+                values[name] = str(raw).strip() if isinstance(raw, str) else raw
+        except (TypeError, ValueError) as e:
+            errors[name] = [str(e)]
+    if errors:
+        raise ValidationError(errors)
+    return values
+
+
+class PropertyImporter:
+    """Validate and write listings in batches.
+
+    owner: the account new listings belong to; with restrict_to_owner,
+    updates are also limited to its listings. allow_owner_column lets rows
+    name their owner by username (admin imports).
+    """
+
+    def __init__(self, owner=None, restrict_to_owner=True, allow_owner_column=False,
+                 batch_size=BATCH_SIZE, dry_run=False):
+        self.owner = owner
+        self.restrict_to_owner = restrict_to_owner and owner is not None
+        self.allow_owner_column = allow_owner_column
+        self.batch_size = batch_size
+        self.report = ImportReport(dry_run=dry_run)
+        self._owners = {}
+
+    def _owner_id(self, username):
+        if username not in self._owners:
+            self._owners[username] = User.objects.filter(username=username).values_list('id', flat=True).first()
+        return self._owners[username]
+
+    def _build(self, values):
+        """(unsaved Property, fields given, owner given) for a converted row"""
+        username = values.pop('owner', None)
+        if not self.allow_owner_column:
+            username = None
+            values.pop('is_verified', None)
+        owner_id = self.owner.id if self.owner else None
+        if username:
+            owner_id = self._owner_id(username)
+            if owner_id is None:
+                raise ValidationError({'owner': [f'Unknown user: {username}']})
+        given = set(values) - {'id'}
+
+        prop = Property(**values)
+        prop.owner_id = owner_id
+        if prop.id is None:
+            if owner_id is None:
+                raise ValidationError({'owner': ['New listings need an owner']})
+            prop.clean_fields(exclude=['owner'])
+        else:
+            # Partial rows update only the columns they carry
+            prop.clean_fields(exclude=[f.name for f in Property._meta.fields if f.name not in given])
+        return prop, given, bool(username)
+
+    def run(self, rows):
+        batch = []
+        for line, row in rows:
+            try:
+                if isinstance(row, Exception):
+                    raise ValidationError({'row': [f'Invalid JSON: {row}']})
+                prop, given, owner_given = self._build(_convert(row))
+                batch.append((line, prop, given, owner_given))
+            except ValidationError as e:
+                self.report.error(line, e.message_dict if hasattr(e, 'error_dict') else {'row': e.messages})
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+        return self.report
+
+    def _write(self, batch):
+        ids = [prop.id for _, prop, _, _ in batch if prop.id is not None]
+        existing = Property.objects.filter(id__in=ids)
+        if self.restrict_to_owner:
+            existing = existing.filter(owner=self.owner)
+        existing = set(existing.values_list('id', flat=True))
+
+        to_create, to_update, update_fields = [], [], {'updated_at'}
+        for line, prop, given, owner_given in batch:
+            if prop.id is None:
+                to_create.append(prop)
+            elif prop.id not in existing:
+                self.report.error(line, {'id': [f'No listing {prop.id} you can update']})
+            else:
+                if owner_given:
+                    given.add('owner')
+                to_update.append((prop, given))
+                update_fields |= given
+
+        if self.report.dry_run:
+            self.report.created += len(to_create)
+            self.report.updated += len(to_update)
+            return
+
+        def write():
+            if to_create:
+                Property.objects.bulk_create(to_create, batch_size=self.batch_size)
+            if to_update:
+                now = timezone.now()
+                current = Property.objects.in_bulk([prop.id for prop, _ in to_update])
+                rows = []
+                for prop, given in to_update:
+                    # Columns missing from the row keep their stored values
+                    row = current[prop.id]
+                    for name in given:
+                        setattr(row, 'owner_id' if name == 'owner' else name,
+                                getattr(prop, 'owner_id' if name == 'owner' else name))
+                    row.updated_at = now
+                    rows.append(row)
+                Property.objects.bulk_update(rows, sorted(update_fields), batch_size=self.batch_size)
+            # Bulk writes skip the model signals
+            fulltext.reindex([prop.id for prop in to_create] + [prop.id for prop, _ in to_update])
+
+        run_serialized(write)
+        self.report.created += len(to_create)
+        self.report.updated += len(to_update)
+        caching.bump(caching.PROPERTIES, *(
+            scope for prop, _ in to_update
+            for scope in (caching.property_scope(prop.id), caching.rates_scope(prop.id))
+        ))
+
+
+def import_rows(lines, fmt, **options):
+    """Import from an iterable of text lines; returns an ImportReport"""
+    return PropertyImporter(**options).run(read_rows(lines, fmt))
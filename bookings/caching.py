@@ -0,0 +1,126 @@
+"""
+Versioned page and fragment caching for bookings pages.
+
+Cached entries embed the current version of every scope they depend on
+('properties' for listings, 'property:<id>' for one property). Signals bump
+those versions when a Property, Booking or Review changes, which orphans the
+old entries instead of having to find and delete them.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+VERSION_PREFIX = 'cachever'
+PAGE_PREFIX = 'page'
+FRAGMENT_PREFIX = 'fragment'
+
+# Scopes
+PROPERTIES = 'properties'
+
+
+def property_scope(property_id):
+    return f'property:{property_id}'
+
+
+def rates_scope(property_id):
+    """Pricing inputs only, so bookings do not invalidate quotes"""
+    return f'rates:{property_id}'
+
+
+def _timeout():
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
+
+
+def _version_key(scope):
+    return f'{VERSION_PREFIX}:{scope}'
+
+
+def _new_version():
+    # Never reuses a number, even if the version key itself is evicted
+    return time.time_ns()
+
+
+def get_versions(*scopes):
+    """Current version of each scope, as a tuple in the given order"""
+    keys = [_version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        if key not in found:
+            cache.add(key, _new_version(), None)
+            found[key] = cache.get(key)
+        versions.append(found[key])
+    return tuple(versions)
+
+
+def bump(*scopes):
+    """Invalidate everything cached under the given scopes"""
+    for scope in scopes:
+        key = _version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
+
+
+def _key(prefix, name, parts, versions):
+    digest = hashlib.md5(repr((parts, versions)).encode(), usedforsecurity=False).hexdigest()
+    return f'{prefix}:{name}:{digest}'
+
+
+def cached_fragment(name, scopes, render, timeout=None, vary=()):
+    """Return render() output, cached until one of the scopes is bumped"""
+    key = _key(FRAGMENT_PREFIX, name, tuple(vary), get_versions(*scopes))
+    content = cache.get(key)
+    if content is None:
+        content = render()
+        cache.set(key, content, timeout or _timeout())
+    return content
+
+
+def cached_render(request, template_name, context=None, scopes=(), timeout=None):
+    """render() that reuses the rendered template while its scopes are unchanged.
+
+    Only for templates whose output does not depend on the request (no user
+    details, no csrf_token), since one rendering is served to everyone.
+    """
+    context = context or {}
+    content = cached_fragment(
+        template_name,
+        scopes,
+        lambda: render_to_string(template_name, context, request),
+        timeout=timeout,
+        vary=tuple(sorted(context.items())),
+    )
+    return HttpResponse(content)
+
+
+def cache_page_for_anonymous(*scopes, timeout=None):
+    """Cache whole GET responses for anonymous visitors.
+
+    Scopes may reference view kwargs, e.g. 'property:{property_id}'.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+
+            resolved = [scope.format(**kwargs) for scope in scopes]
+            key = _key(PAGE_PREFIX, view.__name__, request.get_full_path(), get_versions(*resolved))
+            response = cache.get(key)
+            if response is not None:
+                return response
+
+            response = view(request, *args, **kwargs)
+            # Responses that set cookies (e.g. a fresh CSRF token) are per-visitor
+            if response.status_code == 200 and not response.streaming and not response.cookies:
+                cache.set(key, response, timeout or _timeout())
+            return response
+        return wrapper
+    return decorator
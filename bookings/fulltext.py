@@ -0,0 +1,383 @@
+"""
+Full-text search over Property name, location, city and description.
+
+Three backends sit behind the same functions:
+
+* SQLite: an FTS5 table, bookings_property_fts, with rowid = property id,
+  the unicode61 tokenizer with diacritics removed and prefix indexes for
+  2 and 3 character prefixes. Ranked with bm25().
+* Postgres: a side table, bookings_property_search, holding one weighted
+  tsvector per property under a GIN index. Ranked with ts_rank_cd().
+* Anything else, or SQLite built without FTS5: an inverted index built in
+  process from the properties table. When the property listings version
+  changes (see caching.PROPERTIES) it is refreshed from the rows updated
+  since, rather than rebuilt, and the new index replaces the old in one
+  assignment, so concurrent searches never see it half built. Matches are
+  ranked in Python and only the requested page is read from the table.
+
+Text is case-folded and stripped of accents before it is indexed or
+searched, so "Chipata cafe" matches "Café, Chipata". Every query term must
+match, and every term matches as a prefix ("livings" finds Livingstone).
+Common English words such as "near" and "with" are dropped from queries.
+
+The Property signals keep the index in step with saves and deletes; bulk
+writes call reindex() themselves, and the rebuild_search_index command
+rebuilds it from scratch.
+"""
+import bisect
+import math
+import re
+import unicodedata
+from datetime import timedelta
+
+from django.db import connections, router, transaction
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from . import caching
+from .models import Property
+
+FTS_TABLE = 'bookings_property_fts'
+TSVECTOR_TABLE = 'bookings_property_search'
+
+# Indexed column -> weight (bm25 column weights; tsvector A-D labels)
+COLUMNS = {'name': 10.0, 'location': 5.0, 'city': 5.0, 'description': 1.0}
+TSVECTOR_LABELS = {'name': 'A', 'location': 'B', 'city': 'B', 'description': 'D'}
+
+MAX_TERMS = 8
+BATCH_SIZE = 500
+# Rows updated this long before the last refresh are read again, for
+# transactions that committed after it with an earlier updated_at
+REFRESH_OVERLAP = timedelta(minutes=5)
+
+STOPWORDS = frozenset(
+    'a an and at by for from in into near of on or the to with within '
+    'close around'.split()
+)
+
+_TOKEN = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Case-fold and strip accents"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+def tokenize(text):
+    return _TOKEN.findall(normalize(text))
+
+
+def query_terms(text):
+    """Search terms for a free-text query, without stopwords"""
+    tokens = list(dict.fromkeys(tokenize(text)))
+    terms = [token for token in tokens if token not in STOPWORDS] or tokens
+    return terms[:MAX_TERMS]
+
+
+def _connection():
+    return connections[router.db_for_write(Property)]
+
+
+_backends = {}
+
+
+def backend_name(connection=None):
+    """'fts5', 'tsvector' or 'memory' for the connection's database"""
+    connection = connection or _connection()
+    key = (connection.alias, connection.settings_dict['NAME'])
+    if key not in _backends:
+        backend = 'memory'
+        if connection.vendor in ('sqlite', 'postgresql'):
+            table = FTS_TABLE if connection.vendor == 'sqlite' else TSVECTOR_TABLE
+            with connection.cursor() as cursor:
+                if table in connection.introspection.table_names(cursor):
+                    backend = 'fts5' if connection.vendor == 'sqlite' else 'tsvector'
+        _backends[key] = backend
+    return _backends[key]
+
+
+# Writes
+
+def _documents(property_ids):
+    rows = Property.objects.filter(pk__in=property_ids).values_list('id', *COLUMNS)
+    return [(row[0], [normalize(value) for value in row[1:]]) for row in rows]
+
+
+def reindex(property_ids):
+    """Re-read the given properties into the index; missing ones are dropped"""
+    property_ids = list(property_ids)
+    connection = _connection()
+    backend = backend_name(connection)
+    if backend == 'memory' or not property_ids:
+        # The in-process index follows the listings version
+        return
+    for start in range(0, len(property_ids), BATCH_SIZE):
+        batch = property_ids[start:start + BATCH_SIZE]
+        documents = _documents(batch)
+        with connection.cursor() as cursor:
+            remove(batch, connection=connection, cursor=cursor)
+            _insert(connection, cursor, backend, documents)
+
+
+def _insert(connection, cursor, backend, documents):
+    if not documents:
+        return
+    if backend == 'fts5':
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(COLUMNS)}) VALUES (%s, %s, %s, %s, %s)',
+            [(pk, *values) for pk, values in documents],
+        )
+    else:
+        vector = ' || '.join(
+            f"setweight(to_tsvector('simple', %s), '{TSVECTOR_LABELS[name]}')" for name in COLUMNS
+        )
+        cursor.executemany(
+            f'INSERT INTO {TSVECTOR_TABLE} (property_id, document) VALUES (%s, {vector})',
+            [(pk, *values) for pk, values in documents],
+        )
+
+
+def remove(property_ids, connection=None, cursor=None):
+    connection = connection or _connection()
+    backend = backend_name(connection)
+    property_ids = list(property_ids)
+    if backend == 'memory' or not property_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(property_ids))
+    sql = (
+        f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})' if backend == 'fts5'
+        else f'DELETE FROM {TSVECTOR_TABLE} WHERE property_id IN ({placeholders})'
+    )
+    if cursor is not None:
+        cursor.execute(sql, property_ids)
+    else:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, property_ids)
+
+
+def rebuild(batch_size=BATCH_SIZE):
+    """Rebuild the whole index from the properties table; returns rows indexed"""
+    global _memory
+    connection = _connection()
+    backend = backend_name(connection)
+    if backend == 'memory':
+        _memory = None
+        return Property.objects.count()
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE if backend == "fts5" else TSVECTOR_TABLE}')
+        indexed = 0
+        batch = []
+        for row in Property.objects.order_by('id').values_list('id', *COLUMNS).iterator(chunk_size=batch_size):
+            batch.append((row[0], [normalize(value) for value in row[1:]]))
+            if len(batch) >= batch_size:
+                _insert(connection, cursor, backend, batch)
+                indexed += len(batch)
+                batch = []
+        _insert(connection, cursor, backend, batch)
+        indexed += len(batch)
+        if backend == 'fts5':
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return indexed
+
+
+# In-process fallback
+
+class InvertedIndex:
+    """token -> {property id: weighted term frequency}, with sorted tokens for prefixes.
+
+    An index is never changed once built; updated() returns a new one that
+    shares the postings of every token it does not touch.
+    """
+
+    def __init__(self, documents=()):
+        self.postings = {}
+        # property id -> {token: weighted term frequency}, to undo on update
+        self.documents = {}
+        for pk, values in documents:
+            terms = self._terms(values)
+            self.documents[pk] = terms
+            for token, frequency in terms.items():
+                self.postings.setdefault(token, {})[pk] = frequency
+        self.tokens = sorted(self.postings)
+
+    @staticmethod
+    def _terms(values):
+        terms = {}
+        for weight, value in zip(COLUMNS.values(), values):
+            for token in _TOKEN.findall(value):
+                terms[token] = terms.get(token, 0) + weight
+        return terms
+
+    @property
+    def size(self):
+        return len(self.documents)
+
+    def updated(self, documents, removed=()):
+        """A new index with documents (re)indexed and the removed ids dropped"""
+        index = InvertedIndex()
+        index.postings = dict(self.postings)
+        index.documents = dict(self.documents)
+        copied = set()
+
+        def postings(token):
+            if token not in copied:
+                copied.add(token)
+                index.postings[token] = dict(self.postings.get(token, {}))
+            return index.postings[token]
+
+        documents = list(documents)
+        for pk in [*removed, *(pk for pk, _ in documents)]:
+            for token in index.documents.pop(pk, {}):
+                postings(token).pop(pk, None)
+        for pk, values in documents:
+            terms = self._terms(values)
+            index.documents[pk] = terms
+            for token, frequency in terms.items():
+                postings(token)[pk] = frequency
+
+        for token in copied:
+            if not index.postings[token]:
+                del index.postings[token]
+        if all((token in self.postings) == (token in index.postings) for token in copied):
+            index.tokens = self.tokens
+        else:
+            index.tokens = sorted(index.postings)
+        return index
+
+    def _expand(self, term):
+        start = bisect.bisect_left(self.tokens, term)
+        end = bisect.bisect_left(self.tokens, term + '\U0010ffff')
+        return self.tokens[start:end]
+
+    def search(self, terms):
+        """{property id: score} for properties matching every term"""
+        scores = None
+        for term in terms:
+            matched = {}
+            for token in self._expand(term):
+                postings = self.postings[token]
+                idf = math.log(1 + self.size / len(postings))
+                for pk, frequency in postings.items():
+                    matched[pk] = matched.get(pk, 0) + frequency * idf
+            if scores is None:
+                scores = matched
+            else:
+                scores = {pk: score + matched[pk] for pk, score in scores.items() if pk in matched}
+            if not scores:
+                return {}
+        return scores or {}
+
+
+def _normalized(rows):
+    return ((row[0], [normalize(value) for value in row[1:]]) for row in rows)
+
+
+# (listings version, index, when it was read); replaced, never mutated
+_memory = None
+
+
+def memory_index():
+    global _memory
+    (version,) = caching.get_versions(caching.PROPERTIES)
+    state = _memory
+    if state is not None and state[0] == version:
+        return state[1]
+
+    started = timezone.now()
+    if state is None:
+        rows = Property.objects.values_list('id', *COLUMNS).iterator(chunk_size=2000)
+        index = InvertedIndex(_normalized(rows))
+    else:
+        _, index, indexed_at = state
+        changed = Property.objects.filter(updated_at__gte=indexed_at - REFRESH_OVERLAP).values_list('id', *COLUMNS)
+        existing = set(Property.objects.values_list('id', flat=True).iterator(chunk_size=10000))
+        index = index.updated(_normalized(changed), removed=[pk for pk in index.documents if pk not in existing])
+    _memory = (version, index, started)
+    return index
+
+
+# Queries
+
+def _match_expression(backend, terms):
+    if backend == 'fts5':
+        return ' '.join(f'"{term}"*' for term in terms)
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def _match_sql(backend, terms):
+    """(SQL selecting matching property ids, params)"""
+    if backend == 'fts5':
+        return f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [_match_expression(backend, terms)]
+    return (
+        f"SELECT property_id FROM {TSVECTOR_TABLE} WHERE document @@ to_tsquery('simple', %s)",
+        [_match_expression(backend, terms)],
+    )
+
+
+def filter_queryset(queryset, text):
+    """Only properties matching every term of text"""
+    terms = query_terms(text)
+    if not terms:
+        return queryset
+    backend = backend_name()
+    if backend == 'memory':
+        return queryset.filter(pk__in=list(memory_index().search(terms)))
+    sql, params = _match_sql(backend, terms)
+    return queryset.filter(pk__in=RawSQL(sql, params))
+
+
+def _annotate_rank(queryset, backend, terms, name):
+    """Only rows matching terms, with their relevance from the SQL index as name.
+
+    The index table is joined rather than queried per row: bm25() and
+    ts_rank_cd() are computed once per match, whatever the size of the
+    queryset. The rank expressions name the joined table, so the queryset
+    must not join it already.
+    """
+    expression = _match_expression(backend, terms)
+    if backend == 'fts5':
+        weights = ', '.join(str(weight) for weight in COLUMNS.values())
+        return queryset.filter(text_index__document__match=expression).annotate(
+            **{name: RawSQL(f'-bm25({FTS_TABLE}, {weights})', [], output_field=FloatField())}
+        )
+    rank = f"ts_rank_cd({TSVECTOR_TABLE}.document, to_tsquery('simple', %s))"
+    return queryset.filter(search_vector__document__match=expression).annotate(
+        **{name: RawSQL(rank, [expression], output_field=FloatField())}
+    )
+
+
+def ranked_values(queryset, text, fields, offset=0, limit=20, with_rank=False):
+    """One page of queryset.values(*fields) rows matching text, best first.
+
+    fields must include 'id'; with_rank adds each row's relevance (higher is
+    better) as search_rank. The SQL backends rank in the query; the
+    in-process index ranks its matches in Python, so only the page's rows
+    are read with their fields.
+    """
+    terms = query_terms(text)
+    backend = backend_name()
+    if backend != 'memory':
+        if terms:
+            queryset = _annotate_rank(queryset, backend, terms, 'search_rank')
+        else:
+            queryset = queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+        fields = [*fields, 'search_rank'] if with_rank else fields
+        return list(queryset.order_by('-search_rank', '-id').values(*fields)[offset:offset + limit])
+
+    scores = memory_index().search(terms) if terms else {}
+    ids = [pk for pk in queryset.values_list('id', flat=True).iterator(chunk_size=10000) if pk in scores or not terms]
+    ids.sort(key=lambda pk: (scores.get(pk, 0.0), pk), reverse=True)
+    page = ids[offset:offset + limit]
+    rows = {row['id']: row for row in queryset.filter(pk__in=page).values(*fields)}
+    if with_rank:
+        for pk, row in rows.items():
+            row['search_rank'] = scores.get(pk, 0.0)
+    return [rows[pk] for pk in page]
+
+
+def search(text, limit=20):
+    """[(property id, rank)] best first, for callers outside the search API"""
+    rows = ranked_values(Property.objects.filter(is_active=True), text, ['id'], limit=limit, with_rank=True)
+    return [(row['id'], row['search_rank']) for row in rows]
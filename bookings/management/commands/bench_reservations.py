@@ -0,0 +1,111 @@
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from bookings import reservations
+from bookings.availability import occupying_bookings
+from bookings.models import Property
+
+BENCH_USERNAME = 'bench-reservations'
+
+
+class Command(BaseCommand):
+    help = 'Fire concurrent reservations at one property and verify none overlap'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attempts', type=int, default=400, help='Reservation attempts in total')
+        parser.add_argument('--workers', type=int, default=32, help='Concurrent threads')
+        parser.add_argument('--window-days', type=int, default=14, help='Days the stays are spread over')
+        parser.add_argument('--max-nights', type=int, default=3)
+        parser.add_argument('--property', type=int, help='Use an existing property instead of a scratch one')
+        parser.add_argument('--skip-precheck', action='store_true',
+                            help='Send every attempt through the locked path')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark bookings')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        customer, new_customer = User.objects.get_or_create(username=BENCH_USERNAME)
+        if options['property']:
+            listing = Property.objects.get(pk=options['property'])
+            scratch = False
+        else:
+            listing = Property.objects.create(
+                owner=customer, name='Reservation benchmark', location='Benchmark',
+                max_guests=2, is_active=True,
+            )
+            scratch = True
+
+        # Far enough ahead not to collide with real bookings
+        first_day = timezone.localdate() + timedelta(days=3650 + rng.randrange(365))
+        stays = []
+        for _ in range(options['attempts']):
+            check_in = first_day + timedelta(days=rng.randrange(options['window_days']))
+            nights = rng.randint(1, options['max_nights'])
+            stays.append((check_in, check_in + timedelta(days=nights)))
+
+        def attempt(stay):
+            started = time.perf_counter()
+            try:
+                reservations.reserve(customer, listing.pk, *stay, precheck=not options['skip_precheck'])
+                outcome = 'booked'
+            except reservations.BookingConflict:
+                outcome = 'conflict'
+            except Exception as e:
+                outcome = f'error: {type(e).__name__}: {e}'
+            finally:
+                connections.close_all()
+            return outcome, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            results = list(pool.map(attempt, stays))
+        elapsed = time.perf_counter() - started
+
+        try:
+            outcomes = [outcome for outcome, _ in results]
+            latencies = sorted(latency for _, latency in results)
+            errors = [outcome for outcome in outcomes if outcome.startswith('error')]
+            overlaps = self.count_overlaps(listing)
+
+            self.stdout.write(
+                f'{len(results)} attempts by {options["workers"]} workers in {elapsed:.2f}s '
+                f'({len(results) / elapsed:.0f}/s)\n'
+                f'  booked:    {outcomes.count("booked")}\n'
+                f'  conflicts: {outcomes.count("conflict")}\n'
+                f'  errors:    {len(errors)}\n'
+                f'  latency:   p50 {statistics.median(latencies) * 1000:.1f}ms, '
+                f'p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms, '
+                f'max {latencies[-1] * 1000:.1f}ms'
+            )
+            for error in sorted(set(errors))[:5]:
+                self.stdout.write(f'    {error}')
+        finally:
+            if not options['keep']:
+                customer.bookings.filter(property=listing).delete()
+                if scratch:
+                    listing.delete()
+                if new_customer:
+                    customer.delete()
+
+        if overlaps:
+            raise CommandError(f'{overlaps} double booking(s) detected')
+        self.stdout.write(self.style.SUCCESS('0 double bookings'))
+
+    def count_overlaps(self, listing):
+        """Bookings that start before an earlier booking has ended"""
+        overlaps = 0
+        last_check_out = None
+        rows = occupying_bookings().filter(property=listing).order_by('check_in', 'check_out')
+        for check_in, check_out in rows.values_list('check_in', 'check_out'):
+            if last_check_out is not None and check_in < last_check_out:
+                overlaps += 1
+            last_check_out = max(last_check_out or check_out, check_out)
+        return overlaps
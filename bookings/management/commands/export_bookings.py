@@ -0,0 +1,56 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from bookings import bulk
+from bookings.models import Booking
+
+
+class Command(BaseCommand):
+    help = 'Stream bookings, with property and customer columns, to CSV or JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', help='File to write (default: stdout)')
+        parser.add_argument('--format', choices=bulk.FORMATS, help='Default: from the file name, else csv')
+        parser.add_argument('--owner', help='Only bookings on properties owned by this username')
+        parser.add_argument('--start', help='Earliest check-in date (YYYY-MM-DD)')
+        parser.add_argument('--end', help='Check-in dates before this one (YYYY-MM-DD)')
+        parser.add_argument('--status', action='append', choices=bulk.BOOKING_STATUSES,
+                            help='Only this status; repeat for several')
+        parser.add_argument('--after', type=int, help='Resume after this booking id')
+        parser.add_argument('--append', action='store_true',
+                            help='Append to --output instead of overwriting it (for resumed exports)')
+
+    def handle(self, *args, **options):
+        bookings = Booking.objects.all()
+        if options['owner']:
+            owner = User.objects.filter(username=options['owner']).first()
+            if owner is None:
+                raise CommandError(f'Unknown user: {options["owner"]}')
+            bookings = bookings.filter(property__owner=owner)
+
+        dates = {}
+        for name in ('start', 'end'):
+            if options[name]:
+                dates[name] = parse_date(options[name])
+                if dates[name] is None:
+                    raise CommandError(f'--{name} must be a date (YYYY-MM-DD)')
+        try:
+            bookings = bulk.filter_bookings(bookings, statuses=options['status'], after=options['after'], **dates)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        fmt = options['format'] or bulk.format_for(options['output'])
+        lines = bulk.stream_bookings(bookings, fmt)
+        if options['append'] and fmt == 'csv':
+            next(lines)  # the file already has a header
+        mode = 'a' if options['append'] else 'w'
+        out = open(options['output'], mode, newline='', encoding='utf-8') if options['output'] else sys.stdout
+        try:
+            for line in lines:
+                out.write(line)
+        finally:
+            if out is not sys.stdout:
+                out.close()
@@ -0,0 +1,33 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from bookings import bulk
+from bookings.models import Property
+
+
+class Command(BaseCommand):
+    help = 'Stream Property listings to CSV or JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', help='File to write (default: stdout)')
+        parser.add_argument('--format', choices=bulk.FORMATS, help='Default: from the file name, else csv')
+        parser.add_argument('--owner', help='Only listings owned by this username')
+
+    def handle(self, *args, **options):
+        properties = Property.objects.all()
+        if options['owner']:
+            owner = User.objects.filter(username=options['owner']).first()
+            if owner is None:
+                raise CommandError(f'Unknown user: {options["owner"]}')
+            properties = properties.filter(owner=owner)
+
+        fmt = options['format'] or bulk.format_for(options['output'])
+        out = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        try:
+            for line in bulk.stream(properties, fmt, with_owner=True):
+                out.write(line)
+        finally:
+            if out is not sys.stdout:
+                out.close()
@@ -0,0 +1,45 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from bookings import bulk
+
+
+class Command(BaseCommand):
+    help = 'Create or update Property listings from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=bulk.FORMATS, help='Default: from the file name, else csv')
+        parser.add_argument('--owner', help='Username owning new listings when a row has no owner column')
+        parser.add_argument('--batch-size', type=int, default=bulk.BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Validate without writing')
+
+    def handle(self, *args, **options):
+        owner = None
+        if options['owner']:
+            owner = User.objects.filter(username=options['owner']).first()
+            if owner is None:
+                raise CommandError(f'Unknown user: {options["owner"]}')
+
+        fmt = options['format'] or bulk.format_for(options['path'])
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as source:
+                report = bulk.import_rows(
+                    source, fmt,
+                    owner=owner,
+                    restrict_to_owner=False,
+                    allow_owner_column=True,
+                    batch_size=options['batch_size'],
+                    dry_run=options['dry_run'],
+                )
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for error in report.errors:
+            self.stderr.write(f'line {error["line"]}: {json.dumps(error["errors"])}')
+        summary = f'{report.created} created, {report.updated} updated, {report.failed} failed'
+        if report.dry_run:
+            summary += ' (dry run)'
+        self.stdout.write(self.style.SUCCESS(summary) if not report.failed else self.style.WARNING(summary))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from bookings import fulltext
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the Property full-text search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=fulltext.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        indexed = fulltext.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {indexed} properties ({fulltext.backend_name()} backend)'
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from bookings import caching, ratings
+
+
+class Command(BaseCommand):
+    help = 'Rebuild Property rating aggregates from the reviews table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--property', type=int, action='append', dest='properties',
+                            help='Only this property (repeatable)')
+
+    def handle(self, *args, **options):
+        updated = ratings.recompute(options['properties'])
+        caching.bump(caching.PROPERTIES, *(caching.property_scope(pk) for pk in options['properties'] or []))
+        self.stdout.write(self.style.SUCCESS(f'Recomputed ratings for {updated} properties'))
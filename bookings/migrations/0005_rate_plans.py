@@ -0,0 +1,54 @@
+# Generated by Django 6.0 on 2026-10-18 10:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0004_property_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatePlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekend_days', models.JSONField(blank=True, default=list)),
+                ('weekend_uplift_percent', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('included_guests', models.IntegerField(default=2)),
+                ('extra_guest_fee', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('property', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rate_plan', to='bookings.property')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SeasonalRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('nightly_rate', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seasonal_rates', to='bookings.property')),
+            ],
+            options={
+                'ordering': ['start_date'],
+                'indexes': [models.Index(fields=['property', 'end_date', 'start_date'], name='seasonal_rate_dates_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StayDiscount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_nights', models.IntegerField()),
+                ('percent', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stay_discounts', to='bookings.property')),
+            ],
+            options={
+                'ordering': ['min_nights'],
+                'unique_together': {('property', 'min_nights')},
+            },
+        ),
+    ]
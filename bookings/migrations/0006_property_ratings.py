@@ -0,0 +1,79 @@
+# Generated by Django 6.0 on 2026-10-18 10:59
+
+from django.conf import settings
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_ratings(apps, schema_editor):
+    Property = apps.get_model('bookings', 'Property')
+    Review = apps.get_model('bookings', 'Review')
+    histograms = defaultdict(Counter)
+    grouped = Review.objects.order_by().values('property_id', 'rating').annotate(n=Count('id'))
+    for property_id, rating, n in grouped.values_list('property_id', 'rating', 'n'):
+        histograms[property_id][min(max(rating, 1), 5)] += n
+    fields = ['rating_count', 'rating_avg'] + [f'rating_{stars}' for stars in range(1, 6)]
+    batch = []
+    for prop in Property.objects.filter(pk__in=list(histograms)).only('id'):
+        histogram = histograms[prop.id]
+        count = sum(histogram.values())
+        prop.rating_count = count
+        prop.rating_avg = (Decimal(sum(s * n for s, n in histogram.items())) / count).quantize(Decimal('0.01'))
+        for stars in range(1, 6):
+            setattr(prop, f'rating_{stars}', histogram.get(stars, 0))
+        batch.append(prop)
+    Property.objects.bulk_update(batch, fields, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0005_rate_plans'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='rating_1',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='rating_2',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='rating_3',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='rating_4',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='rating_5',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='rating_avg',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['is_active', 'rating_avg', 'rating_count'], name='property_rating_idx'),
+        ),
+        migrations.RunPython(fill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 6.0 on 2026-10-18 14:20
+
+import unicodedata
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+COLUMNS = ['name', 'location', 'city', 'description']
+LABELS = ['A', 'B', 'B', 'D']
+
+
+def normalize(text):
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+def create_index(apps, schema_editor):
+    """FTS5 table on SQLite, tsvector side table on Postgres, nothing elsewhere"""
+    connection = schema_editor.connection
+    Property = apps.get_model('bookings', 'Property')
+    if connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                'CREATE VIRTUAL TABLE bookings_property_fts USING fts5('
+                'name, location, city, description, '
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+        except OperationalError:
+            # SQLite built without FTS5: searches use the in-process index
+            return
+        insert = 'INSERT INTO bookings_property_fts (rowid, name, location, city, description) VALUES (%s, %s, %s, %s, %s)'
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE bookings_property_search ('
+            'property_id bigint PRIMARY KEY REFERENCES bookings_property (id) ON DELETE CASCADE '
+            'DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            'CREATE INDEX bookings_property_search_gin ON bookings_property_search USING GIN (document)'
+        )
+        vector = ' || '.join(f"setweight(to_tsvector('simple', %s), '{label}')" for label in LABELS)
+        insert = f'INSERT INTO bookings_property_search (property_id, document) VALUES (%s, {vector})'
+    else:
+        return
+
+    rows = Property.objects.order_by('id').values_list('id', *COLUMNS)
+    with connection.cursor() as cursor:
+        cursor.executemany(insert, [(row[0], *(normalize(value) for value in row[1:])) for row in rows])
+
+
+def drop_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS bookings_property_fts')
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute('DROP TABLE IF EXISTS bookings_property_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0006_property_ratings'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
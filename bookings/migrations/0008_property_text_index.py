@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-18 12:38
+
+import bookings.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0007_property_fulltext'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropertySearchVector',
+            fields=[
+                ('property', models.OneToOneField(on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_vector', serialize=False, to='bookings.property')),
+                ('document', bookings.models.SearchDocumentField()),
+            ],
+            options={
+                'db_table': 'bookings_property_search',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='PropertyTextIndex',
+            fields=[
+                ('property', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='text_index', serialize=False, to='bookings.property')),
+                ('document', bookings.models.SearchDocumentField(db_column='bookings_property_fts')),
+            ],
+            options={
+                'db_table': 'bookings_property_fts',
+                'managed': False,
+            },
+        ),
+    ]
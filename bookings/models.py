@@ -56,10 +56,79 @@ class Property(models.Model):
     is_verified = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Review aggregates, kept current by bookings.ratings
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    rating_count = models.IntegerField(default=0)
+    rating_1 = models.IntegerField(default=0)
+    rating_2 = models.IntegerField(default=0)
+    rating_3 = models.IntegerField(default=0)
+    rating_4 = models.IntegerField(default=0)
+    rating_5 = models.IntegerField(default=0)
+    
+    class Meta:
+        indexes = [
+            # Faceted search: equality filters first, then the price range
+            models.Index(fields=['is_active', 'city', 'property_type'], name='property_search_idx'),
+            models.Index(fields=['is_active', 'price_per_night'], name='property_price_idx'),
+            models.Index(fields=['is_active', 'rating_avg', 'rating_count'], name='property_rating_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} - {self.location}"
 
+    @property
+    def rating_histogram(self):
+        return {stars: getattr(self, f'rating_{stars}') for stars in range(1, 6)}
+
+# PRICING MODELS
+class RatePlan(models.Model):
+    """Per-property pricing rules on top of Property.price_per_night"""
+    property = models.OneToOneField(Property, on_delete=models.CASCADE, related_name='rate_plan')
+    # Python weekdays (Monday=0) whose nights carry the uplift; default Friday and Saturday
+    weekend_days = models.JSONField(default=list, blank=True)
+    weekend_uplift_percent = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    included_guests = models.IntegerField(default=2)
+    extra_guest_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    DEFAULT_WEEKEND_DAYS = [4, 5]
+
+    def get_weekend_days(self):
+        return self.weekend_days or self.DEFAULT_WEEKEND_DAYS
+
+    def __str__(self):
+        return f"Rate plan for {self.property.name}"
+
+class SeasonalRate(models.Model):
+    """Nightly rate replacing the base rate for nights in [start_date, end_date)"""
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='seasonal_rates')
+    name = models.CharField(max_length=100, blank=True)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    nightly_rate = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        ordering = ['start_date']
+        indexes = [
+            models.Index(fields=['property', 'end_date', 'start_date'], name='seasonal_rate_dates_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name or 'Season'} {self.start_date} - {self.end_date} ({self.property.name})"
+
+class StayDiscount(models.Model):
+    """Percentage off stays of at least min_nights; the longest matching tier applies"""
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='stay_discounts')
+    min_nights = models.IntegerField()
+    percent = models.DecimalField(max_digits=5, decimal_places=2)
+
+    class Meta:
+        ordering = ['min_nights']
+        unique_together = ['property', 'min_nights']
+
+    def __str__(self):
+        return f"{self.percent}% off {self.min_nights}+ nights ({self.property.name})"
+
 class Booking(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -83,6 +152,11 @@ class Booking(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Availability lookups: per-property and cross-property overlap tests
+            models.Index(fields=['property', 'check_out', 'check_in'], name='booking_property_dates_idx'),
+            models.Index(fields=['check_out', 'check_in'], name='booking_dates_idx'),
+        ]
     
     def __str__(self):
         return f"Booking #{self.id} - {self.property.name}"
@@ -101,3 +175,45 @@ class Review(models.Model):
     
     def __str__(self):
         return f"Review by {self.customer.username} - {self.rating}/5"
+
+
+# FULL-TEXT INDEX TABLES
+# Written by bookings.fulltext with raw SQL (see migration 0007). The models
+# only let querysets join a listing to its index row to rank it.
+class SearchDocumentField(models.TextField):
+    """A listing's indexed text; document__match=<query> keeps matching rows"""
+
+
+@SearchDocumentField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        if connection.vendor == 'postgresql':
+            return f"{lhs} @@ to_tsquery('simple', {rhs})", [*lhs_params, *rhs_params]
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+class PropertyTextIndex(models.Model):
+    """SQLite FTS5 row of a listing; its rowid is the property id"""
+    property = models.OneToOneField(Property, on_delete=models.DO_NOTHING, primary_key=True,
+                                    db_column='rowid', related_name='text_index')
+    # FTS5's hidden column named after the table matches every column
+    document = SearchDocumentField(db_column='bookings_property_fts')
+
+    class Meta:
+        managed = False
+        db_table = 'bookings_property_fts'
+
+
+class PropertySearchVector(models.Model):
+    """Postgres weighted tsvector of a listing"""
+    property = models.OneToOneField(Property, on_delete=models.DO_NOTHING, primary_key=True,
+                                    related_name='search_vector')
+    document = SearchDocumentField()
+
+    class Meta:
+        managed = False
+        db_table = 'bookings_property_search'
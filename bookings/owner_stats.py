@@ -0,0 +1,219 @@
+"""
+Revenue, booking and occupancy time series for a property owner.
+
+Every non-cancelled booking on the owner's properties that touches the window
+comes from one grouped query over Booking joined to Property.owner, grouped
+by (property, check_in, check_out). Revenue and booking counts are credited
+to the check-in bucket. Occupied nights are split across the buckets the
+stay covers.
+
+Results are cached per owner, period and window together with a watermark:
+the highest booking id folded in. A later read only fetches bookings above the
+watermark and merges them in, so new reservations extend the cached series
+instead of invalidating it. Edits and deletions cannot be merged that way;
+the booking signals bump the owner's version and the next read starts over.
+Bookings younger than OWNER_STATS_GRACE_SECONDS are merged on every read but
+kept out of the cached base, so one whose transaction commits after a
+higher id has been seen is still picked up.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from . import caching
+from .availability import occupying_bookings
+from .models import Property
+
+PERIODS = ('day', 'week', 'month')
+MAX_BUCKETS = {'day': 366, 'week': 260, 'month': 120}
+DEFAULT_BUCKETS = {'day': 30, 'week': 12, 'month': 12}
+
+CACHE_PREFIX = 'owner_stats'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def owner_scope(owner_id):
+    return f'owner:{owner_id}'
+
+
+def _grace():
+    return timedelta(seconds=getattr(settings, 'OWNER_STATS_GRACE_SECONDS', 300))
+
+
+def bucket_start(day, period):
+    if period == 'day':
+        return day
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_bucket(day, period):
+    if period == 'day':
+        return day + timedelta(days=1)
+    if period == 'week':
+        return day + timedelta(days=7)
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def buckets(start, end, period):
+    """Bucket start dates covering [start, end)"""
+    result = []
+    day = bucket_start(start, period)
+    while day < end:
+        result.append(day)
+        day = next_bucket(day, period)
+    return result
+
+
+def default_window(period, today=None):
+    """The last DEFAULT_BUCKETS[period] buckets, ending with the current one"""
+    today = today or timezone.localdate()
+    end = next_bucket(bucket_start(today, period), period)
+    start = bucket_start(today, period)
+    for _ in range(DEFAULT_BUCKETS[period] - 1):
+        start = bucket_start(start - timedelta(days=1), period)
+    return start, end
+
+
+def validate_window(start, end, period):
+    if period not in PERIODS:
+        raise ValueError(f'period must be one of: {", ".join(PERIODS)}')
+    if end <= start:
+        raise ValueError('end must be after start')
+    if len(buckets(start, end, period)) > MAX_BUCKETS[period]:
+        raise ValueError(f'At most {MAX_BUCKETS[period]} {period} buckets per request')
+
+
+def _stays(owner_id, start, end, **filters):
+    """(property_id, check_in, check_out, revenue, bookings) for the window"""
+    return (
+        occupying_bookings()
+        .filter(property__owner_id=owner_id, check_in__lt=end, check_out__gt=start, **filters)
+        .order_by()
+        .values('property_id', 'check_in', 'check_out')
+        .annotate(revenue=Sum('total_price'), bookings=Count('id'))
+        .values_list('property_id', 'check_in', 'check_out', 'revenue', 'bookings')
+    )
+
+
+def _fold(series, stays, start, end, period):
+    """Add grouped stays to {property_id: {bucket: [revenue, bookings, nights]}}"""
+    for property_id, check_in, check_out, revenue, count in stays:
+        per_bucket = series.setdefault(property_id, {})
+        if start <= check_in < end:
+            cell = per_bucket.setdefault(bucket_start(check_in, period), [Decimal(0), 0, 0])
+            cell[0] += revenue or 0
+            cell[1] += count
+        first, last = max(check_in, start), min(check_out, end)
+        day = bucket_start(first, period)
+        while day < last:
+            following = next_bucket(day, period)
+            nights = (min(last, following) - max(first, day)).days
+            per_bucket.setdefault(day, [Decimal(0), 0, 0])[2] += nights * count
+            day = following
+    return series
+
+
+def _merge(base, extra):
+    merged = {pk: {day: list(cell) for day, cell in cells.items()} for pk, cells in base.items()}
+    for pk, cells in extra.items():
+        for day, (revenue, count, nights) in cells.items():
+            cell = merged.setdefault(pk, {}).setdefault(day, [Decimal(0), 0, 0])
+            cell[0] += revenue
+            cell[1] += count
+            cell[2] += nights
+    return merged
+
+
+def _cached_series(owner_id, start, end, period):
+    """Series for the window, reusing and extending the cached base"""
+    (version,) = caching.get_versions(owner_scope(owner_id))
+    key = f'{CACHE_PREFIX}:{owner_id}:{version}:{period}:{start.isoformat()}:{end.isoformat()}'
+    settled_before = timezone.now() - _grace()
+    entry = cache.get(key)
+
+    if entry is None:
+        watermark = (
+            occupying_bookings().filter(property__owner_id=owner_id, created_at__lt=settled_before)
+            .order_by('-id').values_list('id', flat=True).first()
+        ) or 0
+        entry = {
+            'watermark': watermark,
+            'series': _fold({}, _stays(owner_id, start, end, id__lte=watermark), start, end, period),
+        }
+        cache.set(key, entry, CACHE_TIMEOUT)
+
+    # Everything newer than the watermark; settled rows are folded into the cache
+    settled, recent = [], []
+    newer = (
+        occupying_bookings()
+        .filter(property__owner_id=owner_id, id__gt=entry['watermark'], check_in__lt=end, check_out__gt=start)
+        .values_list('id', 'property_id', 'check_in', 'check_out', 'total_price', 'created_at')
+    )
+    for booking_id, property_id, check_in, check_out, revenue, created_at in newer:
+        stay = (property_id, check_in, check_out, revenue, 1)
+        (settled if created_at < settled_before else recent).append((booking_id, stay))
+
+    # Advance the watermark past settled rows, but never past a recent one
+    horizon = min((booking_id for booking_id, _ in recent), default=None)
+    foldable = [item for item in settled if horizon is None or item[0] < horizon]
+    if foldable:
+        entry['watermark'] = max(booking_id for booking_id, _ in foldable)
+        _fold(entry['series'], [stay for _, stay in foldable], start, end, period)
+        cache.set(key, entry, CACHE_TIMEOUT)
+        settled = [item for item in settled if item not in foldable]
+    extra = _fold({}, [stay for _, stay in settled + recent], start, end, period)
+    return _merge(entry['series'], extra) if extra else entry['series']
+
+
+def owner_series(owner_id, start=None, end=None, period='month'):
+    """JSON-ready revenue/bookings/occupancy series for an owner's properties"""
+    if period not in PERIODS:
+        raise ValueError(f'period must be one of: {", ".join(PERIODS)}')
+    if start is None or end is None:
+        start, end = default_window(period)
+    validate_window(start, end, period)
+
+    properties = list(Property.objects.filter(owner_id=owner_id).order_by('id').values_list('id', 'name'))
+    series = _cached_series(owner_id, start, end, period)
+    starts = buckets(start, end, period)
+    days_per_bucket = [(min(next_bucket(day, period), end) - max(day, start)).days for day in starts]
+
+    rows = []
+    total_revenue = [Decimal(0)] * len(starts)
+    total_bookings = [0] * len(starts)
+    total_nights = [0] * len(starts)
+    for property_id, name in properties:
+        cells = series.get(property_id, {})
+        revenue, bookings, occupancy = [], [], []
+        for i, day in enumerate(starts):
+            cell_revenue, cell_bookings, nights = cells.get(day, (Decimal(0), 0, 0))
+            revenue.append(str(cell_revenue))
+            bookings.append(cell_bookings)
+            occupancy.append(round(nights / days_per_bucket[i], 4))
+            total_revenue[i] += cell_revenue
+            total_bookings[i] += cell_bookings
+            total_nights[i] += nights
+        rows.append({'id': property_id, 'name': name, 'revenue': revenue,
+                     'bookings': bookings, 'occupancy': occupancy})
+
+    return {
+        'period': period,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'buckets': [day.isoformat() for day in starts],
+        'properties': rows,
+        'totals': {
+            'revenue': [str(value) for value in total_revenue],
+            'bookings': total_bookings,
+            'occupancy': [
+                round(nights / (days * len(properties)), 4) if properties else 0
+                for nights, days in zip(total_nights, days_per_bucket)
+            ],
+        },
+    }
@@ -0,0 +1,201 @@
+"""
+Nightly price quotes.
+
+A property's price for a night is its base rate (Property.price_per_night)
+or the SeasonalRate covering that night, plus the RatePlan weekend uplift on
+weekend nights and a per-night fee for guests beyond the included number.
+The longest StayDiscount tier the stay qualifies for then comes off the total.
+
+Quotes never walk the stay night by night. The stay is cut into runs of
+constant rate at season boundaries, and each run is priced in closed form:
+nights * rate, plus the uplift times the number of weekend nights, which is
+counted from the run's length and starting weekday. A quote costs O(seasons
+overlapping the stay), whatever the length of the stay.
+
+quote_many() prices a page of properties for the same stay with a fixed
+number of queries, and caches each quote until the property's rates change
+(see signals: a 'rates:<id>' version bump).
+"""
+from dataclasses import asdict, dataclass
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.cache import cache
+
+from . import caching
+from .availability import validate_range
+from .models import Property, RatePlan, SeasonalRate, StayDiscount
+
+CACHE_PREFIX = 'pricing:quote'
+CACHE_TIMEOUT = 60 * 60
+
+CENT = Decimal('0.01')
+HUNDRED = Decimal(100)
+
+
+@dataclass(frozen=True)
+class Quote:
+    property_id: int
+    nights: int
+    weekend_nights: int
+    nightly_total: Decimal
+    guest_fees: Decimal
+    discount_percent: Decimal
+    discount: Decimal
+    total: Decimal
+
+    @property
+    def average_nightly(self):
+        return (self.total / self.nights).quantize(CENT, ROUND_HALF_UP)
+
+    def as_dict(self):
+        data = {key: str(value) if isinstance(value, Decimal) else value
+                for key, value in asdict(self).items()}
+        data['average_nightly'] = str(self.average_nightly)
+        return data
+
+
+def weekday_count(start, end, weekdays):
+    """Number of ordinals in [start, end) that fall on one of the weekdays"""
+    length = end - start
+    if length <= 0 or not weekdays:
+        return 0
+    weeks, rest = divmod(length, 7)
+    first = (start - 1) % 7  # ordinal 1 (0001-01-01) is a Monday
+    return weeks * len(weekdays) + sum(1 for i in range(rest) if (first + i) % 7 in weekdays)
+
+
+def rate_runs(base_rate, seasons, start, end):
+    """Split [start, end) into (run_start, run_end, rate) runs.
+
+    seasons are (start, end, rate) ordinal triples; where seasons overlap,
+    the one starting later wins.
+    """
+    bounds = {start, end}
+    for season_start, season_end, _ in seasons:
+        if start < season_start < end:
+            bounds.add(season_start)
+        if start < season_end < end:
+            bounds.add(season_end)
+    bounds = sorted(bounds)
+
+    runs = []
+    for run_start, run_end in zip(bounds, bounds[1:]):
+        rate = base_rate
+        latest = None
+        for season_start, season_end, season_rate in seasons:
+            if season_start <= run_start < season_end and (latest is None or season_start >= latest):
+                rate, latest = season_rate, season_start
+        if runs and runs[-1][2] == rate:
+            runs[-1] = (runs[-1][0], run_end, rate)
+        else:
+            runs.append((run_start, run_end, rate))
+    return runs
+
+
+def compute_quote(property_id, base_rate, check_in, check_out, guests=1,
+                  plan=None, seasons=(), discounts=()):
+    """Price a stay from already loaded rates.
+
+    plan is a RatePlan or None, seasons are SeasonalRate rows and discounts
+    are (min_nights, percent) pairs.
+    """
+    start, end = check_in.toordinal(), check_out.toordinal()
+    nights = end - start
+    season_rows = [
+        (season.start_date.toordinal(), season.end_date.toordinal(), season.nightly_rate)
+        for season in seasons
+    ]
+    weekend_days = set(plan.get_weekend_days()) if plan else set()
+    uplift = plan.weekend_uplift_percent / HUNDRED if plan else Decimal(0)
+
+    nightly_total = Decimal(0)
+    weekend_nights = 0
+    for run_start, run_end, rate in rate_runs(Decimal(base_rate), season_rows, start, end):
+        run_weekend = weekday_count(run_start, run_end, weekend_days)
+        weekend_nights += run_weekend
+        nightly_total += rate * (run_end - run_start) + rate * uplift * run_weekend
+
+    guest_fees = Decimal(0)
+    if plan and plan.extra_guest_fee and guests > plan.included_guests:
+        guest_fees = plan.extra_guest_fee * (guests - plan.included_guests) * nights
+
+    percent = Decimal(0)
+    for min_nights, tier_percent in discounts:
+        if nights >= min_nights:
+            percent = max(percent, Decimal(tier_percent))
+
+    subtotal = (nightly_total + guest_fees).quantize(CENT, ROUND_HALF_UP)
+    discount = (subtotal * percent / HUNDRED).quantize(CENT, ROUND_HALF_UP)
+    return Quote(
+        property_id=property_id,
+        nights=nights,
+        weekend_nights=weekend_nights,
+        nightly_total=nightly_total.quantize(CENT, ROUND_HALF_UP),
+        guest_fees=guest_fees.quantize(CENT, ROUND_HALF_UP),
+        discount_percent=percent,
+        discount=discount,
+        total=subtotal - discount,
+    )
+
+
+def _load_rates(property_ids, check_in, check_out):
+    """Rates for many properties with one query per rate table"""
+    base_rates = dict(
+        Property.objects.filter(id__in=property_ids).values_list('id', 'price_per_night')
+    )
+    plans = {plan.property_id: plan for plan in RatePlan.objects.filter(property_id__in=property_ids)}
+    seasons = {}
+    for season in SeasonalRate.objects.filter(
+        property_id__in=base_rates, start_date__lt=check_out, end_date__gt=check_in,
+    ):
+        seasons.setdefault(season.property_id, []).append(season)
+    discounts = {}
+    for property_id, min_nights, percent in StayDiscount.objects.filter(
+        property_id__in=base_rates,
+    ).values_list('property_id', 'min_nights', 'percent'):
+        discounts.setdefault(property_id, []).append((min_nights, percent))
+    return base_rates, plans, seasons, discounts
+
+
+def _cache_key(property_id, version, check_in, check_out, guests):
+    return f'{CACHE_PREFIX}:{property_id}:{version}:{check_in.isoformat()}:{check_out.isoformat()}:{guests}'
+
+
+def quote_many(property_ids, check_in, check_out, guests=1):
+    """Return {property_id: Quote} for one stay; unknown ids are left out"""
+    validate_range(check_in, check_out)
+    property_ids = list(dict.fromkeys(property_ids))
+    if not property_ids:
+        return {}
+
+    versions = caching.get_versions(*(caching.rates_scope(pk) for pk in property_ids))
+    keys = {
+        _cache_key(pk, version, check_in, check_out, guests): pk
+        for pk, version in zip(property_ids, versions)
+    }
+    quotes = {keys[key]: quote for key, quote in cache.get_many(keys).items()}
+
+    missing = [pk for pk in property_ids if pk not in quotes]
+    if missing:
+        base_rates, plans, seasons, discounts = _load_rates(missing, check_in, check_out)
+        built = {
+            pk: compute_quote(
+                pk, base_rates[pk], check_in, check_out, guests,
+                plan=plans.get(pk), seasons=seasons.get(pk, ()), discounts=discounts.get(pk, ()),
+            )
+            for pk in missing if pk in base_rates
+        }
+        cache.set_many(
+            {key: built[pk] for key, pk in keys.items() if pk in built},
+            CACHE_TIMEOUT,
+        )
+        quotes.update(built)
+    return {pk: quotes[pk] for pk in property_ids if pk in quotes}
+
+
+def quote(property_id, check_in, check_out, guests=1):
+    """Quote one property; raises Property.DoesNotExist for unknown ids"""
+    quotes = quote_many([property_id], check_in, check_out, guests)
+    if property_id not in quotes:
+        raise Property.DoesNotExist(f'Property {property_id} does not exist')
+    return quotes[property_id]
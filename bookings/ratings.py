@@ -0,0 +1,87 @@
+"""
+Review aggregates stored on Property.
+
+rating_count, rating_avg and the rating_1..rating_5 histogram are adjusted
+by Review signals as reviews are created, edited and deleted. An adjustment
+locks the property row, applies the delta and rewrites the average, so it
+never scans the reviews table. recompute() rebuilds the fields from the
+reviews (see the recompute_ratings command) if they ever drift.
+"""
+from collections import Counter, defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Property, Review
+
+STARS = range(1, 6)
+HISTOGRAM_FIELDS = [f'rating_{stars}' for stars in STARS]
+FIELDS = ['rating_count', 'rating_avg', *HISTOGRAM_FIELDS]
+
+CENT = Decimal('0.01')
+
+
+def stars(rating):
+    """Bucket for a stored rating, clamped to 1..5"""
+    return min(max(int(rating), 1), 5)
+
+
+def aggregate(histogram):
+    """Field values for a {stars: count} histogram"""
+    count = sum(histogram.values())
+    weighted = sum(stars * n for stars, n in histogram.items())
+    values = {f'rating_{stars}': histogram.get(stars, 0) for stars in STARS}
+    values['rating_count'] = count
+    values['rating_avg'] = (Decimal(weighted) / count).quantize(CENT, ROUND_HALF_UP) if count else Decimal(0)
+    return values
+
+
+def apply(property_id, added=(), removed=()):
+    """Add and remove ratings from a property's aggregates"""
+    delta = Counter(stars(rating) for rating in added)
+    delta.subtract(stars(rating) for rating in removed)
+    if not any(delta.values()):
+        return
+    with transaction.atomic():
+        current = (
+            Property.objects.select_for_update()
+            .filter(pk=property_id)
+            .values(*HISTOGRAM_FIELDS)
+            .first()
+        )
+        if current is None:
+            # The property is being deleted along with its reviews
+            return
+        histogram = {
+            stars: max(current[f'rating_{stars}'] + delta[stars], 0)
+            for stars in STARS
+        }
+        Property.objects.filter(pk=property_id).update(**aggregate(histogram))
+
+
+def recompute(property_ids=None, batch_size=1000):
+    """Rebuild the aggregates from the reviews table; returns properties updated"""
+    properties = Property.objects.all()
+    reviews = Review.objects.all()
+    if property_ids is not None:
+        properties = properties.filter(pk__in=property_ids)
+        reviews = reviews.filter(property_id__in=property_ids)
+
+    histograms = defaultdict(Counter)
+    grouped = reviews.order_by().values('property_id', 'rating').annotate(n=Count('id'))
+    for row in grouped.values_list('property_id', 'rating', 'n'):
+        histograms[row[0]][stars(row[1])] += row[2]
+
+    updated = 0
+    batch = []
+    for prop in properties.only('id', *FIELDS).iterator(chunk_size=batch_size):
+        for name, value in aggregate(histograms.get(prop.id, {})).items():
+            setattr(prop, name, value)
+        batch.append(prop)
+        if len(batch) >= batch_size:
+            updated += Property.objects.bulk_update(batch, FIELDS)
+            batch = []
+    if batch:
+        updated += Property.objects.bulk_update(batch, FIELDS)
+    return updated
@@ -0,0 +1,77 @@
+"""
+Reservation service: the one place that creates Bookings.
+
+reserve() checks the requested dates against the property's non-cancelled
+bookings and inserts the new booking in the same transaction, so two
+concurrent requests can never both win the same nights:
+
+* Postgres: the Property row is locked with SELECT ... FOR UPDATE, queueing
+  reservations for one property while other properties proceed in parallel.
+* SQLite: transactions start with BEGIN IMMEDIATE (see settings), so the
+  check and insert hold the database write lock together.
+
+Lock timeouts, deadlocks and "database is locked" are retried with backoff by
+zamreach.db.run_serialized. Requests for dates the cached occupancy index
+already shows as taken are refused before any lock is taken, which keeps
+bursts on a popular property cheap.
+"""
+from zamreach.db import run_serialized
+
+from . import availability, pricing
+from .models import Booking, Property
+
+
+class BookingConflict(Exception):
+    """The requested dates overlap an existing booking"""
+
+    def __init__(self, property_id, check_in, check_out):
+        self.property_id = property_id
+        self.check_in = check_in
+        self.check_out = check_out
+        super().__init__(f'Property {property_id} is not available from {check_in} to {check_out}')
+
+
+def _insert(customer, property_id, check_in, check_out, guests, special_requests, status):
+    # FOR UPDATE is a no-op on SQLite, where the immediate transaction
+    # already holds the write lock
+    listing = Property.objects.select_for_update().get(pk=property_id, is_active=True)
+    if guests > listing.max_guests:
+        raise ValueError(f'This property sleeps at most {listing.max_guests} guests')
+
+    overlapping = availability.occupying_bookings().filter(
+        property_id=property_id,
+        check_in__lt=check_out,
+        check_out__gt=check_in,
+    )
+    if overlapping.exists():
+        raise BookingConflict(property_id, check_in, check_out)
+
+    return Booking.objects.create(
+        customer=customer,
+        property=listing,
+        check_in=check_in,
+        check_out=check_out,
+        guests=guests,
+        total_price=pricing.quote(property_id, check_in, check_out, guests).total,
+        special_requests=special_requests,
+        status=status,
+    )
+
+
+def reserve(customer, property_id, check_in, check_out, guests=1, special_requests='',
+            status='pending', precheck=True):
+    """Create a booking if the dates are free.
+
+    Raises BookingConflict when they are taken, ValueError for invalid
+    input (including a check_in before today) and Property.DoesNotExist for unknown or inactive properties.
+    precheck=False skips the cached-index shortcut (used by benchmarks).
+    """
+    availability.validate_stay(check_in, check_out)
+    if guests < 1:
+        raise ValueError('guests must be at least 1')
+
+    if precheck and not availability.is_available(property_id, check_in, check_out):
+        raise BookingConflict(property_id, check_in, check_out)
+
+    return run_serialized(_insert, customer, property_id, check_in, check_out,
+                          guests, special_requests, status)
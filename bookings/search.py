@@ -0,0 +1,271 @@
+"""
+Server-side faceted property search.
+
+A search is a count, one grouped count per facet and one page of rows. Each
+facet is counted without its own filter, so the other values of a chosen
+facet stay visible with their counts.
+With check_in and check_out the page rows are also priced in one batched
+pricing.quote_many() call. Free text in q is matched against the full-text
+index (see fulltext) and, unless another sort is asked for, ranks the page.
+"""
+import json
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection
+from django.db.models import Case, CharField, Count, Q, Value, When
+from django.utils.dateparse import parse_date
+
+from . import fulltext, pricing
+from .availability import validate_range
+from .models import Property
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# (label, lower bound inclusive, upper bound exclusive)
+PRICE_BANDS = [
+    ('0-50', None, 50),
+    ('50-100', 50, 100),
+    ('100-200', 100, 200),
+    ('200-500', 200, 500),
+    ('500+', 500, None),
+]
+
+SORTS = {
+    'price': ('price_per_night', 'id'),
+    '-price': ('-price_per_night', '-id'),
+    'newest': ('-created_at', '-id'),
+    'guests': ('-max_guests', 'id'),
+    'rating': ('-rating_avg', '-rating_count', '-id'),
+    'relevance': ('-search_rank', '-id'),
+}
+DEFAULT_SORT = 'newest'
+
+RESULT_FIELDS = [
+    'id', 'name', 'property_type', 'location', 'city', 'country',
+    'price_per_night', 'max_guests', 'bedrooms', 'bathrooms', 'amenities',
+    'is_verified', 'rating_avg', 'rating_count',
+]
+
+
+def _split(value):
+    return [part.strip() for part in (value or '').split(',') if part.strip()]
+
+
+def _decimal(value):
+    if value in (None, ''):
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f'Invalid number: {value}')
+
+
+def _int(value):
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid integer: {value}')
+
+
+def _flag(value):
+    if value in (None, ''):
+        return None
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def amenity_filter(amenity):
+    """Q matching properties whose amenities list contains the given value"""
+    if connection.features.supports_json_field_contains:
+        return Q(amenities__contains=[amenity])
+    # SQLite stores the list as JSON text; match the quoted element
+    return Q(amenities__icontains=json.dumps(amenity))
+
+
+def parse_filters(params):
+    """Turn query params into a dict of validated filters (ValueError on bad input)"""
+    filters = {
+        'city': _split(params.get('city')),
+        'property_type': _split(params.get('property_type')),
+        'amenities': _split(params.get('amenities')),
+        'min_price': _decimal(params.get('min_price')),
+        'max_price': _decimal(params.get('max_price')),
+        'guests': _int(params.get('guests')),
+        'bedrooms': _int(params.get('bedrooms')),
+        'min_rating': _decimal(params.get('min_rating')),
+        'min_reviews': _int(params.get('min_reviews')),
+        'is_active': _flag(params.get('is_active')),
+        'is_verified': _flag(params.get('is_verified')),
+    }
+    if filters['is_active'] is None:
+        filters['is_active'] = True
+    return filters
+
+
+def _stay(params):
+    """(check_in, check_out) when both are given, for quoting the results"""
+    check_in, check_out = params.get('check_in'), params.get('check_out')
+    if not check_in and not check_out:
+        return None
+    stay = parse_date(check_in or ''), parse_date(check_out or '')
+    validate_range(*stay)
+    return stay
+
+
+def filter_queryset(queryset, filters):
+    if filters['is_active'] is not None:
+        queryset = queryset.filter(is_active=filters['is_active'])
+    if filters['is_verified'] is not None:
+        queryset = queryset.filter(is_verified=filters['is_verified'])
+    if filters['city']:
+        queryset = queryset.filter(city__in=filters['city'])
+    if filters['property_type']:
+        queryset = queryset.filter(property_type__in=filters['property_type'])
+    if filters['min_price'] is not None:
+        queryset = queryset.filter(price_per_night__gte=filters['min_price'])
+    if filters['max_price'] is not None:
+        queryset = queryset.filter(price_per_night__lte=filters['max_price'])
+    if filters['guests'] is not None:
+        queryset = queryset.filter(max_guests__gte=filters['guests'])
+    if filters['bedrooms'] is not None:
+        queryset = queryset.filter(bedrooms__gte=filters['bedrooms'])
+    if filters['min_rating'] is not None:
+        queryset = queryset.filter(rating_avg__gte=filters['min_rating'])
+    if filters['min_reviews'] is not None:
+        queryset = queryset.filter(rating_count__gte=filters['min_reviews'])
+    for amenity in filters['amenities']:
+        queryset = queryset.filter(amenity_filter(amenity))
+    return queryset
+
+
+def _price_band():
+    whens = []
+    for label, low, high in PRICE_BANDS:
+        condition = Q()
+        if low is not None:
+            condition &= Q(price_per_night__gte=low)
+        if high is not None:
+            condition &= Q(price_per_night__lt=high)
+        whens.append(When(condition, then=Value(label)))
+    return Case(*whens, output_field=CharField())
+
+
+# Facet -> the filters on that facet's own column, left out when counting it
+FACET_FILTERS = {
+    'city': ('city',),
+    'property_type': ('property_type',),
+    'bedrooms': ('bedrooms',),
+    'max_guests': ('guests',),
+    'price': ('min_price', 'max_price'),
+    # Amenities combine with AND, so their counts keep the amenity filter
+    'amenities': (),
+}
+FACET_COLUMNS = {'city': 'city', 'property_type': 'property_type', 'bedrooms': 'bedrooms',
+                 'max_guests': 'max_guests', 'price': 'price_band'}
+EMPTY_FILTERS = {'city': [], 'property_type': [], 'amenities': []}
+
+
+def _without(filters, names):
+    return {**filters, **{name: EMPTY_FILTERS.get(name) for name in names}}
+
+
+def _column_counts(queryset, name):
+    if name == 'price':
+        queryset = queryset.annotate(price_band=_price_band())
+    column = FACET_COLUMNS[name]
+    return queryset.order_by().values_list(column).annotate(n=Count('id')).values_list(column, 'n')
+
+
+def _amenity_counts(queryset):
+    """[(amenity, count)], unnesting the JSON lists in the database where it can"""
+    sql, params = queryset.order_by().values('amenities').query.sql_with_params()
+    if connection.vendor == 'sqlite':
+        unnest = f'SELECT item.value, COUNT(*) FROM ({sql}) AS p, json_each(p.amenities) AS item GROUP BY item.value'
+    elif connection.vendor == 'postgresql':
+        unnest = f'SELECT item, COUNT(*) FROM ({sql}) AS p, jsonb_array_elements_text(p.amenities) AS item GROUP BY item'
+    else:
+        counter = Counter()
+        for amenities, n in queryset.order_by().values_list('amenities').annotate(n=Count('id')):
+            for amenity in set(amenities or []):
+                counter[amenity] += n
+        return counter.items()
+    with connection.cursor() as cursor:
+        cursor.execute(unnest, params)
+        return cursor.fetchall()
+
+
+def facet_counts(base, filters):
+    """Count facet values with one grouped query per facet.
+
+    base is the queryset before filter_queryset(). Each facet is counted
+    over the results of every filter except its own (see FACET_FILTERS), so
+    picking a city still lists the other cities with how many results
+    choosing them instead would give. When nothing matches, every facet is
+    empty. Returns (total, facets).
+    """
+    total = filter_queryset(base, filters).count()
+    facets = {name: [] for name in FACET_FILTERS}
+    if not total:
+        return total, facets
+
+    for name, own in FACET_FILTERS.items():
+        queryset = filter_queryset(base, _without(filters, own))
+        if name == 'amenities':
+            counts = _amenity_counts(queryset)
+        else:
+            counts = _column_counts(queryset, name)
+        counter = Counter(dict((value, n) for value, n in counts if value is not None))
+        facets[name] = [{'value': value, 'count': count} for value, count in counter.most_common()]
+
+    band_order = [label for label, _, _ in PRICE_BANDS]
+    facets['price'].sort(key=lambda item: band_order.index(item['value']))
+    for name in ('bedrooms', 'max_guests'):
+        facets[name].sort(key=lambda item: item['value'])
+    return total, facets
+
+
+def search_properties(params, queryset=None):
+    """Run a faceted search and return a JSON-ready dict"""
+    filters = parse_filters(params)
+    page = max(_int(params.get('page')) or 1, 1)
+    page_size = min(max(_int(params.get('page_size')) or DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE)
+    text = (params.get('q') or '').strip()
+    sort = params.get('sort') or ('relevance' if text else DEFAULT_SORT)
+    if sort not in SORTS:
+        raise ValueError(f'Unknown sort: {sort}')
+    if sort == 'relevance' and not text:
+        raise ValueError('sort=relevance needs a q search')
+    stay = _stay(params)
+
+    if queryset is None:
+        queryset = Property.objects.all()
+    if text:
+        queryset = fulltext.filter_queryset(queryset, text)
+    total, facets = facet_counts(queryset, filters)
+    queryset = filter_queryset(queryset, filters)
+
+    offset = (page - 1) * page_size
+    if sort == 'relevance':
+        results = fulltext.ranked_values(queryset, text, RESULT_FIELDS, offset, page_size)
+    else:
+        results = list(queryset.order_by(*SORTS[sort]).values(*RESULT_FIELDS)[offset:offset + page_size])
+    for row in results:
+        row['price_per_night'] = str(row['price_per_night'])
+        row['rating_avg'] = str(row['rating_avg'])
+    if stay:
+        # One batched pricing call for the whole page
+        quotes = pricing.quote_many([row['id'] for row in results], *stay, guests=filters['guests'] or 1)
+        for row in results:
+            row['quote'] = quotes[row['id']].as_dict() if row['id'] in quotes else None
+
+    return {
+        'results': results,
+        'count': total,
+        'page': page,
+        'page_size': page_size,
+        'total_pages': (total + page_size - 1) // page_size,
+        'facets': facets,
+    }
@@ -0,0 +1,109 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from . import availability, caching, fulltext, owner_stats, ratings
+from .models import Booking, Property, RatePlan, Review, SeasonalRate, StayDiscount
+
+
+def _bump_after_commit(*scopes):
+    transaction.on_commit(lambda: caching.bump(*scopes))
+
+
+@receiver(pre_save, sender=Booking)
+def booking_saving(sender, instance, **kwargs):
+    """Remember the stored property so a move can invalidate both"""
+    if instance.pk is not None:
+        instance._stored_property_id = (
+            Booking.objects.filter(pk=instance.pk).values_list('property_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def booking_changed(sender, instance, **kwargs):
+    """Keep the availability index and cached pages in step with booking writes"""
+    property_ids = {instance.property_id, getattr(instance, '_stored_property_id', None)} - {None}
+    for property_id in property_ids:
+        availability.invalidate(property_id)
+        _bump_after_commit(caching.property_scope(property_id))
+    instance._stored_property_id = instance.property_id
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def booking_rewritten(sender, instance, created=False, **kwargs):
+    """New bookings extend cached owner stats; edits and deletes reset them"""
+    if created:
+        return
+    owner_id = Property.objects.filter(pk=instance.property_id).values_list('owner_id', flat=True).first()
+    if owner_id is not None:
+        _bump_after_commit(owner_stats.owner_scope(owner_id))
+
+
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+def property_changed(sender, instance, **kwargs):
+    _bump_after_commit(
+        caching.PROPERTIES,
+        caching.property_scope(instance.pk),
+        caching.rates_scope(instance.pk),
+        owner_stats.owner_scope(instance.owner_id),
+    )
+
+
+@receiver(post_save, sender=Property)
+def property_saved(sender, instance, update_fields=None, **kwargs):
+    """Re-index the listing's text, unless the save left it untouched"""
+    if update_fields is None or set(update_fields) & set(fulltext.COLUMNS):
+        fulltext.reindex([instance.pk])
+
+
+@receiver(post_delete, sender=Property)
+def property_deleted(sender, instance, **kwargs):
+    fulltext.remove([instance.pk])
+
+
+@receiver(post_save, sender=RatePlan)
+@receiver(post_delete, sender=RatePlan)
+@receiver(post_save, sender=SeasonalRate)
+@receiver(post_delete, sender=SeasonalRate)
+@receiver(post_save, sender=StayDiscount)
+@receiver(post_delete, sender=StayDiscount)
+def rates_changed(sender, instance, **kwargs):
+    """Cached quotes for the property are stale"""
+    _bump_after_commit(caching.rates_scope(instance.property_id))
+
+
+@receiver(pre_save, sender=Review)
+def review_saving(sender, instance, **kwargs):
+    """Remember the stored rating so an edit can move it between buckets"""
+    if instance.pk is not None:
+        instance._stored_rating = (
+            Review.objects.filter(pk=instance.pk).values_list('property_id', 'rating').first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, '_stored_rating', None)
+    if previous is None:
+        ratings.apply(instance.property_id, added=[instance.rating])
+    elif previous[0] == instance.property_id:
+        ratings.apply(instance.property_id, added=[instance.rating], removed=[previous[1]])
+    else:
+        ratings.apply(previous[0], removed=[previous[1]])
+        ratings.apply(instance.property_id, added=[instance.rating])
+        _bump_after_commit(caching.property_scope(previous[0]))
+    instance._stored_rating = (instance.property_id, instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    ratings.apply(instance.property_id, removed=[instance.rating])
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def review_changed(sender, instance, **kwargs):
+    _bump_after_commit(caching.PROPERTIES, caching.property_scope(instance.property_id))
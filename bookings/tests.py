@@ -1,3 +1,762 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import gzip
+import hashlib
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.db import OperationalError, connection
+from django.test import RequestFactory, TestCase, TransactionTestCase
+
+from zamreach.db import run_serialized, save_form, serialized_write
+from zamreach.middleware import _IndexPage
+
+from . import availability, bulk, caching, fulltext, owner_stats, pricing, ratings, reservations, search
+from .models import Property, Booking, RatePlan, Review, SeasonalRate, StayDiscount
+
+
+class BookingFixtureMixin:
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='pass12345')
+        self.guest = User.objects.create_user('guest', password='pass12345')
+        self.lodge = Property.objects.create(owner=self.owner, name='River Lodge', location='Livingstone')
+        self.camp = Property.objects.create(owner=self.owner, name='Bush Camp', location='Mfuwe')
+        self.today = date.today()
+
+    def day(self, offset):
+        return self.today + timedelta(days=offset)
+
+    def book(self, prop, start, end, status='confirmed'):
+        return Booking.objects.create(
+            customer=self.guest, property=prop,
+            check_in=self.day(start), check_out=self.day(end),
+            total_price=100, status=status,
+        )
+
+
+class OccupancyIndexTests(TestCase):
+    def test_merges_and_bisects(self):
+        d = date(2026, 12, 1)
+        index = availability.OccupancyIndex.from_dates([
+            (d, d + timedelta(days=3)),
+            (d + timedelta(days=2), d + timedelta(days=5)),
+            (d + timedelta(days=10), d + timedelta(days=12)),
+        ])
+        self.assertEqual(len(index), 2)
+        self.assertFalse(index.is_free(d + timedelta(days=4), d + timedelta(days=6)))
+        # Check-out day is free for the next arrival
+        self.assertTrue(index.is_free(d + timedelta(days=5), d + timedelta(days=10)))
+        self.assertFalse(index.is_free(d - timedelta(days=1), d + timedelta(days=20)))
+
+
+class AvailabilityTests(BookingFixtureMixin, TestCase):
+    def test_single_property(self):
+        self.book(self.lodge, 5, 8)
+        self.assertFalse(availability.is_available(self.lodge.id, self.day(6), self.day(7)))
+        self.assertTrue(availability.is_available(self.lodge.id, self.day(8), self.day(10)))
+
+    def test_cancelled_bookings_release_dates(self):
+        self.book(self.lodge, 5, 8, status='cancelled')
+        self.assertTrue(availability.is_available(self.lodge.id, self.day(5), self.day(8)))
+
+    def test_cache_invalidated_on_new_booking(self):
+        self.assertTrue(availability.is_available(self.lodge.id, self.day(1), self.day(3)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book(self.lodge, 2, 4)
+        self.assertFalse(availability.is_available(self.lodge.id, self.day(1), self.day(3)))
+
+    def test_many_properties(self):
+        self.book(self.lodge, 1, 4)
+        ids = [self.lodge.id, self.camp.id]
+        self.assertEqual(availability.filter_available(ids, self.day(2), self.day(3)), [self.camp.id])
+        self.assertEqual(
+            list(availability.available_properties(self.day(2), self.day(3)).values_list('id', flat=True)),
+            [self.camp.id],
+        )
+
+    def test_invalid_range(self):
+        with self.assertRaises(ValueError):
+            availability.is_available(self.lodge.id, self.day(3), self.day(3))
+        with self.assertRaises(ValueError):
+            availability.filter_available([self.lodge.id], self.day(-3), self.day(1))
+
+    def test_only_existing_active_properties(self):
+        self.camp.is_active = False
+        self.camp.save()
+        ids = [self.lodge.id, self.camp.id, 424242]
+        self.assertEqual(availability.filter_available(ids, self.day(2), self.day(3)), [self.lodge.id])
+
+    def test_moved_booking_frees_old_property(self):
+        booking = self.book(self.lodge, 1, 4)
+        self.assertFalse(availability.is_available(self.lodge.id, self.day(2), self.day(3)))
+        self.assertTrue(availability.is_available(self.camp.id, self.day(2), self.day(3)))
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.property = self.camp
+            booking.save()
+        self.assertTrue(availability.is_available(self.lodge.id, self.day(2), self.day(3)))
+        self.assertFalse(availability.is_available(self.camp.id, self.day(2), self.day(3)))
+
+    def test_availability_endpoint(self):
+        self.book(self.lodge, 1, 4)
+        response = self.client.get(
+            f'/api/property/{self.lodge.id}/availability/',
+            {'check_in': self.day(2).isoformat(), 'check_out': self.day(5).isoformat()},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['available'])
+
+
+class PropertySearchTests(BookingFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.lodge.city = 'Livingstone'
+        self.lodge.property_type = 'lodge'
+        self.lodge.price_per_night = 250
+        self.lodge.amenities = ['pool', 'wifi']
+        self.lodge.save()
+        self.camp.property_type = 'camp'
+        self.camp.price_per_night = 80
+        self.camp.amenities = ['wifi']
+        self.camp.save()
+
+    def test_filters_and_facets(self):
+        data = search.search_properties({'amenities': 'wifi'})
+        self.assertEqual(data['count'], 2)
+        facets = data['facets']
+        self.assertEqual({f['value']: f['count'] for f in facets['amenities']}, {'wifi': 2, 'pool': 1})
+        self.assertEqual({f['value']: f['count'] for f in facets['price']}, {'50-100': 1, '200-500': 1})
+
+        data = search.search_properties({'amenities': 'pool', 'max_price': '300'})
+        self.assertEqual([row['id'] for row in data['results']], [self.lodge.id])
+
+    def test_facets_ignore_their_own_filter(self):
+        facets = search.search_properties({'property_type': 'camp'})['facets']
+        self.assertEqual({f['value']: f['count'] for f in facets['property_type']}, {'lodge': 1, 'camp': 1})
+        self.assertEqual({f['value']: f['count'] for f in facets['price']}, {'50-100': 1})
+
+    def test_no_matches_returns_empty_facets(self):
+        response = self.client.get('/api/properties/search/', {'city': 'Nowhere'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 0)
+        self.assertEqual(data['facets'], {name: [] for name in search.FACET_FILTERS})
+
+    def test_search_endpoint(self):
+        response = self.client.get('/api/properties/search/', {'property_type': 'camp', 'sort': 'price'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 1)
+        response = self.client.get('/api/properties/search/', {'min_price': 'cheap'})
+        self.assertEqual(response.status_code, 400)
+
+
+
+class FullTextSearchTests(BookingFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.lodge.city = 'Livingstone'
+        self.lodge.description = 'Riverside lodge with a pool and a view of the falls'
+        self.lodge.save()
+        self.camp.name = 'Café Mfuwe Bush Camp'
+        self.camp.description = 'Tented camp in South Luangwa, great for walking safaris'
+        self.camp.save()
+
+    def ids(self, text, **params):
+        return [row['id'] for row in search.search_properties({'q': text, **params})['results']]
+
+    def test_ranked_prefix_and_accent_insensitive(self):
+        self.assertEqual(fulltext.backend_name(), 'fts5')
+        self.assertEqual(self.ids('lodge near Livingstone with pool'), [self.lodge.id])
+        self.assertEqual(self.ids('livings'), [self.lodge.id])
+        self.assertEqual(self.ids('CAFE'), [self.camp.id])
+        self.assertEqual(self.ids('camp lodge'), [])
+        self.assertEqual(self.ids('camp'), [self.camp.id])
+        # A name hit outranks a description hit
+        self.lodge.description += ', next to the old camp site'
+        self.lodge.save()
+        self.assertEqual(self.ids('camp'), [self.camp.id, self.lodge.id])
+        self.assertEqual(search.search_properties({'q': 'camp', 'sort': 'price'})['count'], 2)
+
+    def test_index_follows_saves_deletes_and_imports(self):
+        self.camp.delete()
+        self.assertEqual(self.ids('mfuwe'), [])
+        self.lodge.name = 'Zambezi Sands'
+        self.lodge.save(update_fields=['name'])
+        self.assertEqual(self.ids('zambezi'), [self.lodge.id])
+        bulk.import_rows([json.dumps({'name': 'Kafue Hideaway', 'location': 'Itezhi-Tezhi'})], 'jsonl', owner=self.owner)
+        self.assertEqual(len(self.ids('hideaway')), 1)
+
+        connection.cursor().execute(f'DELETE FROM {fulltext.FTS_TABLE}')
+        self.assertEqual(self.ids('zambezi'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.ids('zambezi'), [self.lodge.id])
+
+    def test_in_process_fallback(self):
+        with mock.patch.object(fulltext, 'backend_name', return_value='memory'):
+            self.assertEqual(self.ids('cafe mfu'), [self.camp.id])
+            self.assertEqual(self.ids('falls'), [self.lodge.id])
+            self.assertEqual(self.ids('kafue'), [])
+
+    def test_in_process_index_refreshes_without_rebuilding(self):
+        with mock.patch.object(fulltext, 'backend_name', return_value='memory'):
+            before = fulltext.memory_index()
+            self.camp.name = 'Nsefu Bush Camp'
+            with self.captureOnCommitCallbacks(execute=True):
+                self.camp.save()
+                self.lodge.delete()
+            self.assertEqual(self.ids('nsefu'), [self.camp.id])
+            self.assertEqual(self.ids('cafe'), [])
+            self.assertEqual(self.ids('falls'), [])
+            self.assertEqual([pk for pk, _ in fulltext.search('camp')], [self.camp.id])
+            # Searches holding the previous index are unaffected
+            self.assertEqual(list(before.search(['cafe'])), [self.camp.id])
+            self.assertIn('falls', before.tokens)
+            self.assertNotIn('falls', fulltext.memory_index().tokens)
+
+    def test_relevance_sort_needs_text(self):
+        response = self.client.get('/api/properties/search/', {'sort': 'relevance'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/properties/search/', {'q': 'luangwa'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.camp.id])
+
+
+class VersionedCacheTests(BookingFixtureMixin, TestCase):
+    def test_fragment_invalidated_by_property_change(self):
+        calls = []
+        render = lambda: calls.append(1) or 'html'
+        scopes = [caching.property_scope(self.lodge.id)]
+        caching.cached_fragment('detail', scopes, render)
+        caching.cached_fragment('detail', scopes, render)
+        self.assertEqual(len(calls), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book(self.lodge, 1, 2)
+        caching.cached_fragment('detail', scopes, render)
+        self.assertEqual(len(calls), 2)
+
+    def test_page_cached_for_anonymous_only(self):
+        calls = []
+
+        @caching.cache_page_for_anonymous('property:{property_id}')
+        def view(request, property_id):
+            calls.append(property_id)
+            return HttpResponse('page')
+
+        factory = RequestFactory()
+        request = factory.get('/property/1/')
+        request.user = AnonymousUser()
+        view(request, property_id=self.lodge.id)
+        view(request, property_id=self.lodge.id)
+        self.assertEqual(len(calls), 1)
+
+        request.user = self.guest
+        view(request, property_id=self.lodge.id)
+        self.assertEqual(len(calls), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lodge.save()
+        request.user = AnonymousUser()
+        view(request, property_id=self.lodge.id)
+        self.assertEqual(len(calls), 3)
+
+
+class CompressedETagTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_gzip_and_conditional_get(self):
+        response = self.client.get('/search/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        body = gzip.decompress(response.content)
+        self.assertIn(b'<html', body.lower())
+
+        etag = response['ETag']
+        response = self.client.get('/search/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def cached_variant(self, response):
+        digest, encoding = response['ETag'].strip('"').split('-')
+        return cache.get(f'compressed:{encoding}:{digest}')
+
+    def test_caches_only_shared_pages(self):
+        response = self.client.get('/search/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(self.cached_variant(response), response.content)
+        response = self.client.get('/search/', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 304)
+
+        # Signed-in renders vary by cookie and are compressed without caching
+        cache.clear()
+        self.client.force_login(User.objects.create_user('viewer', password='pass12345'))
+        response = self.client.get('/search/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIsNone(self.cached_variant(response))
+
+    def test_identity_when_not_accepted(self):
+        response = self.client.get('/search/', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+
+
+class StaticDirectoryIndexTests(TestCase):
+    def setUp(self):
+        self.static = tempfile.TemporaryDirectory()
+        self.addCleanup(self.static.cleanup)
+        self.index = Path(self.static.name) / 'landing' / 'index.html'
+        self.index.parent.mkdir()
+        self.index.write_text('<html>v1</html>')
+
+    def test_serves_from_memory_and_reloads_on_mtime(self):
+        with self.settings(
+            STATICFILES_DIRS=[self.static.name],
+            STATIC_DIRECTORY_INDEXES={'/static/landing/': 'landing'},
+            STATIC_DIRECTORY_INDEX_RECHECK=0,
+        ):
+            response = self.client.get('/static/landing/', HTTP_ACCEPT_ENCODING='identity')
+            self.assertEqual(response.content, b'<html>v1</html>')
+            self.assertIn('max-age', response['Cache-Control'])
+            response = self.client.get('/static/landing/', HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+            self.index.write_text('<html>v2</html>')
+            os.utime(self.index, (time.time() + 10, time.time() + 10))
+            response = self.client.get('/static/landing/', HTTP_ACCEPT_ENCODING='identity')
+            self.assertEqual(response.content, b'<html>v2</html>')
+
+    def test_reload_swaps_body_and_etag_together(self):
+        page = _IndexPage([str(self.index)])
+        page.refresh()
+        held = page.loaded
+        self.index.write_text('<html>v2</html>')
+        os.utime(self.index, (time.time() + 10, time.time() + 10))
+        page.refresh()
+        # The old value is replaced, not edited, so a reader holding it keeps a matching pair
+        self.assertEqual(held[2], b'<html>v1</html>')
+        self.assertEqual(held[3], f'"{hashlib.sha256(held[2]).hexdigest()[:32]}"')
+        self.assertEqual(page.loaded[2], b'<html>v2</html>')
+        self.index.unlink()
+        page.refresh()
+        self.assertIsNone(page.loaded)
+
+
+class SerializedWriteTests(TransactionTestCase):
+    def test_retries_locked_database_then_commits(self):
+        calls = []
+
+        @serialized_write(attempts=3)
+        def create_user():
+            calls.append(1)
+            User.objects.create_user(f'writer{len(calls)}', password='pass12345')
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+
+        with self.settings(DB_WRITE_BACKOFF=0):
+            create_user()
+        self.assertEqual(len(calls), 3)
+        # Failed attempts were rolled back
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['writer3'])
+
+    def test_other_errors_are_not_retried(self):
+        calls = []
+
+        def broken():
+            calls.append(1)
+            raise OperationalError('no such table: nowhere')
+
+        with self.assertRaises(OperationalError):
+            run_serialized(broken)
+        self.assertEqual(len(calls), 1)
+
+    def test_save_form_retries_with_a_fresh_instance(self):
+        class FlakyForm(UserCreationForm):
+            attempts = 0
+
+            def save(self, commit=True):
+                user = super().save(commit)
+                FlakyForm.attempts += 1
+                if FlakyForm.attempts == 1:
+                    raise OperationalError('database is locked')
+                return user
+
+        form = FlakyForm({'username': 'retried', 'password1': 'Zx9!long-pass', 'password2': 'Zx9!long-pass'})
+        self.assertTrue(form.is_valid())
+        with self.settings(DB_WRITE_BACKOFF=0):
+            user = save_form(form)
+        self.assertEqual(FlakyForm.attempts, 2)
+        self.assertEqual(list(User.objects.values_list('pk', 'username')), [(user.pk, 'retried')])
+
+    def test_admin_posts_are_serialized(self):
+        admin = User.objects.create_superuser('root', password='pass12345')
+        self.client.force_login(admin)
+        with mock.patch('zamreach.admin.run_serialized', side_effect=run_serialized) as serialized:
+            self.client.get(f'/admin/auth/user/{admin.pk}/change/')
+            self.assertFalse(serialized.called)
+            response = self.client.post('/admin/auth/user/add/', {
+                'username': 'staffer', 'password1': 'Zx9!long-pass', 'password2': 'Zx9!long-pass',
+                'usable_password': 'true',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(serialized.called)
+        self.assertTrue(User.objects.filter(username='staffer').exists())
+
+    def test_connection_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertGreater(cursor.fetchone()[0], 0)
+
+
+class ReservationTests(BookingFixtureMixin, TestCase):
+    def test_reserve_refuses_overlaps_but_not_cancelled(self):
+        booking = reservations.reserve(self.guest, self.lodge.id, self.day(1), self.day(4), guests=2)
+        self.assertEqual(booking.total_price, self.lodge.price_per_night * 3)
+        with self.assertRaises(reservations.BookingConflict):
+            reservations.reserve(self.guest, self.lodge.id, self.day(3), self.day(5), precheck=False)
+        # Back-to-back stays share the changeover day
+        reservations.reserve(self.guest, self.lodge.id, self.day(4), self.day(5))
+        # Past stays are refused even without the cached precheck
+        with self.assertRaises(ValueError):
+            reservations.reserve(self.guest, self.lodge.id, self.day(-2), self.day(-1), precheck=False)
+
+        booking.status = 'cancelled'
+        booking.save()
+        reservations.reserve(self.guest, self.lodge.id, self.day(2), self.day(3))
+        with self.assertRaises(ValueError):
+            reservations.reserve(self.guest, self.camp.id, self.day(1), self.day(2), guests=9)
+
+    def test_endpoint(self):
+        url = f'/api/property/{self.lodge.id}/reserve/'
+        payload = {'check_in': self.day(1).isoformat(), 'check_out': self.day(3).isoformat()}
+        response = self.client.post(url, payload, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+        self.client.login(username='guest', password='pass12345')
+        response = self.client.post(url, payload, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['status'], 'pending')
+        response = self.client.post(url, payload, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        response = self.client.post(url, {'check_in': 'soon'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        past = {'check_in': self.day(-3).isoformat(), 'check_out': self.day(-1).isoformat()}
+        self.assertEqual(self.client.post(url, past, content_type='application/json').status_code, 400)
+
+
+class ReservationConcurrencyTests(TransactionTestCase):
+    def test_parallel_attempts_never_double_book(self):
+        out = StringIO()
+        call_command('bench_reservations', attempts=60, workers=12, window_days=5,
+                     skip_precheck=True, seed=3, stdout=out)
+        self.assertIn('0 double bookings', out.getvalue())
+        self.assertIn('errors:    0', out.getvalue())
+
+
+class PricingTests(BookingFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        RatePlan.objects.create(property=self.lodge, weekend_uplift_percent=20,
+                                included_guests=2, extra_guest_fee=10)
+        self.season = SeasonalRate.objects.create(property=self.lodge, start_date=self.day(5),
+                                                  end_date=self.day(12), nightly_rate=150)
+        StayDiscount.objects.create(property=self.lodge, min_nights=7, percent=10)
+
+    def night_by_night(self, start, end, guests):
+        total = Decimal(0)
+        for offset in range(start, end):
+            night = self.day(offset)
+            rate = Decimal(150) if self.day(5) <= night < self.day(12) else Decimal(str(self.lodge.price_per_night))
+            if night.weekday() in (4, 5):
+                rate *= Decimal('1.2')
+            total += rate + 10 * max(guests - 2, 0)
+        nights = end - start
+        total = total.quantize(Decimal('0.01'))
+        return total - (total * 10 / 100).quantize(Decimal('0.01')) if nights >= 7 else total
+
+    def test_closed_form_matches_night_by_night(self):
+        for start in range(0, 7):
+            for end in (start + 1, start + 6, start + 9, start + 30):
+                quote = pricing.quote(self.lodge.id, self.day(start), self.day(end), guests=3)
+                self.assertEqual(quote.total, self.night_by_night(start, end, 3), (start, end))
+
+    def test_batch_quotes_are_cached_until_rates_change(self):
+        quotes = pricing.quote_many([self.lodge.id, self.camp.id, 0], self.day(1), self.day(3))
+        self.assertEqual(set(quotes), {self.lodge.id, self.camp.id})
+        self.assertEqual(quotes[self.camp.id].total, self.camp.price_per_night * 2)
+        with self.assertNumQueries(0):
+            pricing.quote_many([self.lodge.id, self.camp.id], self.day(1), self.day(3))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SeasonalRate.objects.create(property=self.camp, start_date=self.day(0),
+                                        end_date=self.day(10), nightly_rate=40)
+        self.assertEqual(pricing.quote(self.camp.id, self.day(1), self.day(3)).total, 80)
+
+    def test_search_and_reservations_use_quotes(self):
+        response = self.client.get('/api/properties/search/', {
+            'check_in': self.day(5).isoformat(), 'check_out': self.day(6).isoformat(),
+        })
+        quotes = {row['id']: row['quote'] for row in response.json()['results']}
+        self.assertEqual(quotes[self.lodge.id]['total'],
+                         str(pricing.quote(self.lodge.id, self.day(5), self.day(6)).total))
+        booking = reservations.reserve(self.guest, self.lodge.id, self.day(20), self.day(28), guests=2)
+        self.assertEqual(booking.total_price, self.night_by_night(20, 28, 2))
+
+
+class CalendarTests(BookingFixtureMixin, TestCase):
+    def test_bitmap_and_runs_match_bookings(self):
+        start = self.today.replace(day=1)
+        self.book(self.lodge, 2, 5)
+        self.book(self.lodge, 5, 6)
+        self.book(self.lodge, 8, 9, status='cancelled')
+        url = f'/api/property/{self.lodge.id}/calendar/'
+
+        data = self.client.get(url, {'months': 2}).json()
+        self.assertEqual(data['start'], start.isoformat())
+        bits = base64.b64decode(data['data'])
+        unavailable = [(bits[i >> 3] >> (7 - (i & 7))) & 1 for i in range(data['days'])]
+        expected = [
+            int(start + timedelta(days=i) < self.today or self.day(2) <= start + timedelta(days=i) < self.day(6))
+            for i in range(data['days'])
+        ]
+        self.assertEqual(unavailable, expected)
+
+        runs = self.client.get(url, {'months': 2, 'format': 'rle'}).json()['data']
+        self.assertEqual(sum(runs), data['days'])
+        decoded = []
+        for i, length in enumerate(runs):
+            decoded += [i % 2] * length
+        self.assertEqual(decoded, expected)
+
+    def test_cached_until_booking_changes(self):
+        url = f'/api/property/{self.lodge.id}/calendar/'
+        first = self.client.get(url, {'format': 'rle'}).json()['data']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book(self.lodge, 40, 42)
+        self.assertNotEqual(self.client.get(url, {'format': 'rle'}).json()['data'], first)
+        self.assertEqual(self.client.get(url, {'months': 99}).status_code, 400)
+
+
+class RatingAggregateTests(BookingFixtureMixin, TestCase):
+    def review(self, prop, rating, start):
+        return Review.objects.create(booking=self.book(prop, start, start + 1), property=prop,
+                                     customer=self.guest, rating=rating)
+
+    def test_incremental_updates_match_recompute(self):
+        first = self.review(self.lodge, 5, 1)
+        second = self.review(self.lodge, 2, 2)
+        self.review(self.camp, 4, 3)
+        self.lodge.refresh_from_db()
+        self.assertEqual((self.lodge.rating_count, self.lodge.rating_avg), (2, Decimal('3.50')))
+        self.assertEqual(self.lodge.rating_histogram, {1: 0, 2: 1, 3: 0, 4: 0, 5: 1})
+
+        second.rating = 4
+        second.save()
+        first.property = self.camp
+        first.save()
+        second.delete()
+        incremental = list(Property.objects.order_by('id').values_list(*ratings.FIELDS))
+        Property.objects.update(rating_count=9, rating_avg=1, rating_5=9)
+        call_command('recompute_ratings', stdout=StringIO())
+        self.assertEqual(list(Property.objects.order_by('id').values_list(*ratings.FIELDS)), incremental)
+        self.camp.refresh_from_db()
+        self.assertEqual((self.camp.rating_count, self.camp.rating_avg), (2, Decimal('4.50')))
+
+    def test_search_sorts_and_filters_by_rating(self):
+        self.review(self.lodge, 3, 1)
+        self.review(self.camp, 5, 2)
+        data = search.search_properties({'sort': 'rating'})
+        self.assertEqual([row['id'] for row in data['results']], [self.camp.id, self.lodge.id])
+        self.assertEqual(data['results'][0]['rating_avg'], '5.00')
+        data = search.search_properties({'min_rating': '4'})
+        self.assertEqual([row['id'] for row in data['results']], [self.camp.id])
+
+
+class OwnerStatsTests(BookingFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.start = date(2026, 3, 1)
+        self.end = date(2026, 5, 1)
+
+    def stay(self, prop, check_in, nights, price=100, status='confirmed'):
+        return Booking.objects.create(customer=self.guest, property=prop, check_in=check_in,
+                                      check_out=check_in + timedelta(days=nights),
+                                      total_price=price, status=status)
+
+    def test_monthly_series_splits_nights_across_buckets(self):
+        self.stay(self.lodge, date(2026, 3, 30), 4, price=400)
+        self.stay(self.camp, date(2026, 4, 10), 3, price=300)
+        self.stay(self.camp, date(2026, 4, 20), 1, status='cancelled')
+        data = owner_stats.owner_series(self.owner.id, self.start, self.end, 'month')
+        self.assertEqual(data['buckets'], ['2026-03-01', '2026-04-01'])
+        lodge, camp = data['properties']
+        self.assertEqual((lodge['revenue'], lodge['bookings']), (['400.00', '0'], [1, 0]))
+        self.assertEqual(lodge['occupancy'], [round(2 / 31, 4), round(2 / 30, 4)])
+        self.assertEqual(camp['revenue'], ['0', '300.00'])
+        self.assertEqual(data['totals']['bookings'], [1, 1])
+
+    def test_new_bookings_extend_cache_and_edits_reset_it(self):
+        with self.settings(OWNER_STATS_GRACE_SECONDS=0):
+            self.stay(self.lodge, date(2026, 3, 2), 2)
+            owner_stats.owner_series(self.owner.id, self.start, self.end, 'week')
+            # Only the booking above the watermark is read
+            with self.captureOnCommitCallbacks(execute=True):
+                booking = self.stay(self.lodge, date(2026, 3, 10), 1, price=50)
+            data = owner_stats.owner_series(self.owner.id, self.start, self.end, 'week')
+            self.assertEqual(sum(data['totals']['bookings']), 2)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                booking.status = 'cancelled'
+                booking.save()
+            data = owner_stats.owner_series(self.owner.id, self.start, self.end, 'week')
+            self.assertEqual(sum(data['totals']['bookings']), 1)
+
+    def test_endpoint(self):
+        url = '/api/owner/stats/'
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.login(username='owner', password='pass12345')
+        response = self.client.get(url, {'period': 'day'})
+        self.assertEqual(len(response.json()['buckets']), 30)
+        self.assertEqual(len(response.json()['properties']), 2)
+        self.assertEqual(self.client.get(url, {'period': 'year'}).status_code, 400)
+
+
+class BulkListingTests(BookingFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.lodge.amenities = ['wifi', 'pool']
+        self.lodge.save()
+        self.owner.profile.role = 'owner'
+        self.owner.profile.save()
+
+    def test_csv_round_trip_updates_and_creates(self):
+        exported = ''.join(bulk.stream(Property.objects.all(), 'csv'))
+        rows = list(csv.DictReader(exported.splitlines()))
+        self.assertEqual(json.loads(rows[0]['amenities']), ['wifi', 'pool'])
+
+        rows[0]['price_per_night'] = '250.00'
+        rows[1]['id'] = ''
+        rows[1]['name'] = 'Bush Camp Annex'
+        edited = StringIO()
+        writer = csv.DictWriter(edited, fieldnames=bulk.FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+        report = bulk.import_rows(StringIO(edited.getvalue()), 'csv', owner=self.owner)
+        self.assertEqual((report.created, report.updated, report.failed), (1, 1, 0))
+        self.lodge.refresh_from_db()
+        self.assertEqual(self.lodge.price_per_night, Decimal('250.00'))
+        self.assertEqual(self.lodge.amenities, ['wifi', 'pool'])
+        self.assertTrue(Property.objects.filter(name='Bush Camp Annex', owner=self.owner).exists())
+
+    def test_jsonl_errors_are_reported_per_line(self):
+        lines = [
+            json.dumps({'name': 'Lake House', 'location': 'Siavonga', 'amenities': ['boat']}),
+            json.dumps({'name': 'Bad', 'location': 'X', 'property_type': 'castle', 'bedrooms': 'many'}),
+            '{"torn',
+            json.dumps({'id': self.camp.id, 'price_per_night': '80'}),
+            json.dumps({'id': 424242, 'name': 'Ghost'}),
+        ]
+        report = bulk.import_rows(lines, 'jsonl', owner=self.guest, batch_size=2)
+        self.assertEqual((report.created, report.updated, report.failed), (1, 0, 4))
+        self.assertEqual([error['line'] for error in report.errors], [2, 3, 4, 5])
+        self.assertIn('bedrooms', report.errors[0]['errors'])
+
+    def test_endpoints(self):
+        self.assertEqual(self.client.get('/api/properties/export/').status_code, 401)
+        self.client.login(username='guest', password='pass12345')
+        self.assertEqual(self.client.get('/api/properties/export/').status_code, 403)
+
+        self.client.login(username='owner', password='pass12345')
+        response = self.client.get('/api/properties/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([int(row['id']) for row in rows], [self.lodge.id, self.camp.id])
+        self.assertEqual(self.client.get('/api/properties/export/', {'format': 'xml'}).status_code, 400)
+
+        response = self.client.get('/api/properties/export/', {'format': 'jsonl'})
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.lodge.id, self.camp.id])
+
+        upload = SimpleUploadedFile('listings.jsonl', json.dumps({'name': 'Falls View', 'location': 'Livingstone'}).encode())
+        response = self.client.post('/api/properties/import/?dry_run=1', {'file': upload})
+        self.assertEqual(response.json()['created'], 1)
+        self.assertFalse(Property.objects.filter(name='Falls View').exists())
+
+
+class BookingExportTests(BookingFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner.profile.role = 'owner'
+        self.owner.profile.save()
+        self.guest.email = 'guest@example.com'
+        self.guest.save()
+        self.first = self.book(self.lodge, 1, 3)
+        self.first.payment_method = 'mobile money'
+        self.first.transaction_id = 'TX-1'
+        self.first.save()
+        self.second = self.book(self.camp, 10, 12, status='cancelled')
+        other = User.objects.create_user('other')
+        self.foreign = self.book(Property.objects.create(owner=other, name='Elsewhere', location='Ndola'), 1, 2)
+
+    def test_rows_join_property_and_customer(self):
+        rows = list(csv.DictReader(''.join(bulk.stream_bookings(Booking.objects.all(), 'csv')).splitlines()))
+        self.assertEqual([int(row['id']) for row in rows], [self.first.id, self.second.id, self.foreign.id])
+        self.assertEqual(rows[0]['property_name'], 'River Lodge')
+        self.assertEqual(rows[0]['customer_email'], 'guest@example.com')
+        self.assertEqual(rows[0]['transaction_id'], 'TX-1')
+        self.assertEqual(rows[0]['total_price'], '100.00')
+        self.assertEqual(rows[0]['check_in'], self.day(1).isoformat())
+
+    def test_filters_and_resume(self):
+        bookings = Booking.objects.all()
+        self.assertEqual(
+            [row['id'] for row in bulk.booking_rows(bulk.filter_bookings(bookings, statuses=['cancelled']))],
+            [self.second.id],
+        )
+        self.assertEqual(
+            [row['id'] for row in bulk.booking_rows(bulk.filter_bookings(bookings, start=self.day(5)))],
+            [self.second.id],
+        )
+        self.assertEqual(
+            [row['id'] for row in bulk.booking_rows(bulk.filter_bookings(bookings, after=self.first.id))],
+            [self.second.id, self.foreign.id],
+        )
+        with self.assertRaises(ValueError):
+            bulk.filter_bookings(bookings, statuses=['lost'])
+
+    def test_endpoint_scopes_to_owner(self):
+        self.assertEqual(self.client.get('/api/bookings/export/').status_code, 401)
+        self.client.login(username='guest', password='pass12345')
+        self.assertEqual(self.client.get('/api/bookings/export/').status_code, 403)
+
+        self.client.login(username='owner', password='pass12345')
+        response = self.client.get('/api/bookings/export/', {'format': 'jsonl'})
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.first.id, self.second.id])
+        self.assertEqual(rows[0]['payment_method'], 'mobile money')
+
+        response = self.client.get('/api/bookings/export/', {'after': self.first.id, 'status': 'cancelled,pending'})
+        self.assertEqual(len(b''.join(response.streaming_content).decode().splitlines()), 2)
+        self.assertEqual(self.client.get('/api/bookings/export/', {'start': 'soon'}).status_code, 400)
+        # An empty format means CSV, as for the listing export
+        response = self.client.get('/api/bookings/export/', {'format': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).decode().startswith('id,'))
@@ -30,6 +30,17 @@ urlpatterns = [
     # Admin URLs
     path('admin/users/', views.admin_users, name='admin_users'),
     path('admin/properties/', views.admin_properties, name='admin_properties'),
+    
+    # JSON API
+    path('api/properties/search/', views.property_search_api, name='property_search_api'),
+    path('api/properties/export/', views.export_properties, name='export_properties'),
+    path('api/properties/import/', views.import_properties, name='import_properties'),
+    path('api/bookings/export/', views.export_bookings, name='export_bookings'),
+    path('api/availability/', views.availability_search, name='availability_search'),
+    path('api/property/<int:property_id>/availability/', views.property_availability, name='property_availability'),
+    path('api/property/<int:property_id>/calendar/', views.property_calendar, name='property_calendar'),
+    path('api/property/<int:property_id>/reserve/', views.reserve_property, name='reserve_property'),
+    path('api/owner/stats/', views.owner_stats_api, name='owner_stats_api'),
 ]
 
 
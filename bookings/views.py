@@ -1,26 +1,46 @@
-﻿from django.shortcuts import render, redirect, get_object_or_404
+﻿import codecs
+import json
+
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_GET, require_POST
 from .models import Property, Booking, Review
+from . import availability, bulk, caching, owner_stats, reservations, search
+from .caching import cache_page_for_anonymous, cached_render
+from zamreach.db import run_serialized, save_form
+from zamreach.middleware import compressed_cache
 
 # ==================== CUSTOMER PAGES (REDESIGN) ====================
 
+@compressed_cache
+@cache_page_for_anonymous(caching.PROPERTIES)
 def home(request):
     """Home page - using ZamStay Redesign with apartments/hotels/lodges"""
     # Option 1: Use the ZamStay redesign static file (has all 3 categories)
-    return render(request, 'customer/home.html')
+    return cached_render(request, 'customer/home.html', scopes=[caching.PROPERTIES])
     # Option 2: Or use the property-detail.html template if you want Django template
     # return render(request, 'property-detail.html')
 
+@compressed_cache
+@cache_page_for_anonymous(caching.PROPERTIES)
 def property_search(request):
     """Property search page - using customer/search.html"""
-    return render(request, 'customer/search.html')
+    return cached_render(request, 'customer/search.html', scopes=[caching.PROPERTIES])
 
+@compressed_cache
+@cache_page_for_anonymous('property:{property_id}')
 def property_detail(request, property_id):
     """Property detail page - using the FULL booking system template"""
-    return render(request, 'property-detail.html', {'property_id': property_id})
+    return cached_render(
+        request, 'property-detail.html', {'property_id': property_id},
+        scopes=[caching.property_scope(property_id)],
+    )
 
 def properties(request):
     """Properties page - simple redirect to search for now"""
@@ -53,8 +73,9 @@ def signup_view(request):
     if request.method == 'POST':
         form = UserCreationForm(request.POST)
         if form.is_valid():
-            user = form.save()
-            login(request, user)
+            # Creating the user also writes counters and updates last_login
+            user = save_form(form)
+            run_serialized(login, request, user)
             return redirect('home')
     else:
         form = UserCreationForm()
@@ -69,7 +90,7 @@ def login_view(request):
             password = form.cleaned_data.get('password')
             user = authenticate(username=username, password=password)
             if user is not None:
-                login(request, user)
+                run_serialized(login, request, user)
                 return redirect('home')
     else:
         form = AuthenticationForm()
@@ -149,3 +170,307 @@ def check_homepage(request):
             <hr>
             <p><a href="/bookings/demo/">Try Demo Page</a></p>
         ''')
+
+
+# ==================== JSON API ====================
+
+def _date_range(params):
+    """Parse check_in/check_out query params, raising ValueError when invalid"""
+    check_in = parse_date(params.get('check_in', ''))
+    check_out = parse_date(params.get('check_out', ''))
+    availability.validate_stay(check_in, check_out)
+    return check_in, check_out
+
+@require_GET
+def property_search_api(request):
+    """Filtered, paginated properties plus facet counts for customer/search.html"""
+    try:
+        data = search.search_properties(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(data)
+
+@require_GET
+def property_availability(request, property_id):
+    """Is a single property free for the requested dates?"""
+    get_object_or_404(Property, pk=property_id)
+    try:
+        check_in, check_out = _date_range(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'property_id': property_id,
+        'check_in': check_in.isoformat(),
+        'check_out': check_out.isoformat(),
+        'available': availability.is_available(property_id, check_in, check_out),
+    })
+
+@require_GET
+def availability_search(request):
+    """Which properties are free for the requested dates?
+
+    With ?property_ids=1,2,3 only those properties are checked (served from the
+    cached indexes); otherwise every active property is considered.
+    """
+    try:
+        check_in, check_out = _date_range(request.GET)
+        raw_ids = request.GET.get('property_ids', '')
+        property_ids = [int(pk) for pk in raw_ids.split(',') if pk.strip()]
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    if property_ids:
+        available = availability.filter_available(property_ids, check_in, check_out)
+    else:
+        available = list(
+            availability.available_properties(check_in, check_out)
+            .order_by('id').values_list('id', flat=True)
+        )
+
+    return JsonResponse({
+        'check_in': check_in.isoformat(),
+        'check_out': check_out.isoformat(),
+        'available': available,
+    })
+
+CALENDAR_MAX_MONTHS = 24
+CALENDAR_FORMATS = ('bitmap', 'rle')
+
+def _add_months(day, months):
+    month = day.month - 1 + months
+    return day.replace(year=day.year + month // 12, month=month % 12 + 1, day=1)
+
+@require_GET
+def property_calendar(request, property_id):
+    """Month-grid availability for property-detail.html.
+
+    ?start=YYYY-MM (default: this month), ?months=1..24 (default 3) and
+    ?format=bitmap|rle. bitmap is base64 with one bit per day from start,
+    most significant bit first, set when the day cannot be booked; rle is
+    alternating run lengths starting with available days.
+    """
+    get_object_or_404(Property, pk=property_id)
+    try:
+        raw_start = request.GET.get('start') or timezone.localdate().strftime('%Y-%m')
+        start = parse_date(raw_start if len(raw_start) > 7 else f'{raw_start}-01')
+        if start is None:
+            raise ValueError(f'Invalid start: {raw_start}')
+        start = start.replace(day=1)
+        months = int(request.GET.get('months', 3))
+        if not 1 <= months <= CALENDAR_MAX_MONTHS:
+            raise ValueError(f'months must be between 1 and {CALENDAR_MAX_MONTHS}')
+        encoding = request.GET.get('format', 'bitmap')
+        if encoding not in CALENDAR_FORMATS:
+            raise ValueError(f'format must be one of: {", ".join(CALENDAR_FORMATS)}')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    end = _add_months(start, months)
+    days = (end - start).days
+
+    def build():
+        runs = availability.unavailable_runs(property_id, start, days)
+        if encoding == 'bitmap':
+            data = availability.calendar_bitmap(runs, days)
+        else:
+            data = availability.calendar_runs(runs, days)
+        return {
+            'property_id': property_id,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'days': days,
+            'format': encoding,
+            'data': data,
+        }
+
+    payload = caching.cached_fragment(
+        'calendar', [caching.property_scope(property_id)], build,
+        vary=(property_id, start, months, encoding, timezone.localdate()),
+    )
+    response = JsonResponse(payload)
+    response['Cache-Control'] = 'max-age=60'
+    return response
+
+@require_POST
+def reserve_property(request, property_id):
+    """Book a property for the requested dates.
+
+    Accepts JSON or form data with check_in, check_out, guests and optional
+    special_requests. Responds 201 with the booking, or 409 when the dates
+    were taken first.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+        if not isinstance(data, dict):
+            return JsonResponse({'error': 'Expected a JSON object'}, status=400)
+    else:
+        data = request.POST
+
+    try:
+        check_in, check_out = _date_range(data)
+        guests = int(data.get('guests', 1))
+        booking = reservations.reserve(
+            request.user, property_id, check_in, check_out,
+            guests=guests,
+            special_requests=str(data.get('special_requests', ''))[:2000],
+        )
+    except Property.DoesNotExist:
+        return JsonResponse({'error': 'Property not found'}, status=404)
+    except reservations.BookingConflict as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    except (TypeError, ValueError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'id': booking.id,
+        'property_id': property_id,
+        'check_in': booking.check_in.isoformat(),
+        'check_out': booking.check_out.isoformat(),
+        'guests': booking.guests,
+        'total_price': str(booking.total_price),
+        'status': booking.status,
+    }, status=201)
+
+@require_GET
+def owner_stats_api(request):
+    """Revenue, bookings and occupancy per property for the owner dashboard.
+
+    ?period=day|week|month (default month) with optional ?start and ?end
+    (YYYY-MM-DD, end exclusive). Staff may pass ?owner=<user id>.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    owner_id = request.user.id
+    try:
+        if request.GET.get('owner') and request.user.is_staff:
+            owner_id = int(request.GET['owner'])
+        start = parse_date(request.GET.get('start', ''))
+        end = parse_date(request.GET.get('end', ''))
+        if (start is None) != (end is None):
+            raise ValueError('start and end must be given together')
+        data = owner_stats.owner_series(owner_id, start, end, request.GET.get('period', 'month'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(data)
+
+def _can_manage_listings(user):
+    profile = getattr(user, 'profile', None)
+    return user.is_staff or (profile is not None and profile.role in ('owner', 'admin'))
+
+@require_GET
+def export_properties(request):
+    """Stream listings as ?format=csv (default) or jsonl.
+
+    Owners get their own listings; staff get everyone's, with an owner column,
+    or one owner's with ?owner=<user id>.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    if not _can_manage_listings(request.user):
+        return JsonResponse({'error': 'Only property owners can export listings'}, status=403)
+
+    fmt = bulk.format_for(request.GET.get('format') or 'csv', default='')
+    if fmt not in bulk.FORMATS:
+        return JsonResponse({'error': f'format must be one of: {", ".join(bulk.FORMATS)}'}, status=400)
+
+    properties = Property.objects.all()
+    if not request.user.is_staff:
+        properties = properties.filter(owner=request.user)
+    elif request.GET.get('owner', '').isdigit():
+        properties = properties.filter(owner_id=int(request.GET['owner']))
+
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(
+        bulk.stream(properties, fmt, with_owner=request.user.is_staff),
+        content_type=f'{content_type}; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="properties.{fmt}"'
+    return response
+
+@require_GET
+def export_bookings(request):
+    """Stream bookings on the caller's properties as ?format=csv (default) or jsonl.
+
+    Filters: ?start=&end= (check-in dates, end exclusive), ?status=a,b and
+    ?after=<booking id> to resume an interrupted export. Staff get every
+    booking, or one owner's with ?owner=<user id>.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    if not _can_manage_listings(request.user):
+        return JsonResponse({'error': 'Only property owners can export bookings'}, status=403)
+
+    fmt = bulk.format_for(request.GET.get('format') or 'csv', default='')
+    if fmt not in bulk.FORMATS:
+        return JsonResponse({'error': f'format must be one of: {", ".join(bulk.FORMATS)}'}, status=400)
+
+    bookings = Booking.objects.all()
+    if not request.user.is_staff:
+        bookings = bookings.filter(property__owner=request.user)
+    elif request.GET.get('owner', '').isdigit():
+        bookings = bookings.filter(property__owner_id=int(request.GET['owner']))
+
+    try:
+        dates = {}
+        for name in ('start', 'end'):
+            raw = request.GET.get(name)
+            if raw:
+                dates[name] = parse_date(raw)
+                if dates[name] is None:
+                    raise ValueError(f'{name} must be a date (YYYY-MM-DD)')
+        after = request.GET.get('after')
+        if after is not None and not after.isdigit():
+            raise ValueError('after must be a booking id')
+        statuses = [value for value in request.GET.get('status', '').split(',') if value]
+        bookings = bulk.filter_bookings(
+            bookings, statuses=statuses, after=int(after) if after else None, **dates,
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(
+        bulk.stream_bookings(bookings, fmt),
+        content_type=f'{content_type}; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="bookings.{fmt}"'
+    return response
+
+@require_POST
+def import_properties(request):
+    """Create or update listings from an uploaded CSV or JSONL file ('file').
+
+    Rows with an id update that listing, others create one. ?dry_run=1
+    validates without writing. Staff imports may set an owner (username)
+    column and update any listing. Responds with a per-row error report.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    if not _can_manage_listings(request.user):
+        return JsonResponse({'error': 'Only property owners can import listings'}, status=403)
+
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'error': 'Upload the listings as "file"'}, status=400)
+    fmt = bulk.format_for(request.GET.get('format') or upload.name)
+
+    staff = request.user.is_staff
+    try:
+        report = bulk.import_rows(
+            codecs.iterdecode(upload, 'utf-8-sig'), fmt,
+            owner=request.user,
+            restrict_to_owner=not staff,
+            allow_owner_column=staff,
+            dry_run=request.GET.get('dry_run') in ('1', 'true'),
+        )
+    except (UnicodeDecodeError, ValueError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(report.as_dict())
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class BusinessAdsConfig(AppConfig):
     name = 'business_ads'
+
+    def ready(self):
+        from . import signals  # noqa: F401
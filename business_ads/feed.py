@@ -0,0 +1,113 @@
+"""
+Per-user activity feed for the dashboard widget.
+
+The latest FEED_SIZE activities of each user are kept in the cache as a
+ring buffer: a list of plain dicts, newest first. A new Activity is pushed
+onto the front of its user's buffer once its transaction commits and the
+oldest entry falls off the end, so reads never touch the activities table
+while the buffer is warm. A cold or evicted buffer is refilled with one
+query on the (user, -created_at) index, which also serves paging further
+back through page(): keyset pages on (created_at, id), so activities that
+share a timestamp are never skipped at a page boundary.
+
+Pushes read, modify and write the buffer, so two activities for the same
+user committing at the same instant can lose one from the buffer (not the
+table) until it expires. Deleting an activity drops the user's buffer; it
+is refilled on next read.
+
+Activities written with bulk_create skip the signals, so callers doing that
+should call invalidate() for the users affected.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from api.pagination import CREATED, KeysetPage, cursor_after, paginate
+
+from .models import Activity
+
+CACHE_PREFIX = 'activityfeed'
+CACHE_TIMEOUT = 60 * 60 * 24
+FEED_SIZE = 20
+
+FIELDS = ['id', 'activity_type', 'description', 'icon', 'created_at']
+
+
+def _key(user_id):
+    return f'{CACHE_PREFIX}:{user_id}'
+
+
+def _entry(activity):
+    return {name: getattr(activity, name) for name in FIELDS}
+
+
+def history(user_id, cursor=None, limit=FEED_SIZE):
+    """KeysetPage of activities newest first from the table, continuing from a cursor"""
+    return paginate(Activity.objects.filter(user_id=user_id).values(*FIELDS),
+                    ordering=CREATED, cursor=cursor, page_size=limit)
+
+
+def recent(user_id, limit=FEED_SIZE):
+    """The user's latest activities, newest first, from the ring buffer"""
+    entries = cache.get(_key(user_id))
+    if entries is None:
+        entries = history(user_id).results
+        cache.set(_key(user_id), entries, CACHE_TIMEOUT)
+    return entries[:limit]
+
+
+def page(user_id, cursor=None):
+    """KeysetPage of the feed: the first from the buffer, later ones from the table.
+
+    Raises api.pagination.InvalidCursor for a bad cursor.
+    """
+    if cursor:
+        return history(user_id, cursor=cursor)
+    entries = recent(user_id)
+    # A full buffer may have older activities behind it
+    return KeysetPage(results=entries, next_cursor=cursor_after(entries[-1]) if len(entries) == FEED_SIZE else None)
+
+
+def push(activity):
+    """Add a saved activity to the front of its user's buffer, if it is cached"""
+    key = _key(activity.user_id)
+    entries = cache.get(key)
+    if entries is None:
+        # Refilled from the table on next read
+        return
+    entries = [_entry(activity)] + [entry for entry in entries if entry['id'] != activity.id]
+    entries.sort(key=lambda entry: (entry['created_at'], entry['id']), reverse=True)
+    cache.set(key, entries[:FEED_SIZE], CACHE_TIMEOUT)
+
+
+def invalidate(*user_ids):
+    cache.delete_many([_key(user_id) for user_id in user_ids])
+
+
+def record(user, activity_type, description, icon='info-circle'):
+    """Create an Activity; the signals add it to the feed on commit"""
+    return Activity.objects.create(user=user, activity_type=activity_type, description=description, icon=icon)
+
+
+def added(activity):
+    transaction.on_commit(lambda: push(activity))
+
+
+def removed(activity):
+    transaction.on_commit(lambda: invalidate(activity.user_id))
+
+
+def time_ago(created_at, now=None):
+    """'5 minutes ago' style age of created_at; pass now to share one clock per response"""
+    diff = (now or timezone.now()) - created_at
+
+    if diff.days > 0:
+        return f"{diff.days} days ago"
+    elif diff.seconds > 3600:
+        hours = diff.seconds // 3600
+        return f"{hours} hours ago"
+    elif diff.seconds > 60:
+        minutes = diff.seconds // 60
+        return f"{minutes} minutes ago"
+    else:
+        return "Just now"
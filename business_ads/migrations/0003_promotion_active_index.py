@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-18 11:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business_ads', '0002_remove_business_owner_activity_businesslocation_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='promotion',
+            index=models.Index(fields=['user', 'status', 'end_date'], name='bizpromo_active_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-18 11:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business_ads', '0003_promotion_active_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user', '-created_at'], name='bizactivity_feed_idx'),
+        ),
+    ]
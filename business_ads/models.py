@@ -1,4 +1,8 @@
-﻿from django.db import models
+﻿from decimal import Decimal
+
+from django.db import models
+from django.db.models import Case, ExpressionWrapper, F, Q, Value, When
+from django.db.models.functions import Cast, Round
 from django.contrib.auth.models import User
 from django.utils import timezone
 
@@ -25,6 +29,37 @@ class Customer(models.Model):
     def __str__(self):
         return f"{self.name} ({self.email})"
 
+class PromotionQuerySet(models.QuerySet):
+    """SQL versions of Promotion.roi and Promotion.is_active, for sorting and filtering"""
+    
+    def with_roi(self):
+        """Annotate roi_value, the ROI percentage rounded to cents"""
+        # SQLite keeps whole-number decimals as integers, so divide as floats
+        roi = ExpressionWrapper(
+            Cast(F('revenue_generated') - F('budget'), models.FloatField()) * Value(100.0) / F('budget'),
+            output_field=models.FloatField(),
+        )
+        return self.annotate(roi_value=Case(
+            When(budget__gt=0, then=Round(roi, 2)),
+            default=Value(Decimal(0)),
+            output_field=models.DecimalField(max_digits=16, decimal_places=2),
+        ))
+    
+    def _running(self, today):
+        return Q(status='active', start_date__lte=today, end_date__gte=today)
+    
+    def with_active(self, today=None):
+        """Annotate active_now, evaluated once for the whole query"""
+        today = today or timezone.now().date()
+        return self.annotate(active_now=Case(
+            When(self._running(today), then=Value(True)),
+            default=Value(False),
+            output_field=models.BooleanField(),
+        ))
+    
+    def active(self, today=None):
+        return self.filter(self._running(today or timezone.now().date()))
+
 class Promotion(models.Model):
     """Marketing promotions/campaigns"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='promotions')
@@ -60,8 +95,14 @@ class Promotion(models.Model):
     conversions = models.IntegerField(default=0)  # Number of conversions
     revenue_generated = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     
+    objects = PromotionQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-start_date']
+        indexes = [
+            # Active-only listings, ending soonest first
+            models.Index(fields=['user', 'status', 'end_date'], name='bizpromo_active_idx'),
+        ]
     
     def __str__(self):
         return self.title
@@ -102,6 +143,12 @@ class Activity(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # A user's feed, newest first (see business_ads.feed)
+            models.Index(fields=['user', '-created_at'], name='bizactivity_feed_idx'),
+            # Archival of old activities (see api.retention)
+            models.Index(fields=['created_at'], name='bizactivity_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.activity_type} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
@@ -1,5 +1,9 @@
-﻿from rest_framework import serializers
+﻿from decimal import ROUND_HALF_UP
+
+from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.utils import timezone
+from .feed import time_ago
 from .models import Customer, Promotion, Revenue, Activity, BusinessLocation
 
 class CustomerSerializer(serializers.ModelSerializer):
@@ -7,9 +11,32 @@ class CustomerSerializer(serializers.ModelSerializer):
         model = Customer
         fields = ['id', 'name', 'email', 'phone', 'location', 'status', 'created_at']
 
+class AnnotatedMixin:
+    """Read a queryset annotation when present, else the model property"""
+    
+    def __init__(self, annotation, **kwargs):
+        self.annotation = annotation
+        super().__init__(**kwargs)
+    
+    def get_attribute(self, instance):
+        if hasattr(instance, self.annotation):
+            return getattr(instance, self.annotation)
+        return super().get_attribute(instance)
+
+class AnnotatedField(AnnotatedMixin, serializers.ReadOnlyField):
+    pass
+
+class AnnotatedDecimalField(AnnotatedMixin, serializers.DecimalField):
+    """Annotation or property, quantized alike whichever one is read"""
+    
+    def __init__(self, annotation, **kwargs):
+        kwargs.setdefault('rounding', ROUND_HALF_UP)
+        super().__init__(annotation, read_only=True, **kwargs)
+
 class PromotionSerializer(serializers.ModelSerializer):
-    roi = serializers.ReadOnlyField()
-    is_active = serializers.ReadOnlyField()
+    # Promotion.objects.with_roi() / with_active() compute these in SQL
+    roi = AnnotatedDecimalField('roi_value', max_digits=16, decimal_places=2)
+    is_active = AnnotatedField('active_now')
     
     class Meta:
         model = Promotion
@@ -23,6 +50,11 @@ class RevenueSerializer(serializers.ModelSerializer):
         fields = ['id', 'month', 'amount', 'source']
 
 class ActivitySerializer(serializers.ModelSerializer):
+    """Serializes Activity rows or business_ads.feed entries.
+    
+    Relative times are measured from context['now'], taken once per
+    serialization when the caller does not pass one.
+    """
     time_ago = serializers.SerializerMethodField()
     
     class Meta:
@@ -30,22 +62,10 @@ class ActivitySerializer(serializers.ModelSerializer):
         fields = ['id', 'activity_type', 'description', 'icon', 'time_ago', 'created_at']
     
     def get_time_ago(self, obj):
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        now = timezone.now()
-        diff = now - obj.created_at
-        
-        if diff.days > 0:
-            return f"{diff.days} days ago"
-        elif diff.seconds > 3600:
-            hours = diff.seconds // 3600
-            return f"{hours} hours ago"
-        elif diff.seconds > 60:
-            minutes = diff.seconds // 60
-            return f"{minutes} minutes ago"
-        else:
-            return "Just now"
+        if 'now' not in self.context:
+            self.context['now'] = timezone.now()
+        created_at = obj['created_at'] if isinstance(obj, dict) else obj.created_at
+        return time_ago(created_at, self.context['now'])
 
 class BusinessLocationSerializer(serializers.ModelSerializer):
     class Meta:
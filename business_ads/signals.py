@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import feed
+from .models import Activity
+
+
+@receiver(post_save, sender=Activity)
+def activity_saved(sender, instance, **kwargs):
+    feed.added(instance)
+
+
+@receiver(post_delete, sender=Activity)
+def activity_deleted(sender, instance, **kwargs):
+    feed.removed(instance)
@@ -1,3 +1,163 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+
+from . import feed
+from .models import Activity, Promotion
+from .serializers import ActivitySerializer, PromotionSerializer
+
+
+class PromotionAnnotationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('marketer', password='pw')
+        self.other = User.objects.create_user('other', password='pw')
+        self.today = timezone.now().date()
+
+    def promotion(self, title, budget, revenue, status='active', starts=-1, ends=1, user=None):
+        return Promotion.objects.create(
+            user=user or self.user, title=title, description='',
+            start_date=self.today + timedelta(days=starts), end_date=self.today + timedelta(days=ends),
+            budget=Decimal(budget), revenue_generated=Decimal(revenue), status=status,
+        )
+
+    def test_annotations_match_properties(self):
+        promotions = [
+            self.promotion('Doubled', '100', '200'),
+            self.promotion('Lossy', '300', '100', status='paused'),
+            self.promotion('Free', '0', '50', starts=2, ends=5),
+            self.promotion('Ended', '80', '100', starts=-5, ends=-1),
+        ]
+        annotated = {p.id: p for p in Promotion.objects.with_roi().with_active()}
+        for promotion in promotions:
+            row = annotated[promotion.id]
+            self.assertEqual(row.roi_value, round(Decimal(promotion.roi), 2))
+            self.assertEqual(row.active_now, promotion.is_active)
+
+    def test_serializer_prefers_annotations(self):
+        promotion = self.promotion('Doubled', '100', '200')
+        annotated = Promotion.objects.with_roi().with_active().get()
+        data = PromotionSerializer(annotated).data
+        self.assertEqual(data['roi'], '100.00')
+        self.assertIs(data['is_active'], True)
+        # Plain instances still fall back to the properties
+        self.assertEqual(PromotionSerializer(promotion).data['roi'], '100.00')
+
+    def test_roi_serializes_alike_from_sql_and_property(self):
+        promotions = [
+            self.promotion('Third', '300', '400'),
+            self.promotion('Loss', '300', '100'),
+            self.promotion('Free', '0', '50'),
+            self.promotion('Tiny', '7', '8'),
+        ]
+        annotated = {p.id: p for p in Promotion.objects.with_roi()}
+        for promotion in promotions:
+            plain = PromotionSerializer(promotion).data['roi']
+            self.assertEqual(PromotionSerializer(annotated[promotion.id]).data['roi'], plain)
+        self.assertEqual([PromotionSerializer(p).data['roi'] for p in promotions],
+                         ['33.33', '-66.67', '0.00', '14.29'])
+
+    def test_roi_endpoint_orders_and_pages(self):
+        for i in range(5):
+            self.promotion(f'P{i}', '100', str(100 + i * 10), status='active' if i % 2 else 'draft')
+        self.promotion('Not mine', '100', '900', user=self.other)
+        self.client.force_login(self.user)
+
+        first = self.client.get('/api/business/promotions/roi/', {'page_size': 3, 'count': 1}).json()
+        self.assertEqual([p['title'] for p in first['results']], ['P4', 'P3', 'P2'])
+        self.assertEqual(first['count'], 5)
+        second = self.client.get('/api/business/promotions/roi/', {'page_size': 3, 'cursor': first['next']}).json()
+        self.assertEqual([p['title'] for p in second['results']], ['P1', 'P0'])
+        self.assertIsNone(second['next'])
+
+        active = self.client.get('/api/business/promotions/roi/', {'active': 1}).json()
+        self.assertEqual([p['title'] for p in active['results']], ['P3', 'P1'])
+
+    def test_active_endpoint(self):
+        self.promotion('Later', '10', '10', ends=7)
+        self.promotion('Sooner', '10', '10', ends=2)
+        self.promotion('Paused', '10', '10', status='paused')
+        self.promotion('Upcoming', '10', '10', starts=1, ends=3)
+        self.client.force_login(self.user)
+        response = self.client.get('/api/business/promotions/active/')
+        self.assertEqual([p['title'] for p in response.json()['results']], ['Sooner', 'Later'])
+        self.assertTrue(all(p['is_active'] for p in response.json()['results']))
+
+    def test_requires_login_and_valid_cursor(self):
+        for url in ('/api/business/promotions/roi/', '/api/business/promotions/active/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 302)
+            self.assertTrue(response['Location'].startswith('/accounts/login/'))
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/api/business/promotions/active/', {'cursor': 'bogus'}).status_code, 400)
+
+
+class ActivityFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('marketer', password='pw')
+
+    def record(self, n, start=0):
+        with self.captureOnCommitCallbacks(execute=True):
+            return [feed.record(self.user, 'new_customer', f'Customer {i}') for i in range(start, start + n)]
+
+    def test_buffer_keeps_latest_entries(self):
+        self.record(3)
+        self.assertEqual([e['description'] for e in feed.recent(self.user.id)], ['Customer 2', 'Customer 1', 'Customer 0'])
+        # Warm buffer: new activities are pushed without reading the table
+        self.record(feed.FEED_SIZE, start=3)
+        with self.assertNumQueries(0):
+            entries = feed.recent(self.user.id)
+        self.assertEqual(len(entries), feed.FEED_SIZE)
+        self.assertEqual(entries[0]['description'], f'Customer {feed.FEED_SIZE + 2}')
+        self.assertEqual([e['id'] for e in entries], [e['id'] for e in feed.history(self.user.id).results])
+
+    def test_delete_refills_from_table(self):
+        first, second = self.record(2)
+        feed.recent(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual([e['id'] for e in feed.recent(self.user.id)], [first.id])
+
+    def test_time_ago_uses_one_clock(self):
+        activities = self.record(2)
+        now = timezone.now() + timedelta(hours=2, minutes=5)
+        data = ActivitySerializer(activities, many=True, context={'now': now}).data
+        self.assertEqual({row['time_ago'] for row in data}, {'2 hours ago'})
+        self.assertEqual(feed.time_ago(now - timedelta(days=3), now), '3 days ago')
+
+    def test_dashboard_and_feed_endpoints(self):
+        self.record(feed.FEED_SIZE + 2)
+        self.assertEqual(self.client.get('/api/business/activities/').status_code, 401)
+        # The dashboard data stays public; only a signed-in user has activities in it
+        response = self.client.get('/api/business/dashboard/data/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['recent_activities'], [])
+        for url in ('/api/business/customers/', '/api/business/promotions/'):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.client.force_login(self.user)
+        widget = self.client.get('/api/business/dashboard/data/').json()['recent_activities']
+        self.assertEqual(len(widget), 5)
+        self.assertEqual(widget[0]['description'], f'Customer {feed.FEED_SIZE + 1}')
+        self.assertEqual(widget[0]['time'], 'Just now')
+
+        page = self.client.get('/api/business/activities/').json()
+        self.assertEqual(len(page['activities']), feed.FEED_SIZE)
+        older = self.client.get('/api/business/activities/', {'cursor': page['next']}).json()
+        self.assertEqual([a['description'] for a in older['activities']], ['Customer 1', 'Customer 0'])
+        self.assertIsNone(older['next'])
+        self.assertEqual(self.client.get('/api/business/activities/', {'cursor': 'soon'}).status_code, 400)
 
-# Create your tests here.
+    def test_paging_keeps_activities_sharing_a_timestamp(self):
+        self.record(feed.FEED_SIZE + 3)
+        Activity.objects.update(created_at=timezone.now())
+        feed.invalidate(self.user.id)
+        first = feed.page(self.user.id)
+        second = feed.page(self.user.id, cursor=first.next_cursor)
+        seen = [e['id'] for e in first.results + second.results]
+        self.assertEqual(len(set(seen)), feed.FEED_SIZE + 3)
+        self.assertEqual(seen, sorted(seen, reverse=True))
@@ -5,7 +5,10 @@ urlpatterns = [
     # Simple API endpoints
     path('dashboard/data/', views.dashboard_data, name='dashboard_data'),
     path('customers/', views.get_customers, name='customers'),
+    path('activities/', views.get_activities, name='activities'),
     path('promotions/', views.get_promotions, name='promotions'),
+    path('promotions/roi/', views.promotions_by_roi, name='promotions_by_roi'),
+    path('promotions/active/', views.active_promotions, name='active_promotions'),
     
     # Note: We're NOT using the template views here since they're in main urls.py
 ]
@@ -4,9 +4,33 @@ from django.contrib.auth.decorators import login_required
 import json
 from datetime import datetime
 
+from api.pagination import DEFAULT_PAGE_SIZE, ENDING, MAX_PAGE_SIZE, InvalidCursor, paginate
+
+from . import feed
+from .models import Promotion
+from .serializers import ActivitySerializer, PromotionSerializer
+
+ACTIVITY_WIDGET_SIZE = 5
+
+def _recent_activities(request):
+    """The dashboard widget's items, from the user's feed buffer"""
+    if not request.user.is_authenticated:
+        return []
+    activities = ActivitySerializer(feed.recent(request.user.id, limit=ACTIVITY_WIDGET_SIZE), many=True).data
+    return [
+        {
+            'type': activity['activity_type'],
+            'title': activity['activity_type'].replace('_', ' ').capitalize(),
+            'description': activity['description'],
+            'time': activity['time_ago'],
+            'icon': activity['icon'],
+        }
+        for activity in activities
+    ]
+
 # Simple dashboard data (for now)
 def dashboard_data(request):
-    """Return sample dashboard data"""
+    """Return dashboard data: sample stats and the user's recent activity"""
     data = {
         'stats': {
             'total_customers': 1254,
@@ -14,29 +38,7 @@ def dashboard_data(request):
             'active_promotions': 24,
             'map_views': 3456,
         },
-        'recent_activities': [
-            {
-                'type': 'new_customer',
-                'title': 'New customer registered',
-                'description': 'John Doe - johndoe@example.com',
-                'time': '10 minutes ago',
-                'icon': 'user-plus'
-            },
-            {
-                'type': 'promotion',
-                'title': 'Promotion campaign launched',
-                'description': 'Madeleine Tyson - "Summer Sale 2026"',
-                'time': '25 minutes ago',
-                'icon': 'bullhorn'
-            },
-            {
-                'type': 'location',
-                'title': 'New location added to map',
-                'description': 'Lusaka Central - Copperbelt Region',
-                'time': '1 hour ago',
-                'icon': 'map-marker-alt'
-            }
-        ],
+        'recent_activities': _recent_activities(request),
         'timestamp': datetime.now().isoformat(),
         'status': 'success'
     }
@@ -49,6 +51,60 @@ def get_customers(request):
 def get_promotions(request):
     return JsonResponse({'promotions': [], 'message': 'API coming soon'})
 
+def _promotion_page(request, promotions, ordering):
+    """JSON page of the user's promotions, keyset-paginated by ordering"""
+    try:
+        page_size = min(max(int(request.GET.get('page_size', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        page_size = DEFAULT_PAGE_SIZE
+    try:
+        page = paginate(
+            promotions.filter(user=request.user),
+            ordering=ordering,
+            cursor=request.GET.get('cursor'),
+            page_size=page_size,
+            with_count=request.GET.get('count') in ('1', 'true'),
+        )
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    data = {
+        'results': PromotionSerializer(page.results, many=True).data,
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+    if page.count is not None:
+        data['count'] = page.count['count']
+        data['count_exact'] = page.count['exact']
+    return JsonResponse(data)
+
+@login_required
+def promotions_by_roi(request):
+    """The user's promotions, best ROI first; ?active=1 for running ones only"""
+    promotions = Promotion.objects.with_roi().with_active()
+    if request.GET.get('active') in ('1', 'true'):
+        promotions = promotions.active()
+    return _promotion_page(request, promotions, ('-roi_value', '-id'))
+
+@login_required
+def active_promotions(request):
+    """The user's running promotions, ending soonest first"""
+    promotions = Promotion.objects.active().with_roi().with_active()
+    return _promotion_page(request, promotions, ENDING)
+
+def get_activities(request):
+    """The user's activity feed, newest first; ?cursor= from 'next' pages back"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    try:
+        page = feed.page(request.user.id, cursor=request.GET.get('cursor'))
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'activities': ActivitySerializer(page.results, many=True).data,
+        'next': page.next_cursor,
+    })
+
 # Template views
 def map_view(request):
     return render(request, 'map.html')
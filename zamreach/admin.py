@@ -0,0 +1,31 @@
+"""
+Admin writes through the shared write path (zamreach.db.run_serialized).
+
+ModelAdmin views save inside their own transaction, so wrapping save_model()
+would only join it. The mixin wraps the views instead: a POST runs whole in
+one serialized, retried transaction, and a retry re-runs the view, which
+rebuilds the form and its instance from the request.
+"""
+from zamreach.db import run_serialized
+
+
+class SerializedAdminMixin:
+    """Run POSTs to the add, change, delete and changelist views through run_serialized"""
+
+    def _serialized(self, view, request, *args, **kwargs):
+        if request.method == 'POST':
+            return run_serialized(view, request, *args, **kwargs)
+        return view(request, *args, **kwargs)
+
+    def add_view(self, request, *args, **kwargs):
+        return self._serialized(super().add_view, request, *args, **kwargs)
+
+    def change_view(self, request, *args, **kwargs):
+        return self._serialized(super().change_view, request, *args, **kwargs)
+
+    def delete_view(self, request, *args, **kwargs):
+        return self._serialized(super().delete_view, request, *args, **kwargs)
+
+    def changelist_view(self, request, *args, **kwargs):
+        # Bulk actions and list_editable saves
+        return self._serialized(super().changelist_view, request, *args, **kwargs)
@@ -0,0 +1,109 @@
+"""
+Database helpers shared by the apps.
+
+serialized_write() is the write path for bookings and api. Each call runs in
+its own transaction; on SQLite calls are also queued behind a per-process lock,
+so a worker's threads take turns instead of all fighting for the file lock,
+and every call retries with jittered backoff when the database is locked
+(or, on Postgres, when a transaction deadlocks or fails to serialize).
+
+save_form() saves a ModelForm the same way, putting its instance back in
+its unsaved state before each attempt. SerializedAdminMixin (zamreach.admin)
+runs admin writes through the same path.
+
+Settings:
+    DB_WRITE_ATTEMPTS  tries before the error is raised (default 5)
+    DB_WRITE_BACKOFF   base delay in seconds, doubled per retry (default 0.05)
+"""
+import logging
+import random
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF = 2.0
+
+# SQLSTATEs worth retrying: serialization_failure, deadlock_detected
+RETRY_PGCODES = {'40001', '40P01'}
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _write_lock(alias):
+    with _locks_guard:
+        if alias not in _locks:
+            _locks[alias] = threading.RLock()
+        return _locks[alias]
+
+
+def is_retryable(exc):
+    """True for lock contention errors that a fresh transaction may get past"""
+    if not isinstance(exc, OperationalError):
+        return False
+    cause = exc.__cause__
+    if getattr(cause, 'pgcode', None) in RETRY_PGCODES or getattr(cause, 'sqlstate', None) in RETRY_PGCODES:
+        return True
+    message = str(exc).lower()
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def run_serialized(func, *args, using=None, attempts=None, **kwargs):
+    """Call func(*args, **kwargs) in a transaction through the write path.
+
+    Inside an enclosing transaction the call simply joins it: the outer
+    block owns the retry, and holding the lock there could deadlock.
+    """
+    alias = using or DEFAULT_DB_ALIAS
+    connection = connections[alias]
+    if connection.in_atomic_block:
+        with transaction.atomic(using=alias):
+            return func(*args, **kwargs)
+
+    attempts = attempts or getattr(settings, 'DB_WRITE_ATTEMPTS', 5)
+    backoff = getattr(settings, 'DB_WRITE_BACKOFF', 0.05)
+    lock = _write_lock(alias) if connection.vendor == 'sqlite' else None
+    for attempt in range(1, attempts + 1):
+        try:
+            if lock is None:
+                with transaction.atomic(using=alias):
+                    return func(*args, **kwargs)
+            with lock, transaction.atomic(using=alias):
+                return func(*args, **kwargs)
+        except OperationalError as exc:
+            if attempt == attempts or not is_retryable(exc):
+                raise
+            delay = min(MAX_BACKOFF, backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+            logger.info('Write to %s hit %s; retry %d in %.3fs', alias, exc, attempt, delay)
+            time.sleep(delay)
+
+
+def serialized_write(func=None, *, using=None, attempts=None):
+    """Decorator form of run_serialized(); usable bare or with arguments"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return run_serialized(func, *args, using=using, attempts=attempts, **kwargs)
+        return wrapper
+    return decorator(func) if func is not None else decorator
+
+
+def save_form(form, **kwargs):
+    """form.save() through run_serialized().
+
+    A failed attempt leaves the instance with the pk it was given before the
+    rollback, so each attempt starts from the instance's original state.
+    """
+    instance = form.instance
+    pk, adding = instance.pk, instance._state.adding
+
+    def save():
+        instance.pk = pk
+        instance._state.adding = adding
+        return form.save()
+    return run_serialized(save, **kwargs)
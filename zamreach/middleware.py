@@ -1,25 +1,270 @@
-﻿import os
+﻿import gzip
+import hashlib
+import logging
+import os
+import time
+import weakref
+from functools import partial, wraps
+
 from django.conf import settings
-from django.http import HttpResponse
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags
+
+try:
+    import brotli
+except ImportError:  # Optional: pip install brotli
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+def compressed_cache(view):
+    """Let CompressedETagMiddleware cache the compressed bodies of a view.
+
+    For views whose pages are shared between visitors; other responses are
+    compressed per request and never stored.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        response.compressed_cache = True
+        return response
+    return wrapper
+
 
 class StaticDirectoryRedirectMiddleware:
+    """Serve index.html for static directory URLs from memory.
+
+    Each configured URL path maps to a directory under STATICFILES_DIRS. The
+    index files are read once at startup and reloaded when their mtime
+    changes, so a request costs a dict lookup (plus a stat at most every
+    STATIC_DIRECTORY_INDEX_RECHECK seconds).
+
+    Settings:
+        STATIC_DIRECTORY_INDEXES        {url_path: directory} to serve
+        STATIC_DIRECTORY_INDEX_RECHECK  seconds between mtime checks (default 2)
+        STATIC_DIRECTORY_INDEX_MAX_AGE  Cache-Control max-age (default 300)
+    """
+    DEFAULT_INDEXES = {'/static/zamstay-redesign/': 'zamstay-redesign'}
+    INDEX_FILE = 'index.html'
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.recheck = getattr(settings, 'STATIC_DIRECTORY_INDEX_RECHECK', 2)
+        self.max_age = getattr(settings, 'STATIC_DIRECTORY_INDEX_MAX_AGE', 300)
+        indexes = getattr(settings, 'STATIC_DIRECTORY_INDEXES', self.DEFAULT_INDEXES)
+        self.pages = {
+            url_path: _IndexPage([
+                os.path.join(static_dir, directory, self.INDEX_FILE)
+                for static_dir in settings.STATICFILES_DIRS
+            ])
+            for url_path, directory in indexes.items()
+        }
+        for page in self.pages.values():
+            page.refresh()
 
     def __call__(self, request):
-        # Check if request is for our specific static directory
-        if request.path == '/static/zamstay-redesign/':
-            print(f'🔧 [Middleware] Handling: {request.path}')
-            
-            # Try to serve index.html directly
-            for static_dir in settings.STATICFILES_DIRS:
-                index_path = os.path.join(static_dir, 'zamstay-redesign', 'index.html')
-                print(f'   Checking: {index_path}')
-                if os.path.exists(index_path):
-                    print(f'   ✅ Found index.html, serving it directly')
-                    with open(index_path, 'r', encoding='utf-8') as f:
-                        return HttpResponse(f.read(), content_type='text/html')
-            
-            print(f'   ❌ index.html not found')
-        
-        return self.get_response(request)
+        page = self.pages.get(request.path)
+        if page is None or request.method not in ('GET', 'HEAD'):
+            return self.get_response(request)
+
+        now = time.monotonic()
+        if now - page.checked >= self.recheck:
+            page.refresh(now)
+        # Read once: the body and its validators always belong together
+        loaded = page.loaded
+        if loaded is None:
+            return self.get_response(request)
+        _, mtime, content, etag = loaded
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type='text/html; charset=utf-8')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(mtime)
+        response['Cache-Control'] = f'public, max-age={self.max_age}'
+        return response
+
+
+class _IndexPage:
+    """In-memory copy of the first existing file among candidates.
+
+    loaded is (path, mtime, content, etag), or None when no candidate exists.
+    It is replaced with a single assignment, never updated in place, so a
+    concurrent request sees the old file or the new one, never a mix.
+    """
+
+    def __init__(self, candidates):
+        self.candidates = candidates
+        self.loaded = None
+        self.checked = float('-inf')
+
+    def refresh(self, now=None):
+        self.checked = time.monotonic() if now is None else now
+        loaded = self.loaded
+        for path in self.candidates:
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            if loaded is None or (path, mtime) != loaded[:2]:
+                with open(path, 'rb') as f:
+                    content = f.read()
+                self.loaded = (path, mtime, content, f'"{hashlib.sha256(content).hexdigest()[:32]}"')
+                logger.info('Loaded static directory index %s', path)
+            return
+        if loaded is not None:
+            logger.warning('Static directory index disappeared: %s', loaded[0])
+        self.loaded = None
+
+
+class CompressedETagMiddleware:
+    """Strong ETags, 304s and cached gzip/brotli bodies for rendered pages.
+
+    The ETag is a hash of the rendered body, so a client that already has the
+    page gets a 304 without the bytes. Views decorated with compressed_cache
+    have their compressed variants cached by that hash, so identical renders
+    are compressed once across all workers. Responses marked private or
+    no-store are never cached, nor are Vary: Cookie ones for signed-in users.
+
+    Settings:
+        COMPRESSED_RESPONSE_MIN_SIZE       smallest body worth compressing (default 512)
+        COMPRESSED_RESPONSE_CACHE_TIMEOUT  lifetime of cached variants (default 1 day)
+    """
+    COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+    CACHE_PREFIX = 'compressed'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSED_RESPONSE_MIN_SIZE', 512)
+        self.timeout = getattr(settings, 'COMPRESSED_RESPONSE_CACHE_TIMEOUT', 60 * 60 * 24)
+        self.encodings = (['br'] if brotli else []) + ['gzip']
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not self._applies(request, response):
+            return response
+
+        digest = hashlib.sha256(response.content).hexdigest()[:32]
+        # Pages that embed a CSRF token must not be compressed (BREACH)
+        encoding = None if request.META.get('CSRF_COOKIE_USED') else self._pick_encoding(request, response)
+        etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or if_none_match == ['*']:
+            return self._not_modified(response, etag)
+
+        response['ETag'] = etag
+        if encoding:
+            if self._cacheable(request, response):
+                response.content = self._compressed(response.content, digest, encoding)
+            else:
+                response.content = self._compress(response.content, encoding)
+            response['Content-Encoding'] = encoding
+        response['Content-Length'] = str(len(response.content))
+        return response
+
+    def _applies(self, request, response):
+        return (
+            request.method in ('GET', 'HEAD')
+            and response.status_code == 200
+            and not response.streaming
+            and not response.has_header('Content-Encoding')
+            and response.get('Content-Type', '').startswith(self.COMPRESSIBLE_TYPES)
+        )
+
+    def _cacheable(self, request, response):
+        if not getattr(response, 'compressed_cache', False):
+            return False
+        cache_control = response.get('Cache-Control', '').lower()
+        if 'private' in cache_control or 'no-store' in cache_control:
+            return False
+        vary = {header.strip().lower() for header in response.get('Vary', '').split(',')}
+        user = getattr(request, 'user', None)
+        return 'cookie' not in vary or not (user and user.is_authenticated)
+
+    def _pick_encoding(self, request, response):
+        if len(response.content) < self.min_size:
+            return None
+        accepted = {}
+        for part in request.headers.get('Accept-Encoding', '').split(','):
+            name, _, params = part.strip().partition(';')
+            quality = 1.0
+            if params.strip().startswith('q='):
+                try:
+                    quality = float(params.strip()[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[name.strip().lower()] = quality
+        for encoding in self.encodings:
+            if accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return encoding
+        return None
+
+    def _compressed(self, content, digest, encoding):
+        key = f'{self.CACHE_PREFIX}:{encoding}:{digest}'
+        body = cache.get(key)
+        if body is None:
+            body = self._compress(content, encoding)
+            cache.set(key, body, self.timeout)
+        return body
+
+    def _compress(self, content, encoding):
+        if encoding == 'br':
+            return brotli.compress(content)
+        return gzip.compress(content, compresslevel=6, mtime=0)
+
+    def _not_modified(self, response, etag):
+        not_modified = HttpResponseNotModified()
+        not_modified['ETag'] = etag
+        for header in ('Cache-Control', 'Content-Location', 'Date', 'Expires', 'Last-Modified', 'Vary'):
+            if response.has_header(header):
+                not_modified[header] = response[header]
+        not_modified.cookies = response.cookies
+        return not_modified
+
+
+class StatementTimeoutMiddleware:
+    """Apply a per-request-class statement timeout on Postgres.
+
+    DB_STATEMENT_TIMEOUTS lists (path_prefix, milliseconds); other requests
+    get DB_STATEMENT_TIMEOUT. The SET is issued from an execute wrapper just
+    before the request's first query, so requests that never query (static
+    files, health checks) never connect, and only when the connection's
+    current value differs, so persistent connections usually skip it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rules = list(getattr(settings, 'DB_STATEMENT_TIMEOUTS', []))
+        self.default = getattr(settings, 'DB_STATEMENT_TIMEOUT', None)
+        self.applied = weakref.WeakKeyDictionary()
+
+    def __call__(self, request):
+        timeout = self.timeout_for(request.path) if self.rules else None
+        if timeout is None or connection.vendor != 'postgresql':
+            return self.get_response(request)
+        with connection.execute_wrapper(partial(self.apply, timeout)):
+            return self.get_response(request)
+
+    def timeout_for(self, path):
+        for prefix, timeout in self.rules:
+            if path.startswith(prefix):
+                return timeout
+        return self.default
+
+    def apply(self, timeout, execute, sql, params, many, context):
+        raw = context['connection'].connection
+        # Keyed by the driver connection, so pooled and reconnected
+        # connections are tracked separately
+        if self.applied.get(raw) != timeout:
+            # A driver cursor, so this query does not pass through the wrapper
+            with raw.cursor() as cursor:
+                cursor.execute('SELECT set_config(%s, %s, false)', ['statement_timeout', str(int(timeout))])
+            self.applied[raw] = timeout
+        return execute(sql, params, many, context)
@@ -10,5 +10,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('ip', health_check, name='health-check'),  # For Railway health checks
     path('health', health_check, name='health'),    # Alternative endpoint
+    path('api/business/', include('business_ads.urls')),
+    path('api/', include('api.urls')),
     path('', include('bookings.urls')),
 ]